@@ -4,13 +4,32 @@ Flask application with SQLite database
 """
 
 import os
+import sys
 import json
+import signal
+import base64
+import sqlite3
+import mimetypes
+import binascii
+import tempfile
+import time
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for
+import click
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, redirect, url_for
 from werkzeug.utils import secure_filename
-from database import Database
+from database import DATABASE_PATH, Database
+from write_buffer import WriteBuffer
+from photos import PhotoProcessor, is_content_addressed
+from archive import EXPORT_FORMATS, export_stream, import_format
+from jobs import ImportJobs
+from backups import BackupManager
+from json_provider import RecipeJSONProvider
+from assets import COMPRESS_MIN_SIZE, ENCODING_SUFFIXES, StaticAssets, compress, negotiate
+from metrics import METRICS_DIR, Metrics, default_metrics_dir
+from events import EVENTS_PATH, EventHub, parse_since
 
 app = Flask(__name__)
+app.json = RecipeJSONProvider(app)
 app.config['SECRET_KEY'] = os.urandom(24)
 
 # Upload folder: use UPLOAD_FOLDER env variable if set, otherwise use local directory
@@ -18,26 +37,176 @@ app.config['SECRET_KEY'] = os.urandom(24)
 # Development (local): uses ./uploads in the project folder
 DEFAULT_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', DEFAULT_UPLOAD_FOLDER)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Largest request accepted (backup imports); photos have their own, smaller limit
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_IMPORT_SIZE', 512 * 1024 * 1024))
+MAX_PHOTO_SIZE = 16 * 1024 * 1024  # 16MB max photo size
+
+# Compressed on the fly when larger than COMPRESS_MIN_SIZE
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html'}
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-db = Database()
+# First page of the sidebar, shipped with the bootstrap payload
+# (keep in sync with RECIPE_PAGE_SIZE / RECIPE_LIST_FIELDS in app.js)
+RECIPE_PAGE_SIZE = 50
+RECIPE_LIST_FIELDS = ['id', 'name', 'category_id', 'category_name', 'photo_url']
+
+metrics = Metrics(METRICS_DIR or default_metrics_dir(DATABASE_PATH))
+app.json.on_encode = lambda seconds: metrics.add_time('json', seconds)
+db = Database(metrics=metrics)
+write_buffer = WriteBuffer(db)
+photos = PhotoProcessor(app.config['UPLOAD_FOLDER'])
+import_jobs = ImportJobs(db, photos)
+backups = BackupManager(db)
+assets = StaticAssets(app.static_folder)
+events = EventHub(db)
+db.on_change = events.notify
+# Lets the gunicorn worker hand /api/events connections straight to the hub
+app.extensions['event_hub'] = events
 
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def conditional(build):
+    """Serve a read endpoint with validators derived from the data version.
+    
+    Every write bumps the data version, so it doubles as a strong ETag for
+    all read responses. If the client's copy is still current we answer
+    304 without running build() at all; otherwise build() produces the
+    response. Clients are told to revalidate on every use (no-cache).
+    """
+    version, modified = db.get_data_version()
+    etag = f'v{version}'
+    # Compressed representations carry the encoding as an ETag suffix
+    # (added by compress_response)
+    etags = [etag] + [f'{etag}-{encoding}' for encoding in ENCODING_SUFFIXES]
+    if request.if_none_match:
+        matched = [tag for tag in etags if request.if_none_match.contains(tag)]
+        not_modified = bool(matched)
+        if matched:
+            etag = matched[0]
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= modified
+    
+    if not_modified:
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True
+    return response
+
+
+@app.before_request
+def start_request_timing():
+    metrics.start_request()
+
+
+# Registered before compress_response, so it runs after it (Flask runs
+# after_request functions in reverse order) and the timing includes it
+@app.after_request
+def finish_request_timing(response):
+    """Record the request in the metrics and report its timing to the browser"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    server_timing = metrics.finish_request(request.method, route, response.status_code)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON and HTML bodies with the best encoding the client accepts.
+    
+    Small bodies, streamed responses and files are left alone; an ETag
+    gets the encoding as a suffix, since the bytes differ.
+    """
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or response.content_encoding or response.direct_passthrough or response.is_streamed):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if not encoding:
+        return response
+    start = time.perf_counter()
+    response.set_data(compress(data, encoding))
+    metrics.add_time('compress', time.perf_counter() - start)
+    response.content_encoding = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_busy(error):
+    """A write that waited busy_timeout for the lock: ask the client to retry"""
+    if 'locked' not in str(error) and 'busy' not in str(error):
+        raise error
+    print(f"Database busy on {request.method} {request.path}: {error}")
+    response = jsonify({'error': 'Database occupato (database is locked), riprova'})
+    response.status_code = 503
+    response.retry_after = 1
+    return response
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file: its content-hashed copy once `flask assets` has built it"""
+    hashed = assets.hashed_name(filename)
+    if hashed:
+        return url_for('asset_file', filename=hashed)
+    return url_for('static', filename=filename)
+
+
+def encode_cursor(recipe):
+    """Opaque pagination cursor pointing after the given recipe"""
+    raw = json.dumps([recipe['name'], recipe['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor into (name, id); raises ValueError if invalid"""
+    try:
+        name, recipe_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError('invalid cursor')
+    if not isinstance(name, str) or not isinstance(recipe_id, int):
+        raise ValueError('invalid cursor')
+    return name, recipe_id
+
+
+def recipe_page(recipes, limit):
+    """Build a {recipes, next_cursor} page from up to limit + 1 rows"""
+    next_cursor = encode_cursor(recipes[limit - 1]) if len(recipes) > limit else None
+    return {'recipes': recipes[:limit], 'next_cursor': next_cursor}
+
+
+def build_bootstrap():
+    """Startup payload for the main page, read in a single transaction"""
+    data = db.get_bootstrap(fields=RECIPE_LIST_FIELDS, limit=RECIPE_PAGE_SIZE + 1)
+    data['recipes'] = recipe_page(data['recipes'], RECIPE_PAGE_SIZE)
+    return data
+
+
 # ============== PAGE ROUTES ==============
 
 @app.route('/')
 def index():
     """Main page - recipe book interface"""
-    return render_template('index.html')
+    # Inline the startup data so the page needs no API call before first paint
+    return render_template('index.html', bootstrap=build_bootstrap())
 
 
 @app.route('/settings')
@@ -46,22 +215,124 @@ def settings_page():
     return render_template('settings.html')
 
 
+@app.route('/sw.js')
+def service_worker():
+    """Offline support (static/js/sw.js), served from the root so its scope is the whole app"""
+    response = send_from_directory(os.path.join(app.static_folder, 'js'), 'sw.js',
+                                   mimetype='text/javascript')
+    # Browsers look for a new version on every visit
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = 0
+    return response
+
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    """Serve a content-hashed static file, precompressed if possible.
+    
+    The name changes with the content, so browsers may keep it forever.
+    """
+    path, encoding = assets.find(filename, request.accept_encodings)
+    response = send_from_directory(assets.dist_folder, path, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+    return response
+
+
 # ============== API ROUTES - RECIPES ==============
 
 @app.route('/api/recipes', methods=['GET'])
 def get_recipes():
-    """Get all recipes (summary for sidebar)"""
-    recipes = db.get_all_recipes()
-    return jsonify(recipes)
+    """Get recipe summaries for the sidebar.
+    
+    Optional query parameters: category_id, fields (comma separated) and
+    limit/cursor for keyset pagination. Without limit the full list is
+    returned as before; with limit the response is
+    {"recipes": [...], "next_cursor": "..." or null}.
+    """
+    category_id = request.args.get('category_id', type=int)
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',')] if fields else None
+    limit = request.args.get('limit', type=int)
+    
+    if not limit:
+        return conditional(lambda: jsonify(db.get_all_recipes(category_id=category_id, fields=fields)))
+    
+    limit = max(1, min(limit, 200))
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Cursore non valido'}), 400
+    
+    def build():
+        # Fetch one extra row to know whether another page exists
+        recipes = db.get_all_recipes(category_id=category_id, fields=fields, after=after, limit=limit + 1)
+        return jsonify(recipe_page(recipes, limit))
+    return conditional(build)
+
+
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """Settings, categories, units and the first recipe page in one response"""
+    return conditional(lambda: jsonify(build_bootstrap()))
+
+
+@app.route('/api/recipes/search', methods=['GET'])
+def search_recipes():
+    """Full-text search over recipes, ingredients and steps"""
+    query = request.args.get('q', '')
+    category_id = request.args.get('category_id', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    return conditional(lambda: jsonify(db.search_recipes(query, category_id=category_id, limit=limit)))
 
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['GET'])
 def get_recipe(recipe_id):
     """Get full recipe details"""
-    recipe = db.get_recipe(recipe_id)
-    if recipe:
-        return jsonify(recipe)
-    return jsonify({'error': 'Ricetta non trovata'}), 404
+    write_buffer.flush(recipe_id)
+    
+    def build():
+        recipe = db.get_recipe(recipe_id)
+        if recipe:
+            return jsonify(recipe)
+        return jsonify({'error': 'Ricetta non trovata'}), 404
+    return conditional(build)
+
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Recipes, categories, units and settings changed after ?since=<version>.
+    
+    Used by the offline copy in the browser (offline.js): it sends the
+    version of its last sync and applies the delta. With since=0, or when
+    the change log no longer reaches that far back, the response has
+    "reset": true and contains everything.
+    """
+    since = request.args.get('since', 0, type=int)
+    # Buffered quantity/portion saves belong to the delta
+    write_buffer.flush()
+    return conditional(lambda: jsonify(db.get_changes(since)))
+
+
+@app.route(EVENTS_PATH, methods=['GET'])
+def event_stream():
+    """Live changes as Server-Sent Events (see events.py).
+    
+    Each event carries the new data version as its id and a compact
+    summary of what changed since the previous one. Under gunicorn the
+    worker hands the connection to the event hub before it gets here;
+    this streamed response serves the development server.
+    """
+    since = parse_since(request.headers.get('Last-Event-ID'), request.args.get('since'))
+    return Response(events.stream(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/recipes', methods=['POST'])
@@ -76,6 +347,7 @@ def create_recipe():
 def update_recipe(recipe_id):
     """Update an existing recipe"""
     data = request.json
+    write_buffer.flush(recipe_id)
     success = db.update_recipe(recipe_id, data)
     if success:
         return jsonify({'message': 'Ricetta aggiornata con successo'})
@@ -84,7 +356,7 @@ def update_recipe(recipe_id):
 
 @app.route('/api/recipes/<int:recipe_id>', methods=['DELETE'])
 def delete_recipe(recipe_id):
-    """Delete a recipe"""
+    """Delete a recipe (its queued quantity/portion saves go with it)"""
     success = db.delete_recipe(recipe_id)
     if success:
         return jsonify({'message': 'Ricetta eliminata con successo'})
@@ -93,29 +365,49 @@ def delete_recipe(recipe_id):
 
 @app.route('/api/recipes/<int:recipe_id>/quantities', methods=['PUT'])
 def update_quantities(recipe_id):
-    """Update last-used quantities for a recipe"""
+    """Update last-used quantities for a recipe (coalesced by the write buffer)"""
     data = request.json
-    success = db.update_ingredient_quantities(recipe_id, data.get('ingredients', []))
-    if success:
-        return jsonify({'message': 'Quantità aggiornate'})
-    return jsonify({'error': 'Errore durante l\'aggiornamento'}), 400
+    ingredients = data.get('ingredients')
+    if not isinstance(ingredients, list):
+        return jsonify({'error': 'Errore durante l\'aggiornamento'}), 400
+    write_buffer.add_quantities(recipe_id, ingredients)
+    return jsonify({'message': 'Quantità aggiornate'})
 
 
 @app.route('/api/recipes/<int:recipe_id>/portions', methods=['PUT'])
 def update_portions(recipe_id):
-    """Update current portions for a recipe"""
+    """Update current portions for a recipe (coalesced by the write buffer)"""
     data = request.json
-    success = db.update_portions(recipe_id, data.get('current_portions', 1))
-    if success:
+    if write_buffer.set_portions(recipe_id, data.get('current_portions', 1)):
         return jsonify({'message': 'Porzioni aggiornate'})
     return jsonify({'error': 'Errore durante l\'aggiornamento'}), 400
 
 
+@app.route('/api/recipes/<int:recipe_id>/scale', methods=['POST'])
+def scale_recipe(recipe_id):
+    """Scale all quantities and portions of a recipe in one request (coalesced by the write buffer).
+    
+    Body: {"mode": "factor" | "portions" | "total_weight" | "anchor",
+           "value": number, "ingredient_id": id (anchor mode only)}
+    """
+    data = request.json or {}
+    try:
+        result = write_buffer.scale(recipe_id, data.get('mode'), data.get('value'),
+                                    ingredient_id=data.get('ingredient_id'))
+    except ValueError:
+        return jsonify({'error': 'Parametri non validi'}), 400
+    if result is None:
+        return jsonify({'error': 'Ricetta non trovata'}), 404
+    return jsonify(result)
+
+
 # ============== API ROUTES - PHOTO UPLOAD ==============
 
 @app.route('/api/upload', methods=['POST'])
 def upload_photo():
     """Upload a recipe photo"""
+    if request.content_length and request.content_length > MAX_PHOTO_SIZE:
+        return jsonify({'error': 'File troppo grande (max 16 MB)'}), 413
     if 'photo' not in request.files:
         return jsonify({'error': 'Nessun file caricato'}), 400
     
@@ -124,11 +416,12 @@ def upload_photo():
         return jsonify({'error': 'Nessun file selezionato'}), 400
     
     if file and allowed_file(file.filename):
-        # Generate unique filename
+        # Named after the content: re-uploading the same photo reuses the file
         ext = file.filename.rsplit('.', 1)[1].lower()
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secure_filename(file.filename)}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        filename, created = photos.store(file.stream, ext)
+        # Thumbnails and WebP variants are generated in the background
+        if created or not photos.has_variants(filename):
+            photos.submit(filename)
         return jsonify({'filename': filename, 'url': f'/uploads/{filename}'})
     
     return jsonify({'error': 'Tipo di file non consentito'}), 400
@@ -136,8 +429,29 @@ def upload_photo():
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Serve uploaded files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Serve uploaded files.
+    
+    With ?w=<pixels> the smallest resized variant at least that wide is
+    served instead of the original, as WebP if the browser accepts it.
+    """
+    width = request.args.get('w', type=int)
+    variant = None
+    if width:
+        # Only trust an explicit image/webp (every client matches */*)
+        webp = 'image/webp' in request.accept_mimetypes.values()
+        variant = photos.find_variant(secure_filename(filename), width, webp=webp)
+    
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], variant or filename)
+    if variant:
+        response.vary.add('Accept')
+    # A content-addressed name never changes meaning; a resize request still
+    # answered with the original must be asked again once variants exist
+    if is_content_addressed(filename) and (variant or not width):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
 
 
 # ============== API ROUTES - CATEGORIES ==============
@@ -145,8 +459,7 @@ def uploaded_file(filename):
 @app.route('/api/categories', methods=['GET'])
 def get_categories():
     """Get all categories"""
-    categories = db.get_all_categories()
-    return jsonify(categories)
+    return conditional(lambda: jsonify(db.get_all_categories()))
 
 
 @app.route('/api/categories', methods=['POST'])
@@ -173,8 +486,7 @@ def delete_category(category_id):
 @app.route('/api/units', methods=['GET'])
 def get_units():
     """Get all units"""
-    units = db.get_all_units()
-    return jsonify(units)
+    return conditional(lambda: jsonify(db.get_all_units()))
 
 
 @app.route('/api/units', methods=['POST'])
@@ -201,8 +513,7 @@ def delete_unit(unit_id):
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
     """Get application settings"""
-    settings = db.get_settings()
-    return jsonify(settings)
+    return conditional(lambda: jsonify(db.get_settings()))
 
 
 @app.route('/api/settings', methods=['PUT'])
@@ -219,22 +530,50 @@ def update_settings():
 
 @app.route('/api/export', methods=['GET'])
 def export_recipes():
-    """Export all recipes as JSON"""
-    data = db.export_all_data()
-    return jsonify(data)
+    """Export all recipes, streamed one recipe at a time.
+    
+    ?format=json (default) is the classic backup document, ndjson one
+    record per line, zip the NDJSON records plus the photos they use.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Formato non supportato'}), 400
+    
+    write_buffer.flush()
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    body = export_stream(db.iter_export(), fmt, app.config['UPLOAD_FOLDER'])
+    filename = f"ricettario_backup_{datetime.now().strftime('%Y-%m-%d')}.{ext}"
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store'
+    })
 
 
 @app.route('/api/import', methods=['POST'])
 def import_recipes():
-    """Import recipes from JSON"""
+    """Import recipes from a backup.
+    
+    An uploaded file (JSON, NDJSON or zip, see /api/export) is imported by
+    a background job: the response is 202 with the job status, to be
+    polled at /api/import/<job_id>. A JSON body is imported synchronously.
+    """
     if 'file' in request.files:
         file = request.files['file']
-        if file.filename.endswith('.json'):
-            data = json.load(file)
-            success = db.import_data(data)
-            if success:
-                return jsonify({'message': 'Importazione completata'})
-            return jsonify({'error': 'Errore durante l\'importazione'}), 400
+        fmt = import_format(file.filename)
+        if fmt is None:
+            return jsonify({'error': 'Formato non supportato'}), 400
+        if import_jobs.running():
+            return jsonify({'error': 'Importazione già in corso'}), 409
+        
+        write_buffer.flush()
+        fd, path = tempfile.mkstemp(dir=app.config['UPLOAD_FOLDER'], prefix='.import-')
+        with os.fdopen(fd, 'wb') as out:
+            file.save(out)
+        job = import_jobs.start(path, fmt)
+        if job is None:
+            os.remove(path)
+            return jsonify({'error': 'Importazione già in corso'}), 409
+        return jsonify(job), 202
     elif request.json:
         success = db.import_data(request.json)
         if success:
@@ -244,5 +583,156 @@ def import_recipes():
     return jsonify({'error': 'Nessun dato da importare'}), 400
 
 
+@app.route('/api/import/<job_id>', methods=['GET'])
+def import_status(job_id):
+    """Progress of a background import"""
+    job = import_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Importazione non trovata'}), 404
+    return jsonify(job)
+
+
+# ============== API ROUTES - WRITE BUFFER ==============
+
+@app.route('/api/write-buffer', methods=['GET'])
+def write_buffer_stats():
+    """Flush latency and coalescing ratio of the quantity/portion write buffer"""
+    return jsonify(write_buffer.stats())
+
+
+# ============== API ROUTES - CACHE ==============
+
+@app.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the database read cache (this worker process)"""
+    return jsonify(db.cache.stats())
+
+
+# ============== API ROUTES - EVENTS ==============
+
+@app.route('/api/events/stats', methods=['GET'])
+def event_stats():
+    """Subscribers and events sent by the live event hub (this worker process)"""
+    return jsonify(events.stats())
+
+
+# ============== METRICS ==============
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, route and SQL metrics of all workers in Prometheus text format"""
+    body = metrics.render([
+        ('db_size_bytes', 'gauge', 'Size of the database file, WAL included', db.file_size())
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+# ============== MAINTENANCE ==============
+
+@app.before_request
+def start_backup_scheduler():
+    """Scheduled snapshots run in the serving process (see backups.py)"""
+    backups.ensure_scheduler()
+
+
+@app.route('/api/maintenance', methods=['POST'])
+def run_maintenance():
+    """Remove orphaned rows and compact the database"""
+    report = db.compact()
+    return jsonify(report)
+
+
+@app.route('/api/backups', methods=['GET'])
+def list_backups():
+    """List database snapshots, newest first"""
+    return jsonify(backups.list_snapshots())
+
+
+@app.route('/api/backups', methods=['POST'])
+def create_backup():
+    """Take a database snapshot now"""
+    write_buffer.flush()
+    return jsonify(backups.create()), 201
+
+
+@app.route('/api/backups/<name>/restore', methods=['POST'])
+def restore_backup(name):
+    """Replace the database with a snapshot"""
+    # Pending quantity saves belong to the data being replaced
+    write_buffer.flush()
+    try:
+        backups.restore(name)
+    except ValueError:
+        return jsonify({'error': 'Backup non trovato'}), 404
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'message': 'Backup ripristinato'})
+
+
+@app.cli.command('thumbnails')
+@click.option('--force', is_flag=True, help='Regenerate variants that already exist.')
+def thumbnails_command(force):
+    """Generate resized and WebP variants for existing uploads."""
+    count, files = photos.backfill(force=force)
+    click.echo(f'{count} photos processed, {files} files written')
+
+
+@app.cli.command('photos-gc')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def photos_gc_command(dry_run):
+    """Delete uploaded photos that no recipe uses, with their variants."""
+    report = photos.collect_garbage(db.get_photo_refcounts(), dry_run=dry_run)
+    verb = 'would be deleted' if dry_run else 'deleted'
+    click.echo(f"{report['referenced']} photos in use, {report['kept_recent']} recent uploads kept")
+    click.echo(f"{report['files_deleted']} files {verb}, {report['bytes_freed']} bytes freed")
+
+
+@app.cli.command('backup')
+@click.option('--list', 'list_only', is_flag=True, help='List existing snapshots instead.')
+def backup_command(list_only):
+    """Take a compressed, verified snapshot of the database."""
+    if list_only:
+        for snapshot in backups.list_snapshots():
+            click.echo(f"{snapshot['name']}  {snapshot['size']} bytes")
+        return
+    report = backups.create()
+    click.echo(f"{report['name']}: {report['database_size']} -> {report['size']} bytes "
+               f"in {report['duration_ms']} ms")
+    for name in report['rotated']:
+        click.echo(f'Rotated out: {name}')
+
+
+@app.cli.command('restore')
+@click.argument('name')
+def restore_command(name):
+    """Replace the database with a snapshot (see `backup --list`)."""
+    try:
+        backups.restore(name)
+    except (ValueError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Restored {name}')
+
+
+@app.cli.command('assets')
+def assets_command():
+    """Build content-hashed, precompressed copies of the CSS and JS."""
+    for source, entry in assets.build().items():
+        sizes = ', '.join(f'{encoding} {size}' for encoding, size in entry['sizes'].items())
+        click.echo(f"{source} -> {entry['file']} ({sizes} bytes)")
+
+
+@app.cli.command('maintenance')
+def maintenance_command():
+    """Remove orphaned rows, then VACUUM and ANALYZE the database."""
+    report = db.compact()
+    for table, count in report['orphans_deleted'].items():
+        click.echo(f'{table}: {count} orphaned rows fixed')
+    click.echo(f"Size: {report['bytes_before']} -> {report['bytes_after']} bytes "
+               f"({report['bytes_reclaimed']} reclaimed)")
+    click.echo(f"Write-ahead log: {report['wal_bytes_truncated']} bytes truncated")
+
+
 if __name__ == '__main__':
+    # Exit cleanly on SIGTERM (systemd stop) so pending buffered writes are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,316 @@
+"""
+Backup formats for Recipe Book
+Serializes the records of Database.iter_export as a stream of bytes, and
+reads backup files back into records incrementally
+"""
+
+import io
+import os
+import re
+import json
+import shutil
+import zipfile
+from photos import photo_filename
+from json_provider import dumps, loads
+
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'zip': ('application/zip', 'zip'),
+}
+
+# Bytes collected before a piece of the response is handed to the server
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Name of the records file inside a zip archive (photos go under uploads/)
+ARCHIVE_RECORDS = 'ricettario.ndjson'
+
+# Characters read from a backup file at a time while importing
+IMPORT_READ_SIZE = 64 * 1024
+
+# Record kinds Database.import_records understands besides 'recipe'
+TABLE_RECORDS = ('categories', 'units', 'settings')
+
+
+def _buffered(pieces):
+    """Join small str/bytes pieces into chunks of about STREAM_CHUNK_SIZE bytes"""
+    buffer, size = [], 0
+    for piece in pieces:
+        if isinstance(piece, str):
+            piece = piece.encode('utf-8')
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def export_stream(records, fmt, upload_folder=None):
+    """Bytes of the backup in the given format (one of EXPORT_FORMATS)"""
+    if fmt == 'ndjson':
+        return _buffered(_ndjson_pieces(records))
+    if fmt == 'zip':
+        return _zip_chunks(records, upload_folder)
+    return _buffered(_json_pieces(records))
+
+
+def _json_pieces(records):
+    """The classic single-document backup, written one recipe at a time.
+
+    Same layout as Database.export_all_data, with 'recipes' last so the
+    small tables come first.
+    """
+    first = True
+    for kind, payload in records:
+        if kind == 'meta':
+            yield '{' + dumps(payload)[1:-1]
+        elif kind == 'recipe':
+            yield (', "recipes": [' if first else ', ') + dumps(payload)
+            first = False
+        else:
+            yield f', {dumps(kind)}: {dumps(payload)}'
+    yield (', "recipes": []}' if first else ']}')
+
+
+def _ndjson_pieces(records):
+    """One {"type": ..., "data": ...} object per line"""
+    for kind, payload in records:
+        yield dumps({'type': kind, 'data': payload}) + '\n'
+
+
+class _ChunkWriter:
+    """Write-only file object that hands out what was written so far.
+
+    It has no tell()/seek(), so zipfile writes entries with trailing data
+    descriptors and never goes back in the output.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Yield the bytes written since the last drain, if any"""
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def _zip_chunks(records, upload_folder):
+    """Zip archive with the NDJSON records and every photo they reference"""
+    out = _ChunkWriter()
+    photos = set()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ARCHIVE_RECORDS, 'w') as member:
+            for piece in _buffered(_ndjson_pieces(_collect_photos(records, photos))):
+                member.write(piece)
+                yield from out.drain()
+
+        # Originals only: resized variants can be regenerated after a restore
+        for filename in sorted(photos):
+            path = os.path.join(upload_folder, filename)
+            if not os.path.isfile(path):
+                continue
+            info = zipfile.ZipInfo.from_file(path, f'uploads/{filename}')
+            # Photos are already compressed
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as src, archive.open(info, 'w') as member:
+                for chunk in iter(lambda: src.read(STREAM_CHUNK_SIZE), b''):
+                    member.write(chunk)
+                    yield from out.drain()
+    yield from out.drain()
+
+
+def _collect_photos(records, photos):
+    """Pass records through, noting the upload filenames recipes reference"""
+    for kind, payload in records:
+        if kind == 'recipe':
+            filename = photo_filename(payload.get('photo_url'))
+            if filename:
+                photos.add(filename)
+        yield kind, payload
+
+
+# ============== IMPORT ==============
+
+def import_format(filename):
+    """Backup format of an uploaded file, from its extension (None if unknown)"""
+    ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if ext == 'jsonl':
+        return 'ndjson'
+    return ext if ext in EXPORT_FORMATS else None
+
+
+def iter_import_records(raw, fmt, upload_folder=None, restored=None):
+    """Records of a backup file opened in binary mode, read incrementally.
+
+    For zip archives the photos are copied into upload_folder first (files
+    already there are kept) and their names appended to `restored`.
+    """
+    if fmt == 'zip':
+        yield from _zip_records(raw, upload_folder, restored)
+        return
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'ndjson':
+            yield from _ndjson_records(text)
+        else:
+            yield from _json_records(text)
+    finally:
+        # Leave the caller's file open (the wrapper would close it)
+        text.detach()
+
+
+def _ndjson_records(text):
+    for line in text:
+        if line.strip():
+            record = loads(line)
+            yield record.get('type'), record.get('data')
+
+
+def _zip_records(raw, upload_folder, restored):
+    with zipfile.ZipFile(raw) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.startswith('uploads/'):
+                continue
+            filename = photo_filename('/' + info.filename)
+            path = os.path.join(upload_folder, filename) if filename else None
+            if not path or os.path.exists(path):
+                continue
+            tmp_path = os.path.join(upload_folder, f'.upload-{filename}')
+            with archive.open(info) as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+            if restored is not None:
+                restored.append(filename)
+
+        with archive.open(ARCHIVE_RECORDS) as member:
+            yield from _ndjson_records(io.TextIOWrapper(member, encoding='utf-8', newline=''))
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class _JsonReader:
+    """Reads a JSON document from a text file one value at a time.
+
+    Only the structure the backup format needs is walked by hand (the top
+    level object and the recipes array); every other value is decoded
+    with the standard decoder, so at most one recipe is held in memory.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.buf = ''
+        self.pos = 0
+        self.base = 0  # characters dropped from the front of buf
+        self.eof = False
+
+    def _fill(self):
+        data = self.text.read(IMPORT_READ_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        self.base += self.pos
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def tell(self):
+        return self.base + self.pos
+
+    def skip_to(self, offset):
+        """Restart reading at a character offset from the start of the file"""
+        self.text.seek(0)
+        self.buf, self.pos, self.base, self.eof = '', 0, 0, False
+        while self.base < offset:
+            data = self.text.read(min(IMPORT_READ_SIZE, offset - self.base))
+            if not data:
+                break
+            self.base += len(data)
+
+    def peek(self):
+        """Next non-whitespace character, '' at the end of the file"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f'JSON non valido: atteso uno tra {chars!r} alla posizione {self.tell()}')
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def array(self):
+        """Yield the elements of the array starting here"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def _json_records(text):
+    """Records of a classic backup document ({..., "recipes": [...]})"""
+    reader = _JsonReader(text)
+    reader.expect('{')
+    seen = set()
+    deferred = None
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == 'recipes':
+            if 'categories' in seen:
+                for recipe in reader.array():
+                    yield 'recipe', recipe
+            else:
+                # Older backups list the recipes before the categories they
+                # refer to: skip them now and come back once the rest is read
+                deferred = reader.tell()
+                for _ in reader.array():
+                    pass
+        else:
+            value = reader.value()
+            seen.add(key)
+            if key in TABLE_RECORDS:
+                yield key, value
+        if reader.expect(',}') == '}':
+            break
+
+    if deferred is not None:
+        reader.skip_to(deferred)
+        for recipe in reader.array():
+            yield 'recipe', recipe
@@ -0,0 +1,172 @@
+"""
+Static assets and response compression for Recipe Book
+Content-hashed, precompressed copies of the CSS/JS files and compression
+of API responses
+"""
+
+import os
+import json
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses and assets are gzip only
+    brotli = None
+
+# Responses smaller than this (bytes) are not worth compressing
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+
+# Levels for responses compressed on every request (fast) and for static
+# assets compressed once by the build (smallest output)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ASSET_GZIP_LEVEL = 9
+ASSET_BROTLI_QUALITY = 11
+
+# Encodings in order of preference, with the suffix of their precompressed files
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Build output (inside the static folder) and the files that get a hashed copy
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+ASSET_EXTENSIONS = ('.css', '.js')
+HASH_LENGTH = 12
+
+
+def available_encodings():
+    """Content encodings this process can produce, preferred first"""
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding != 'br' or brotli]
+
+
+def negotiate(accept_encodings, offered=None):
+    """Best encoding of `offered` the client accepts (werkzeug Accept), or None"""
+    return accept_encodings.best_match(offered or available_encodings())
+
+
+def compress(data, encoding, for_asset=False):
+    """Compress bytes with 'br' or 'gzip'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=ASSET_BROTLI_QUALITY if for_asset else BROTLI_QUALITY)
+    # mtime=0 keeps the output identical between builds
+    return gzip.compress(data, compresslevel=ASSET_GZIP_LEVEL if for_asset else GZIP_LEVEL, mtime=0)
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class StaticAssets:
+    """Content-hashed, precompressed copies of the static CSS and JS.
+
+    build() (the `assets` CLI command) writes css/style.<hash>.css and its
+    .gz/.br siblings into static/dist, plus a manifest mapping every source
+    to its copy. Pages link the copies, which can be cached forever since
+    any change gives a new name. Sources edited after the last build are
+    left out of the mapping and served as plain static files, so a
+    forgotten build only costs caching.
+    """
+
+    def __init__(self, static_folder):
+        self.static_folder = static_folder
+        self.dist_folder = os.path.join(static_folder, DIST_DIR)
+        self._hashed = {}
+        self.load()
+
+    def _sources(self):
+        """Asset paths relative to the static folder (outside dist)"""
+        for root, dirs, files in os.walk(self.static_folder):
+            if root == self.static_folder and DIST_DIR in dirs:
+                dirs.remove(DIST_DIR)
+            for name in sorted(files):
+                if name.endswith(ASSET_EXTENSIONS):
+                    path = os.path.relpath(os.path.join(root, name), self.static_folder)
+                    yield path.replace(os.sep, '/')
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.dist_folder, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        """Read the manifest, keeping only entries whose source is unchanged"""
+        self._hashed = {}
+        for source, entry in self._read_manifest().get('assets', {}).items():
+            try:
+                current = _digest(os.path.join(self.static_folder, source))
+            except OSError:
+                continue
+            if current == entry['sha256']:
+                self._hashed[source] = entry['file']
+            else:
+                print(f"Static asset changed since the last build, served unhashed: {source}")
+
+    def hashed_name(self, filename):
+        """Name of the hashed copy of a static file (under dist), or None"""
+        return self._hashed.get(filename)
+
+    def build(self):
+        """Write hashed, precompressed copies of every asset and the manifest.
+
+        Copies from the previous build are kept so that pages already open
+        in a browser can still load them; older ones are deleted.
+        """
+        previous = self._read_manifest()
+        assets = {}
+        for source in self._sources():
+            with open(os.path.join(self.static_folder, source), 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            stem, ext = os.path.splitext(source)
+            hashed = f'{stem}.{digest[:HASH_LENGTH]}{ext}'
+            sizes = {'identity': len(data)}
+            outputs = [(hashed, data)]
+            for encoding in available_encodings():
+                compressed = compress(data, encoding, for_asset=True)
+                outputs.append((hashed + ENCODING_SUFFIXES[encoding], compressed))
+                sizes[encoding] = len(compressed)
+            for name, content in outputs:
+                path = os.path.join(self.dist_folder, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            assets[source] = {'file': hashed, 'sha256': digest, 'sizes': sizes}
+
+        manifest = {'assets': assets, 'previous': previous.get('assets', {})}
+        tmp_path = os.path.join(self.dist_folder, MANIFEST_NAME + '.tmp')
+        os.makedirs(self.dist_folder, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.dist_folder, MANIFEST_NAME))
+        self._prune(manifest)
+        self.load()
+        return assets
+
+    def _prune(self, manifest):
+        """Delete hashed copies referenced by neither the current nor the previous build"""
+        keep = {MANIFEST_NAME}
+        for entries in (manifest['assets'], manifest['previous']):
+            for entry in entries.values():
+                keep.add(entry['file'])
+                keep.update(entry['file'] + suffix for suffix in ENCODING_SUFFIXES.values())
+        for root, _, files in os.walk(self.dist_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.dist_folder).replace(os.sep, '/') not in keep:
+                    os.remove(path)
+
+    def find(self, filename, accept_encodings):
+        """(file to send, content encoding) for a hashed asset, the best
+        precompressed variant the client accepts if one was built"""
+        offered = [encoding for encoding in ENCODING_SUFFIXES
+                   if os.path.exists(os.path.join(self.dist_folder, filename + ENCODING_SUFFIXES[encoding]))]
+        encoding = negotiate(accept_encodings, offered) if offered else None
+        if encoding:
+            return filename + ENCODING_SUFFIXES[encoding], encoding
+        return filename, None
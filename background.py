@@ -0,0 +1,56 @@
+"""
+Background threads for Recipe Book
+Per-process threads and thread pools: gunicorn forks its workers from the
+master, and threads do not survive a fork
+"""
+
+import os
+import threading
+
+
+class PerProcess:
+    """A value created once per process, on first use.
+
+    For background threads and thread pools: an object inherited through
+    a fork still references the parent's, which do not run in the child.
+    get() calls `factory` again the first time it is used in a new process.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        """Whether the value exists in this process"""
+        return self._pid == os.getpid()
+
+    def get(self):
+        """The value of this process, created if needed"""
+        if self._pid == os.getpid():
+            return self._value
+        with self._lock:
+            if self._pid != os.getpid():
+                self._value = self._factory()
+                self._pid = os.getpid()
+            return self._value
+
+
+def pid_alive(pid):
+    """Whether a process with this pid exists (e.g. the worker that wrote a state file)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def start_thread(target, name):
+    """Start a daemon thread running target()"""
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,205 @@
+"""
+Hot backups for Recipe Book
+Periodic compressed snapshots of the live database, with rotation and restore
+"""
+
+import os
+import re
+import gzip
+import time
+import fcntl
+import shutil
+import sqlite3
+from datetime import datetime
+from background import PerProcess, start_thread
+
+# Folder for the snapshots; default: 'backups' next to the database
+BACKUP_DIR = os.environ.get('BACKUP_DIR')
+
+# Seconds between scheduled snapshots; 0 disables the scheduler
+BACKUP_INTERVAL = int(os.environ.get('BACKUP_INTERVAL', 6 * 3600))
+
+# Retention: the newest BACKUP_KEEP_RECENT snapshots, plus the newest one of
+# each of the last BACKUP_KEEP_DAILY days and BACKUP_KEEP_WEEKLY weeks
+BACKUP_KEEP_RECENT = int(os.environ.get('BACKUP_KEEP_RECENT', 4))
+BACKUP_KEEP_DAILY = int(os.environ.get('BACKUP_KEEP_DAILY', 7))
+BACKUP_KEEP_WEEKLY = int(os.environ.get('BACKUP_KEEP_WEEKLY', 4))
+
+# Pages copied per backup step, and the pause between steps (seconds)
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_PAUSE = 0.01
+
+# Seconds before the scheduler's first check, and before a retry after an error
+BACKUP_STARTUP_DELAY = 60
+
+# Microseconds in the name: two snapshots taken within the same second
+# (scheduled and manual, or just before a restore) must not share it.
+# Older snapshots are named to the second.
+SNAPSHOT_NAME = re.compile(r'^recipe_book-(\d{8}-\d{6}(?:-\d{6})?)\.db\.gz$')
+SNAPSHOT_TIME_FORMAT = '%Y%m%d-%H%M%S-%f'
+SNAPSHOT_TIME_FORMAT_SECONDS = '%Y%m%d-%H%M%S'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def integrity_check(path):
+    """Result of PRAGMA integrity_check on a database file ('ok' if sound)"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('PRAGMA integrity_check').fetchall()
+        return '; '.join(row[0] for row in rows)
+    finally:
+        conn.close()
+
+
+def _with_journal(path):
+    """A database file and the WAL files SQLite may leave next to it
+    (opening the WAL-mode copy read-only for the integrity check does)"""
+    return path, path + '-wal', path + '-shm'
+
+
+class BackupManager:
+    """Takes, rotates and restores gzip-compressed database snapshots.
+
+    Snapshots come from Database.backup_to (the SQLite online backup API,
+    throttled), are checked with PRAGMA integrity_check before they are
+    kept, and restore in place with Database.restore_from. A file lock in
+    the backup folder keeps several processes from running at once.
+    """
+
+    def __init__(self, db, backup_dir=BACKUP_DIR, interval=BACKUP_INTERVAL):
+        self.db = db
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(os.path.abspath(db.db_path)), 'backups')
+        self.interval = interval
+        self._scheduler = PerProcess(lambda: start_thread(self._run, 'backups'))
+        os.makedirs(self.backup_dir, exist_ok=True)
+
+    # ============== SNAPSHOTS ==============
+
+    def _snapshots(self):
+        """(name, created) of every snapshot, newest first"""
+        snapshots = []
+        for name in os.listdir(self.backup_dir):
+            match = SNAPSHOT_NAME.match(name)
+            if match:
+                stamp = match.group(1)
+                time_format = SNAPSHOT_TIME_FORMAT if stamp.count('-') == 2 else SNAPSHOT_TIME_FORMAT_SECONDS
+                snapshots.append((name, datetime.strptime(stamp, time_format)))
+        snapshots.sort(key=lambda s: s[1], reverse=True)
+        return snapshots
+
+    def list_snapshots(self):
+        return [{
+            'name': name,
+            'created_at': created.isoformat(),
+            'size': os.path.getsize(os.path.join(self.backup_dir, name))
+        } for name, created in self._snapshots()]
+
+    def _exclusive(self):
+        """Lock file held while a snapshot is taken or restored"""
+        lock = open(os.path.join(self.backup_dir, '.lock'), 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def create(self, only_if_due=False):
+        """Take a snapshot now, verify it, compress it and apply the retention policy.
+
+        With only_if_due, returns None instead if a snapshot younger than
+        the interval exists (another process may just have taken one).
+        """
+        with self._exclusive():
+            if only_if_due and self._seconds_until_due() > 0:
+                return None
+            start = time.perf_counter()
+            created = datetime.now()
+            name = f'recipe_book-{created.strftime(SNAPSHOT_TIME_FORMAT)}.db.gz'
+            if os.path.exists(os.path.join(self.backup_dir, name)):
+                # Only if the clock went back: never overwrite a snapshot
+                raise RuntimeError(f'Snapshot already exists: {name}')
+            raw_path = os.path.join(self.backup_dir, f'.{name}.db.tmp')
+            gz_path = os.path.join(self.backup_dir, f'.{name}.tmp')
+            try:
+                self.db.backup_to(raw_path, pages=BACKUP_PAGES_PER_STEP, pause=BACKUP_STEP_PAUSE)
+                result = integrity_check(raw_path)
+                if result != 'ok':
+                    raise RuntimeError(f'Snapshot failed integrity check: {result}')
+                with open(raw_path, 'rb') as src, gzip.open(gz_path, 'wb', compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                raw_size = os.path.getsize(raw_path)
+                os.replace(gz_path, os.path.join(self.backup_dir, name))
+            finally:
+                for path in (*_with_journal(raw_path), gz_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            deleted = self.rotate()
+
+        return {
+            'name': name,
+            'created_at': created.isoformat(),
+            'size': os.path.getsize(os.path.join(self.backup_dir, name)),
+            'database_size': raw_size,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+            'rotated': deleted
+        }
+
+    def rotate(self):
+        """Delete the snapshots the retention policy does not keep, returns their names"""
+        snapshots = self._snapshots()
+        keep = {name for name, _ in snapshots[:BACKUP_KEEP_RECENT]}
+        days, weeks = {}, {}
+        for name, created in snapshots:
+            days.setdefault(created.date(), name)
+            weeks.setdefault(created.isocalendar()[:2], name)
+        keep.update(list(days.values())[:BACKUP_KEEP_DAILY])
+        keep.update(list(weeks.values())[:BACKUP_KEEP_WEEKLY])
+
+        deleted = [name for name, _ in snapshots if name not in keep]
+        for name in deleted:
+            os.remove(os.path.join(self.backup_dir, name))
+        return deleted
+
+    def restore(self, name):
+        """Replace the database with a snapshot; raises ValueError for unknown names"""
+        if not SNAPSHOT_NAME.match(name) or not os.path.exists(os.path.join(self.backup_dir, name)):
+            raise ValueError(f'Unknown snapshot: {name}')
+        raw_path = os.path.join(self.backup_dir, f'.{name}.restore.tmp')
+
+        with self._exclusive():
+            try:
+                with gzip.open(os.path.join(self.backup_dir, name), 'rb') as src, open(raw_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+                result = integrity_check(raw_path)
+                if result != 'ok':
+                    raise RuntimeError(f'Snapshot failed integrity check: {result}')
+                self.db.restore_from(raw_path)
+            finally:
+                for path in _with_journal(raw_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    # ============== SCHEDULER ==============
+
+    def ensure_scheduler(self):
+        """Start the snapshot thread of this process"""
+        if self.interval > 0:
+            self._scheduler.get()
+
+    def _seconds_until_due(self):
+        """Seconds before the next snapshot is due (zero or less: overdue)"""
+        snapshots = self._snapshots()
+        if not snapshots:
+            return 0
+        return self.interval - (datetime.now() - snapshots[0][1]).total_seconds()
+
+    def _run(self):
+        # Let the app finish starting before the first snapshot
+        time.sleep(BACKUP_STARTUP_DELAY)
+        while True:
+            wait = self._seconds_until_due()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.create(only_if_due=True)
+            except Exception as e:
+                print(f"Backup error: {e}")
+                time.sleep(BACKUP_STARTUP_DELAY)
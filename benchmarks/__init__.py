@@ -0,0 +1 @@
+"""Benchmarks for Recipe Book (run each module with `python -m benchmarks.<name>`)"""
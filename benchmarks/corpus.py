@@ -0,0 +1,104 @@
+"""
+Seeded synthetic recipe corpus for the benchmarks.
+
+The same seed and size always produce the same recipes, shaped like a real
+collection: 1-4 ingredient sections with 3-12 ingredients each, 3-12
+preparation steps of a sentence or three, a description for most recipes.
+The corpus is an export document, so it loads through Database.import_data
+exactly like a restored backup.
+
+    python -m benchmarks.corpus --recipes 1000 --seed 1 > corpus.json
+"""
+
+import argparse
+import json
+import random
+import sys
+
+CATEGORIES = ['Antipasti', 'Primi', 'Secondi', 'Contorni', 'Dolci', 'Pane e Lievitati', 'Conserve', 'Bevande']
+
+UNITS = [('grammi', 'g'), ('chilogrammi', 'kg'), ('millilitri', 'ml'), ('litri', 'l'),
+         ('cucchiaio', 'cucchiaio'), ('cucchiaino', 'cucchiaino'), ('pezzi', 'pz'), ('pizzico', 'pizzico')]
+
+DISHES = ['Lasagne', 'Risotto', 'Torta', 'Focaccia', 'Zuppa', 'Pane', 'Insalata', 'Crostata',
+          'Frittata', 'Gnocchi', 'Polpette', 'Biscotti', 'Sugo', 'Pizza', 'Vellutata', 'Tiramisù']
+QUALIFIERS = ['della nonna', 'alla bolognese', 'ai funghi', 'al limone', 'con zucchine', 'integrale',
+              'alle mandorle', 'di stagione', 'veloce', 'al forno', 'ai frutti di bosco', 'rustica']
+SECTIONS = ['Impasto', 'Ripieno', 'Condimento', 'Crema', 'Guarnizione', 'Salsa', 'Base', 'Finitura']
+INGREDIENTS = ['farina 00', 'farina integrale', 'acqua', 'latte', 'uova', 'burro', 'zucchero', 'sale',
+               'lievito di birra', 'olio extravergine', 'parmigiano', 'pomodori', 'cipolla', 'aglio',
+               'basilico', 'zucchine', 'funghi', 'limone', 'mandorle', 'cioccolato fondente', 'panna',
+               'ricotta', 'mozzarella', 'patate', 'carote', 'sedano', 'vino bianco', 'brodo', 'pepe nero',
+               'noce moscata', 'rosmarino', 'miele', 'mascarpone', 'caffè', 'pangrattato', 'riso carnaroli']
+VERBS = ['Mescolare', 'Impastare', 'Cuocere', 'Tagliare', 'Aggiungere', 'Lasciare riposare', 'Stendere',
+         'Versare', 'Rosolare', 'Frullare', 'Infornare', 'Servire']
+PHRASES = ['a fuoco medio per qualche minuto', 'fino a ottenere un composto omogeneo',
+           'in una ciotola capiente', 'coprendo con un canovaccio', 'a 180 gradi in forno statico',
+           'mescolando di tanto in tanto', 'fino a doratura', 'con un pizzico di sale',
+           'lasciando raffreddare prima di servire', 'finché il volume non raddoppia']
+
+
+def _sentence(rng):
+    return f'{rng.choice(VERBS)} {rng.choice(PHRASES)}.'
+
+
+def _recipe(rng, number, category_ids):
+    subsections = []
+    for _ in range(rng.randint(1, 4)):
+        ingredients = []
+        for _ in range(rng.randint(3, 12)):
+            quantity = round(rng.choice([rng.uniform(1, 20), rng.uniform(20, 1000)]), rng.choice([0, 1, 2]))
+            ingredients.append({
+                'name': rng.choice(INGREDIENTS),
+                'original_quantity': quantity,
+                'current_quantity': quantity,
+                'unit': rng.choice(UNITS)[1]
+            })
+        subsections.append({'name': rng.choice(SECTIONS), 'ingredients': ingredients})
+    steps = [
+        {'step_number': n + 1, 'description': ' '.join(_sentence(rng) for _ in range(rng.randint(1, 3)))}
+        for n in range(rng.randint(3, 12))
+    ]
+    return {
+        # The number keeps names unique (import matches recipes by name)
+        'name': f'{rng.choice(DISHES)} {rng.choice(QUALIFIERS)} {number}',
+        'description': ' '.join(_sentence(rng) for _ in range(rng.randint(1, 4))) if rng.random() < 0.8 else '',
+        'creation_date': f'20{rng.randint(18, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'preparation_time': rng.choice([15, 20, 30, 45, 60, 90, 120, None]),
+        'photo_url': None,
+        'category_id': rng.choice(category_ids) if rng.random() < 0.9 else None,
+        'subsections': subsections,
+        'steps': steps
+    }
+
+
+def generate(recipes, seed=1):
+    """Export document with `recipes` recipes; deterministic for a given seed"""
+    rng = random.Random(seed)
+    categories = [{'id': i + 1, 'name': name} for i, name in enumerate(CATEGORIES)]
+    category_ids = [cat['id'] for cat in categories]
+    return {
+        'version': '1.0',
+        'categories': categories,
+        'units': [{'name': name, 'abbreviation': abbreviation} for name, abbreviation in UNITS],
+        'recipes': [_recipe(rng, n + 1, category_ids) for n in range(recipes)]
+    }
+
+
+def fill(db, recipes, seed=1):
+    """Load a generated corpus into a Database, returns the document"""
+    data = generate(recipes, seed)
+    db.import_data(data)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    json.dump(generate(args.recipes, args.seed), sys.stdout, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Latency and throughput of the hot paths, reported as JSON.
+
+Fills a throwaway database with a seeded synthetic corpus (see corpus.py)
+and times Database methods and HTTP routes, the latter through the Flask
+test client (no network or server in between). Each case reports p50,
+p95, p99, mean and max latency in milliseconds, and throughput in
+operations per second of a single thread. The JSON also records the
+commit, Python/SQLite versions and machine, so runs on the Pi can be
+compared across releases:
+
+    python -m benchmarks.latency --recipes 1000 --output before.json
+    git checkout <new release>
+    python -m benchmarks.latency --recipes 1000 --output after.json --compare before.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Cases that take seconds per iteration run this many times at most
+SLOW_CASE_ITERATIONS = 5
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies):
+    """Latency statistics (ms) and single-thread throughput of one case"""
+    values = sorted(latencies)
+    total = sum(values)
+    return {
+        'iterations': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'mean_ms': round(total / len(values) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+        'ops_per_sec': round(len(values) / total, 1) if total else None
+    }
+
+
+def measure(fn, iterations, warmup, setup=None):
+    """Time fn(state) `iterations` times; setup() (untimed) builds each state"""
+    latencies = []
+    for i in range(warmup + iterations):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            latencies.append(elapsed)
+    return summarize(latencies)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def module_available(name):
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+def check(response, status=200):
+    if response.status_code != status:
+        raise RuntimeError(f'{response.request.method} {response.request.path}: {response.status_code}')
+    response.get_data()
+    response.close()
+
+
+def cases(app_module, corpus, rng, tmp):
+    """(name, fn, setup, slow) for every benchmark case"""
+    from benchmarks.corpus import generate
+    from database import Database
+    db = app_module.db
+    client = app_module.app.test_client()
+    # What a browser sends
+    headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    recipe_ids = [row['id'] for row in db.get_all_recipes()]
+
+    def random_recipe():
+        return rng.choice(recipe_ids)
+
+    def edit_setup():
+        recipe = db.get_recipe(random_recipe())
+        form = {
+            'name': recipe['name'], 'description': recipe['description'],
+            'creation_date': recipe['creation_date'], 'preparation_time': recipe['preparation_time'],
+            'photo_url': recipe['photo_url'], 'category_id': recipe['category_id'],
+            'portions': recipe['original_portions'],
+            'subsections': copy.deepcopy(recipe['subsections']),
+            'steps': copy.deepcopy(recipe['steps'])
+        }
+        for sub in form['subsections']:
+            for ing in sub['ingredients']:
+                ing['quantity'] = ing['original_quantity']
+        ingredient = rng.choice(rng.choice(form['subsections'])['ingredients'])
+        ingredient['quantity'] = round(rng.uniform(1, 500), 1)
+        return recipe['id'], form
+
+    def quantities_setup():
+        recipe = db.get_recipe(random_recipe())
+        ingredients = [ing for sub in recipe['subsections'] for ing in sub['ingredients']]
+        ingredient = rng.choice(ingredients)
+        return recipe['id'], [{'id': ingredient['id'], 'current_quantity': round(rng.uniform(1, 500), 1)}]
+
+    def cached_setup():
+        recipe_id = random_recipe()
+        db.get_recipe(recipe_id)
+        return recipe_id
+
+    def uncached_setup():
+        db.cache.clear()
+        return random_recipe()
+
+    import_data = generate(len(corpus['recipes']), seed=rng.randint(0, 2 ** 31))
+    import_count = [0]
+
+    def fresh_database():
+        import_count[0] += 1
+        return Database(os.path.join(tmp, f'import-{import_count[0]}.db'))
+
+    def import_into(target):
+        target.import_data(import_data)
+        target.close()
+
+    etag_cache = {}
+
+    def conditional_setup():
+        recipe_id = random_recipe()
+        if recipe_id not in etag_cache:
+            etag_cache[recipe_id] = client.get(f'/api/recipes/{recipe_id}', headers=headers).headers['ETag']
+        return recipe_id, {**headers, 'If-None-Match': etag_cache[recipe_id]}
+
+    return [
+        ('db.get_all_recipes', lambda _: db.get_all_recipes(), None, False),
+        ('db.get_all_recipes (page of 50)', lambda _: db.get_all_recipes(limit=51), None, False),
+        ('db.get_recipe', lambda recipe_id: db.get_recipe(recipe_id), random_recipe, False),
+        ('db.get_recipe (cache hit)', lambda recipe_id: db.get_recipe(recipe_id), cached_setup, False),
+        ('db.get_recipe (cache miss)', lambda recipe_id: db.get_recipe(recipe_id), uncached_setup, False),
+        ('db.search_recipes', lambda _: db.search_recipes('farina'), None, False),
+        ('db.update_recipe', lambda state: db.update_recipe(*state), edit_setup, False),
+        ('db.update_ingredient_quantities', lambda state: db.update_ingredient_quantities(*state),
+         quantities_setup, False),
+        ('db.export_all_data', lambda _: db.export_all_data(), None, True),
+        ('db.import_data (empty database)', import_into, fresh_database, True),
+        ('GET /', lambda _: check(client.get('/', headers=headers)), None, False),
+        ('GET /api/bootstrap', lambda _: check(client.get('/api/bootstrap', headers=headers)), None, False),
+        ('GET /api/recipes', lambda _: check(client.get('/api/recipes', headers=headers)), None, False),
+        ('GET /api/recipes?limit=50',
+         lambda _: check(client.get('/api/recipes?limit=50', headers=headers)), None, False),
+        ('GET /api/recipes/<id>',
+         lambda recipe_id: check(client.get(f'/api/recipes/{recipe_id}', headers=headers)), random_recipe, False),
+        ('GET /api/recipes/<id> (304)',
+         lambda state: check(client.get(f'/api/recipes/{state[0]}', headers=state[1]), 304),
+         conditional_setup, False),
+        ('GET /api/recipes/search',
+         lambda _: check(client.get('/api/recipes/search?q=farina', headers=headers)), None, False),
+        ('PUT /api/recipes/<id>',
+         lambda state: check(client.put(f'/api/recipes/{state[0]}', json=state[1])), edit_setup, False),
+        ('PUT /api/recipes/<id>/quantities',
+         lambda state: check(client.put(f'/api/recipes/{state[0]}/quantities', json={'ingredients': state[1]})),
+         quantities_setup, False),
+        ('GET /api/export?format=ndjson',
+         lambda _: check(client.get('/api/export?format=ndjson', headers=headers)), None, True),
+    ]
+
+
+def compare(results, baseline):
+    """Print p50/p95 of every case against a previous run"""
+    print(f'\n{"Caso":<40} {"p50 prima":>10} {"p50 ora":>10} {"Δ":>7} {"p95 prima":>10} {"p95 ora":>10} {"Δ":>7}',
+          file=sys.stderr)
+    for name, current in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+        row = f'{name:<40}'
+        for key in ('p50_ms', 'p95_ms'):
+            change = (current[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            row += f' {before[key]:>10.3f} {current[key]:>10.3f} {change:>+6.0f}%'
+        print(row, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Latency of the Recipe Book hot paths (JSON report).')
+    parser.add_argument('--recipes', type=int, default=1000, help='Recipes in the synthetic corpus')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the corpus and of the random choices')
+    parser.add_argument('--iterations', type=int, default=200, help='Timed iterations per case')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed iterations before each case')
+    parser.add_argument('--only', help='Run only the cases whose name contains this text')
+    parser.add_argument('--output', help='Write the JSON report here instead of standard output')
+    parser.add_argument('--compare', help='JSON report of a previous run to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The app reads its configuration at import time
+        os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+        os.environ['UPLOAD_FOLDER'] = os.path.join(tmp, 'uploads')
+        os.environ['BACKUP_INTERVAL'] = '0'
+        import app as app_module
+        from benchmarks.corpus import fill
+        from cache import DATABASE_CACHE_SIZE
+        from write_buffer import WRITE_BUFFER_INTERVAL
+
+        start = time.perf_counter()
+        corpus = fill(app_module.db, args.recipes, args.seed)
+        print(f'Corpus: {args.recipes} ricette in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+        rng = random.Random(args.seed)
+        results = {}
+        for name, fn, setup, slow in cases(app_module, corpus, rng, tmp):
+            if args.only and args.only not in name:
+                continue
+            iterations = min(args.iterations, SLOW_CASE_ITERATIONS) if slow else args.iterations
+            warmup = 1 if slow else args.warmup
+            results[name] = stats = measure(fn, iterations, warmup, setup)
+            print(f'{name:<40} p50 {stats["p50_ms"]:>9.3f} ms  p95 {stats["p95_ms"]:>9.3f} ms  '
+                  f'p99 {stats["p99_ms"]:>9.3f} ms  {stats["ops_per_sec"]:>9} op/s', file=sys.stderr)
+        app_module.write_buffer.close()
+        app_module.db.close()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'recipes': args.recipes,
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'orjson': module_available('orjson'),
+            'brotli': module_available('brotli'),
+            'cache_size': DATABASE_CACHE_SIZE,
+            'write_buffer_interval': WRITE_BUFFER_INTERVAL
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""
+Load test of a running server with realistic kitchen sessions.
+
+Each simulated device opens the page, scrolls the recipe list, opens a
+recipe, scales it in bursts (one write per pause, as the debounced inputs
+of app.js send them: POST /scale by ingredient quantity, by portions and,
+for bread recipes, by total weight; PUT /quantities for an ingredient
+without an original quantity), sometimes edits the recipe
+and rarely downloads a backup, then starts over with another recipe.
+Every concurrency level runs for --duration seconds and reports, per
+request type, p50/p95/p99 latency, throughput and errors, with database
+lock errors (503 from the server) counted apart:
+
+    python -m benchmarks.load --serve --recipes 1000 --concurrency 1,4,8,16,32
+    python -m benchmarks.load --url http://raspberrypi.local:5000 --concurrency 4 --duration 60
+
+The sessions write to the recipes they open (quantities, portions, an
+ingredient of an edited recipe): point --url only at a server whose data
+can be touched, or use --serve, which starts gunicorn on a throwaway
+database filled with the synthetic corpus.
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from benchmarks.latency import git_commit, module_available, summarize
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it the server answers with gzip
+    brotli = None
+
+# Seconds a person pauses between two changes of a quantity (app.js debounces
+# inputs by 300 ms, so each pause longer than that is one write)
+WRITE_PAUSE = (0.3, 1.2)
+# Seconds spent reading a recipe, and between two sessions
+READ_PAUSE = (1.0, 4.0)
+SESSION_PAUSE = (2.0, 8.0)
+
+# Chance that a session edits and saves the recipe it opened
+EDIT_PROBABILITY = 0.2
+
+# Recipes for which app.js shows the total weight field
+BREAD_CATEGORY = 'Pane e Lievitati'
+
+# Seconds --serve waits for gunicorn to answer
+SERVE_TIMEOUT = 30
+
+
+class Client:
+    """One device: a keep-alive HTTP connection, reopened after errors"""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        """(status, body bytes); connection errors raise OSError or HTTPException"""
+        # What a browser sends (brotli only if we can decode it)
+        headers = {'Accept-Encoding': 'gzip, deflate, br' if brotli else 'gzip, deflate'}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        # Decoding is part of what the device waits for
+        encoding = response.getheader('Content-Encoding')
+        if encoding == 'gzip':
+            data = gzip.decompress(data)
+        elif encoding == 'br':
+            data = brotli.decompress(data)
+        return response.status, data
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Recorder:
+    """Latencies and errors per request type, shared by all devices"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.sessions = 0
+
+    def add(self, name, seconds, error=None):
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if error:
+                errors = self.errors.setdefault(name, {})
+                errors[error] = errors.get(error, 0) + 1
+
+    def session_done(self):
+        with self._lock:
+            self.sessions += 1
+
+
+def classify(status, body):
+    """Error kind of a response, None if it succeeded"""
+    if status < 400:
+        return None
+    if status == 503 and b'locked' in body:
+        return 'database_locked'
+    return f'http_{status}'
+
+
+class Device(threading.Thread):
+    """Runs kitchen sessions back to back until the deadline"""
+
+    def __init__(self, url, recipe_ids, recorder, deadline, args, seed):
+        super().__init__(daemon=True)
+        self.client = Client(url, args.timeout)
+        self.recipe_ids = recipe_ids
+        self.recorder = recorder
+        self.deadline = deadline
+        self.args = args
+        self.rng = random.Random(seed)
+
+    def pause(self, bounds):
+        if self.args.think:
+            time.sleep(self.rng.uniform(*bounds) * self.args.think)
+
+    def call(self, name, method, path, body=None):
+        """Timed request; the parsed JSON body (or None) if it succeeded"""
+        start = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body)
+        except (OSError, http.client.HTTPException) as e:
+            self.recorder.add(name, time.perf_counter() - start, f'connection_{type(e).__name__}')
+            return None
+        error = classify(status, data)
+        self.recorder.add(name, time.perf_counter() - start, error)
+        if error or not data.startswith((b'{', b'[')):
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                self.session()
+                self.recorder.session_done()
+                self.pause(SESSION_PAUSE)
+        finally:
+            self.client.close()
+
+    def session(self):
+        rng = self.rng
+        self.call('GET /', 'GET', '/')
+        page = self.call('GET /api/recipes?limit=50', 'GET', '/api/recipes?limit=50')
+        if page and page.get('next_cursor') and rng.random() < 0.5:
+            self.call('GET /api/recipes?limit=50&cursor', 'GET',
+                      f'/api/recipes?limit=50&cursor={page["next_cursor"]}')
+
+        recipe_id = rng.choice(self.recipe_ids)
+        recipe = self.call('GET /api/recipes/<id>', 'GET', f'/api/recipes/{recipe_id}')
+        if not recipe:
+            return
+        ingredients = [ing for sub in recipe['subsections'] for ing in sub['ingredients']]
+        self.pause(READ_PAUSE)
+
+        for _ in range(rng.randint(*self.args.burst)):
+            if time.monotonic() >= self.deadline:
+                return
+            self.scale(recipe, ingredients)
+            self.pause(WRITE_PAUSE)
+
+        if rng.random() < EDIT_PROBABILITY:
+            self.edit(recipe)
+        if rng.random() < self.args.export_probability:
+            self.call('GET /api/export', 'GET', '/api/export')
+
+    def scale(self, recipe, ingredients):
+        """One scaling pause, sent the way app.js sends it"""
+        rng = self.rng
+        path = f'/api/recipes/{recipe["id"]}/scale'
+        roll = rng.random()
+        if recipe['category_name'] == BREAD_CATEGORY and roll < 0.2:
+            self.call('POST /api/recipes/<id>/scale total_weight', 'POST', path,
+                      {'mode': 'total_weight', 'value': rng.randint(300, 3000)})
+        elif not ingredients or roll < 0.4:
+            self.call('POST /api/recipes/<id>/scale portions', 'POST', path,
+                      {'mode': 'portions', 'value': rng.randint(1, 12)})
+        else:
+            ingredient = rng.choice(ingredients)
+            if ingredient['original_quantity']:
+                self.call('POST /api/recipes/<id>/scale anchor', 'POST', path, {
+                    'mode': 'anchor', 'ingredient_id': ingredient['id'],
+                    'value': round(ingredient['original_quantity'] * rng.uniform(0.5, 3), 1)
+                })
+            else:
+                # Nothing to scale by: the quantity alone is saved
+                self.call('PUT /api/recipes/<id>/quantities', 'PUT', f'/api/recipes/{recipe["id"]}/quantities',
+                          {'ingredients': [{'id': ingredient['id'],
+                                            'current_quantity': round(rng.uniform(1, 500), 1)}]})
+
+    def edit(self, recipe):
+        """Save the recipe as the edit form does, with one quantity changed"""
+        subsections = [
+            {'name': sub['name'], 'ingredients': [
+                {'name': ing['name'], 'quantity': ing['original_quantity'], 'unit': ing['unit']}
+                for ing in sub['ingredients']
+            ]}
+            for sub in recipe['subsections']
+        ]
+        ingredients = [ing for sub in subsections for ing in sub['ingredients']]
+        if ingredients:
+            self.rng.choice(ingredients)['quantity'] = round(self.rng.uniform(1, 500), 1)
+        self.call('PUT /api/recipes/<id>', 'PUT', f'/api/recipes/{recipe["id"]}', {
+            'name': recipe['name'], 'description': recipe['description'],
+            'creation_date': recipe['creation_date'], 'preparation_time': recipe['preparation_time'],
+            'photo_url': recipe['photo_url'], 'category_id': recipe['category_id'],
+            'portions': recipe['original_portions'], 'subsections': subsections,
+            'steps': [{'description': step['description']} for step in recipe['steps']]
+        })
+
+
+def run_level(url, recipe_ids, concurrency, args):
+    """Run `concurrency` devices for args.duration seconds, returns the level report"""
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + args.duration
+    devices = [Device(url, recipe_ids, recorder, deadline, args, seed=args.seed * 1000 + n)
+               for n in range(concurrency)]
+    for device in devices:
+        device.start()
+    for device in devices:
+        device.join()
+    elapsed = time.monotonic() - start
+
+    requests = {}
+    total = errors = locked = 0
+    for name, latencies in sorted(recorder.latencies.items()):
+        failures = recorder.errors.get(name, {})
+        failed = sum(failures.values())
+        requests[name] = dict(summarize(latencies), errors=failures,
+                              error_rate=round(failed / len(latencies), 4))
+        total += len(latencies)
+        errors += failed
+        locked += failures.get('database_locked', 0)
+    everything = summarize([s for latencies in recorder.latencies.values() for s in latencies]) if total else {}
+    return {
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 1),
+        'sessions': recorder.sessions,
+        'requests': total,
+        'requests_per_sec': round(total / elapsed, 1),
+        'error_rate': round(errors / total, 4) if total else None,
+        'database_locked': locked,
+        'p50_ms': everything.get('p50_ms'),
+        'p95_ms': everything.get('p95_ms'),
+        'p99_ms': everything.get('p99_ms'),
+        'by_request': requests
+    }
+
+
+def print_level(level):
+    print(f'\n{level["concurrency"]} dispositivi: {level["requests_per_sec"]} richieste/s, '
+          f'{level["sessions"]} sessioni, errori {level["error_rate"] or 0:.2%} '
+          f'(database bloccato: {level["database_locked"]})', file=sys.stderr)
+    for name, stats in level['by_request'].items():
+        print(f'  {name:<42} n {stats["iterations"]:>6}  p50 {stats["p50_ms"]:>9.1f} ms  '
+              f'p95 {stats["p95_ms"]:>9.1f} ms  p99 {stats["p99_ms"]:>9.1f} ms  errori {stats["error_rate"]:.2%}',
+              file=sys.stderr)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(tmp, recipes, seed):
+    """Start gunicorn (gunicorn.conf.py) on a new database with the synthetic corpus"""
+    from benchmarks.corpus import fill
+    from database import Database
+    db_path = os.path.join(tmp, 'load.db')
+    db = Database(db_path)
+    fill(db, recipes, seed)
+    db.close()
+
+    port = free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, BIND=f'127.0.0.1:{port}', DATABASE_PATH=db_path,
+               UPLOAD_FOLDER=os.path.join(tmp, 'uploads'), BACKUP_INTERVAL='0',
+               METRICS_DIR=os.path.join(tmp, 'metrics'))
+    log = open(os.path.join(tmp, 'gunicorn.log'), 'w')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                               cwd=root, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f'http://127.0.0.1:{port}'
+    client = Client(url, timeout=5)
+    deadline = time.monotonic() + SERVE_TIMEOUT
+    while True:
+        try:
+            client.request('GET', '/api/settings')
+            break
+        except (OSError, http.client.HTTPException):
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError(f'gunicorn non è partito, vedi {log.name}')
+            time.sleep(0.2)
+    client.close()
+    return process, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of a running Recipe Book server (JSON report).')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server to test')
+    parser.add_argument('--serve', action='store_true',
+                        help='Start gunicorn on a throwaway database instead of using --url')
+    parser.add_argument('--recipes', type=int, default=1000, help='Recipes in the --serve database')
+    parser.add_argument('--concurrency', default='1,4,8,16',
+                        help='Comma-separated numbers of simultaneous devices, one run each')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per concurrency level')
+    parser.add_argument('--think', type=float, default=1.0,
+                        help='Scale of the human pauses (0 = no pauses: every device hammers the server)')
+    parser.add_argument('--burst', type=int, nargs=2, default=[3, 10], metavar=('MIN', 'MAX'),
+                        help='Quantity/portion writes per opened recipe')
+    parser.add_argument('--export-probability', type=float, default=0.02,
+                        help='Chance that a session downloads the full backup')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here instead of standard output')
+    args = parser.parse_args()
+    levels = [int(n) for n in args.concurrency.split(',')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        url = args.url
+        if args.serve:
+            process, url = serve(tmp, args.recipes, args.seed)
+        try:
+            status, body = Client(url, args.timeout).request('GET', '/api/recipes?fields=id')
+            if status != 200:
+                raise RuntimeError(f'{url}/api/recipes: {status}')
+            recipe_ids = [recipe['id'] for recipe in json.loads(body)]
+            if not recipe_ids:
+                raise RuntimeError(f'{url} non ha ricette da aprire')
+            print(f'{url}: {len(recipe_ids)} ricette', file=sys.stderr)
+
+            results = []
+            for concurrency in levels:
+                results.append(run_level(url, recipe_ids, concurrency, args))
+                print_level(results[-1])
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'url': 'serve' if args.serve else args.url,
+            'recipes': len(recipe_ids),
+            'duration': args.duration,
+            'think': args.think,
+            'burst': args.burst,
+            'export_probability': args.export_probability,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'brotli': module_available('brotli'),
+            'web_workers': os.environ.get('WEB_WORKERS'),
+            'web_threads': os.environ.get('WEB_THREADS')
+        },
+        'levels': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
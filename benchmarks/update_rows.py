@@ -0,0 +1,134 @@
+"""
+Rows written by Database.update_recipe for typical single-field edits.
+
+Runs against a throwaway database and compares the rows actually written
+(INSERT/UPDATE/DELETE, as counted by SQLite, search index shadow
+tables included) with what rewriting the whole
+recipe tree would cost.
+
+    python -m benchmarks.update_rows
+"""
+
+import copy
+import os
+import tempfile
+
+SUBSECTIONS = 3
+INGREDIENTS_PER_SUBSECTION = 8
+STEPS = 10
+
+
+def sample_recipe():
+    return {
+        'name': 'Lasagne alla bolognese',
+        'description': 'Ricetta della domenica',
+        'portions': 6,
+        'subsections': [
+            {
+                'name': f'Sezione {s + 1}',
+                'ingredients': [
+                    {'name': f'Ingrediente {s + 1}.{i + 1}', 'quantity': 100 + i, 'unit': 'g'}
+                    for i in range(INGREDIENTS_PER_SUBSECTION)
+                ]
+            }
+            for s in range(SUBSECTIONS)
+        ],
+        'steps': [{'description': f'Passaggio numero {n + 1}'} for n in range(STEPS)]
+    }
+
+
+def edit_form(recipe):
+    """The payload the edit form sends back for a stored recipe (ids included)"""
+    return {
+        'name': recipe['name'],
+        'description': recipe['description'],
+        'creation_date': recipe['creation_date'],
+        'preparation_time': recipe['preparation_time'],
+        'photo_url': recipe['photo_url'],
+        'category_id': recipe['category_id'],
+        'portions': recipe['original_portions'],
+        'subsections': [
+            {
+                'id': sub['id'],
+                'name': sub['name'],
+                'ingredients': [
+                    {'id': ing['id'], 'name': ing['name'],
+                     'quantity': ing['original_quantity'], 'unit': ing['unit']}
+                    for ing in sub['ingredients']
+                ]
+            }
+            for sub in recipe['subsections']
+        ],
+        'steps': [{'id': step['id'], 'description': step['description']} for step in recipe['steps']]
+    }
+
+
+def fix_step_typo(form):
+    form['steps'][4]['description'] += '.'
+
+
+def change_quantity(form):
+    form['subsections'][1]['ingredients'][3]['quantity'] = 250
+
+
+def rename_recipe(form):
+    form['name'] = 'Lasagne alla bolognese classiche'
+
+
+def add_ingredient(form):
+    form['subsections'][0]['ingredients'].append({'name': 'Noce moscata', 'quantity': 1, 'unit': 'pizzico'})
+
+
+def remove_step(form):
+    del form['steps'][-1]
+
+
+def no_change(form):
+    pass
+
+
+EDITS = [
+    ('nessuna modifica', no_change),
+    ('correzione di un passaggio', fix_step_typo),
+    ('quantità di un ingrediente', change_quantity),
+    ('nome della ricetta', rename_recipe),
+    ('ingrediente aggiunto', add_ingredient),
+    ('passaggio rimosso', remove_step),
+]
+
+
+def rows_written(db, fn):
+    """Run fn and return the rows it changed on the (reused) write connection"""
+    with db.get_connection() as conn:
+        before = conn.total_changes
+    fn()
+    with db.get_connection() as conn:
+        return conn.total_changes - before
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+        from database import Database
+
+        db = Database()
+        children = SUBSECTIONS + SUBSECTIONS * INGREDIENTS_PER_SUBSECTION + STEPS
+        # Delete + reinsert every child row, update the recipe, rewrite its search entry
+        full_rewrite = 2 * children + 1 + 2
+
+        print(f'Ricetta: {SUBSECTIONS} sezioni, {SUBSECTIONS * INGREDIENTS_PER_SUBSECTION} ingredienti, '
+              f'{STEPS} passaggi')
+        print(f'Riscrittura completa: ~{full_rewrite} righe per salvataggio (più l\'indice di ricerca)\n')
+        print(f'{"Modifica":<30} {"Righe scritte":>14}')
+        for label, edit in EDITS:
+            recipe_id = db.create_recipe(sample_recipe())
+            form = edit_form(db.get_recipe(recipe_id))
+            edit(form)
+            data = copy.deepcopy(form)
+            rows = rows_written(db, lambda: db.update_recipe(recipe_id, data))
+            print(f'{label:<30} {rows:>14}')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
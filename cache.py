@@ -0,0 +1,123 @@
+"""
+Read cache for Recipe Book
+Bounded LRU of assembled recipes and lookup tables, kept consistent with
+the database (and other worker processes) through the data version
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# Entries kept per process (recipes plus the small lookup tables); 0 disables the cache
+DATABASE_CACHE_SIZE = int(os.environ.get('DATABASE_CACHE_SIZE', 256))
+
+
+class VersionedCache:
+    """LRU cache whose content is valid for one data version.
+
+    Keys are tuples: ('recipe', id) for a recipe tree, ('categories',),
+    ('units',), ('settings',). A key without an id in invalidate() stands
+    for every entry of that kind.
+
+    Every committed write bumps the data version. The process that wrote
+    knows which keys it touched and calls advance(): those entries are
+    evicted and the rest carries over to the new version. When a reader
+    finds the version moved any other way (another worker process, a
+    restore) sync() clears everything. put() refuses values built from a
+    snapshot older than the cache, so a slow reader cannot store data a
+    write has already replaced. Cached values are shared: treat them as
+    read-only.
+    """
+
+    def __init__(self, maxsize=DATABASE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'clears': 0
+        }
+
+    def _clear(self):
+        if self._entries:
+            self._stats['clears'] += 1
+            self._entries.clear()
+
+    def sync(self, version):
+        """Adopt the data version seen by a reader; False if its snapshot is older than the cache"""
+        with self._lock:
+            if self.version is None or version > self.version:
+                self._clear()
+                self.version = version
+            return version == self.version
+
+    def get(self, key):
+        """Cached value or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self._stats['misses'] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+            return value
+
+    def put(self, key, value, version):
+        """Store a value read at `version` (ignored if the data changed since)"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._invalidate(keys)
+
+    def _invalidate(self, keys):
+        for key in keys:
+            if len(key) == 1:
+                matching = [k for k in self._entries if k[0] == key[0]]
+            else:
+                matching = [key] if key in self._entries else []
+            for k in matching:
+                del self._entries[k]
+            self._stats['invalidations'] += len(matching)
+
+    def advance(self, old_version, new_version, keys):
+        """After a committed write moved the version from old to new.
+
+        keys=None (unknown scope) drops everything.
+        """
+        with self._lock:
+            if keys is None or self.version not in (old_version, new_version):
+                self._clear()
+            else:
+                self._invalidate(keys)
+            if self.version is None or new_version > self.version:
+                self.version = new_version
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self.version = None
+
+    def stats(self):
+        """Hit/miss counters, hit ratio and current size"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['maxsize'] = self.maxsize
+            stats['version'] = self.version
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else None
+        return stats
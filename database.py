@@ -6,8 +6,16 @@ SQLite database with all CRUD operations
 import sqlite3
 import json
 import os
-from datetime import datetime
-from contextlib import contextmanager
+import re
+import html
+import queue
+import time
+import threading
+import functools
+from decimal import Decimal, ROUND_HALF_UP
+from datetime import datetime, timezone
+from contextlib import contextmanager, nullcontext
+from cache import VersionedCache
 
 # Database path: use DATABASE_PATH env variable if set, otherwise use local directory
 # Production (Raspberry Pi): DATABASE_PATH=/home/davide/data/recipe_book.db
@@ -15,224 +23,833 @@ from contextlib import contextmanager
 DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recipe_book.db')
 DATABASE_PATH = os.environ.get('DATABASE_PATH', DEFAULT_DB_PATH)
 
+# Number of idle connections kept open per pool (one pool for reads, one for writes)
+POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 4))
+
+# Pragmas applied to every connection when it is opened.
+# WAL lets readers run while a write is in progress, and synchronous=NORMAL
+# only fsyncs at checkpoints instead of on every commit (safe in WAL mode).
+CONNECTION_PRAGMAS = (
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -8000),            # 8MB page cache (negative value = KiB)
+    ('mmap_size', 64 * 1024 * 1024),  # 64MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),           # wait up to 5s for the write lock
+    ('foreign_keys', 'ON'),           # enforce ON DELETE CASCADE / SET NULL
+)
+
+
+# Rebuilds the full-text rows of the recipes selected by {where}
+FTS_REINDEX_SQL = '''
+    INSERT INTO recipes_fts (rowid, name, description, ingredients, steps)
+    SELECT r.id, r.name, COALESCE(r.description, ''),
+           COALESCE((SELECT group_concat(i.name, ', ')
+                     FROM ingredients i
+                     JOIN ingredient_subsections s ON s.id = i.subsection_id
+                     WHERE s.recipe_id = r.id), ''),
+           COALESCE((SELECT group_concat(p.description, ' ')
+                     FROM preparation_steps p
+                     WHERE p.recipe_id = r.id), '')
+    FROM recipes r
+    {where}
+'''
+
+# Markers placed around matched terms by snippet(), replaced after HTML-escaping
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+# Columns that can be requested from the recipe list, and the default selection
+RECIPE_LIST_COLUMNS = {
+    'id': 'r.id',
+    'name': 'r.name',
+    'description': 'r.description',
+    'creation_date': 'r.creation_date',
+    'preparation_time': 'r.preparation_time',
+    'photo_url': 'r.photo_url',
+    'category_id': 'r.category_id',
+    'category_name': 'c.name',
+    'updated_at': 'r.updated_at',
+}
+RECIPE_LIST_DEFAULT_FIELDS = (
+    'id', 'name', 'description', 'creation_date', 'preparation_time',
+    'photo_url', 'category_id', 'category_name'
+)
+
+# Ways a recipe can be scaled by Database.scale_recipe
+SCALE_MODES = ('factor', 'portions', 'total_weight', 'anchor')
+
+# SQLite's default limit on host parameters is 999 in older builds
+MAX_SQL_PARAMS = 500
+
+# Recipes loaded (with their details) per query by Database.iter_export
+EXPORT_BATCH_SIZE = 200
+
+# Recipes written per transaction by Database.import_records
+IMPORT_BATCH_SIZE = 500
+
+# Data versions kept in the change log; clients that synced longer ago
+# than that get a full copy from /api/changes instead of a delta
+CHANGE_LOG_VERSIONS = int(os.environ.get('CHANGE_LOG_VERSIONS', 20000))
+# The log is trimmed once every this many versions
+CHANGE_LOG_PRUNE_EVERY = 500
+
+
+def _fts_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def _same_value(stored, incoming):
+    """Compare a stored column with an incoming JSON value (e.g. 3 and "3", 500.0 and 500)"""
+    if stored == incoming:
+        return True
+    if stored is None or incoming is None:
+        return False
+    return str(stored) == str(incoming)
+
+
+def _round_quantity(value):
+    """Round to 2 decimals like SQLite's ROUND: half up on the 15-digit decimal form"""
+    return float(Decimal(f'{value:.15g}').quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+def _fetch_dicts(cursor, sql, params=()):
+    """Run a query and return its rows as plain dicts, built once while fetching.
+    
+    For results handed to the JSON encoder as they are: a sqlite3.Row
+    would have to be copied into a dict there.
+    """
+    row_factory = cursor.row_factory
+    cursor.row_factory = None
+    try:
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.row_factory = row_factory
+
+
+def _match_rows(items, rows, row_position, item_positions):
+    """Pair incoming items with stored rows, by 'id' first and then by position.
+    
+    Items without an id take the unclaimed stored row at the same position
+    (row_position(row) == item_positions[i]). Returns the matched row (or
+    None) for each item, and the stored rows left unmatched.
+    """
+    rows_by_id = {row['id']: row for row in rows}
+    claimed = set()
+    matched = [None] * len(items)
+    for idx, item in enumerate(items):
+        row = rows_by_id.get(item.get('id'))
+        if row is not None and row['id'] not in claimed:
+            matched[idx] = row
+            claimed.add(row['id'])
+    
+    rows_by_position = {}
+    for row in rows:
+        if row['id'] not in claimed:
+            rows_by_position.setdefault(row_position(row), row)
+    for idx, item in enumerate(items):
+        if matched[idx] is None and item.get('id') is None:
+            row = rows_by_position.get(item_positions[idx])
+            if row is not None and row['id'] not in claimed:
+                matched[idx] = row
+                claimed.add(row['id'])
+    
+    unmatched = [row for row in rows if row['id'] not in claimed]
+    return matched, unmatched
+
+
+def _snippet_html(snippet):
+    """Escape a snippet and highlight the matched terms with <mark>"""
+    return (html.escape(snippet or '')
+            .replace(SNIPPET_START, '<mark>')
+            .replace(SNIPPET_END, '</mark>'))
+
+
+# ============== SCHEMA MIGRATIONS ==============
+# Each migration runs once, in order, inside the startup transaction.
+# Append new migrations to MIGRATIONS; never edit one that has shipped.
+
+def _migration_initial_schema(cursor):
+    """Tables and default data (also adopts databases created before versioning)"""
+    # Settings table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    
+    # Categories table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    
+    # Units table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            abbreviation TEXT NOT NULL UNIQUE
+        )
+    ''')
+    
+    # Recipes table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            creation_date DATE,
+            preparation_time INTEGER,
+            photo_url TEXT,
+            category_id INTEGER,
+            original_portions REAL DEFAULT 1,
+            current_portions REAL DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
+        )
+    ''')
+    
+    # Databases created before schema versioning may lack the portions columns
+    cursor.execute("PRAGMA table_info(recipes)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'original_portions' not in columns:
+        cursor.execute('ALTER TABLE recipes ADD COLUMN original_portions REAL DEFAULT 1')
+    if 'current_portions' not in columns:
+        cursor.execute('ALTER TABLE recipes ADD COLUMN current_portions REAL DEFAULT 1')
+    
+    # Ingredient subsections table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingredient_subsections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            sort_order INTEGER DEFAULT 0,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Ingredients table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subsection_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            original_quantity REAL,
+            current_quantity REAL,
+            unit TEXT,
+            sort_order INTEGER DEFAULT 0,
+            FOREIGN KEY (subsection_id) REFERENCES ingredient_subsections(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Preparation steps table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS preparation_steps (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipe_id INTEGER NOT NULL,
+            step_number INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        )
+    ''')
+    
+    # Insert default settings if not exist
+    default_settings = {
+        'theme': 'light',
+        'font': 'sans-serif',
+        'date_format': 'DD/MM/YYYY',
+        'spacing': 'comfortable',
+        'language': 'it'
+    }
+    for key, value in default_settings.items():
+        cursor.execute('''
+            INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)
+        ''', (key, value))
+    
+    # Insert default categories
+    default_categories = [
+        'Antipasti', 'Primi Piatti', 'Secondi Piatti', 'Contorni',
+        'Dolci', 'Bevande', 'Colazione', 'Snack', 'Salse', 'Pane e Lievitati'
+    ]
+    for cat in default_categories:
+        cursor.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (cat,))
+    
+    # Insert default units
+    default_units = [
+        ('grammi', 'g'),
+        ('chilogrammi', 'kg'),
+        ('millilitri', 'ml'),
+        ('litri', 'L'),
+        ('cucchiaino', 'cucchiaino'),
+        ('cucchiaio', 'cucchiaio'),
+        ('tazza', 'tazza'),
+        ('pezzi', 'pz'),
+        ('fette', 'fette'),
+        ('spicchi', 'spicchi'),
+        ('pizzico', 'pizzico'),
+        ('q.b.', 'q.b.'),
+        ('unità', 'unità'),
+        ('mazzetto', 'mazzetto'),
+        ('foglie', 'foglie'),
+        ('rametti', 'rametti')
+    ]
+    for name, abbr in default_units:
+        cursor.execute('INSERT OR IGNORE INTO units (name, abbreviation) VALUES (?, ?)', (name, abbr))
+
+
+def _migration_secondary_indexes(cursor):
+    """Indexes for child-row lookups and the name-ordered recipe list"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ingredient_subsections_recipe
+        ON ingredient_subsections (recipe_id, sort_order)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ingredients_subsection
+        ON ingredients (subsection_id, sort_order)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_preparation_steps_recipe
+        ON preparation_steps (recipe_id, step_number)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipes_name ON recipes (name)')
+
+
+def _migration_full_text_search(cursor):
+    """FTS5 index over recipe names, descriptions, ingredient names and steps"""
+    # remove_diacritics folds accents (caffè -> caffe); the prefix index
+    # makes "pomod*" style queries cheap while the user is still typing
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(
+            name, description, ingredients, steps,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    ''')
+    cursor.execute('DELETE FROM recipes_fts')
+    cursor.execute(FTS_REINDEX_SQL.format(where=''))
+
+
+def _migration_category_index(cursor):
+    """Index for the category-filtered, name-ordered recipe list"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipes_category ON recipes (category_id, name)')
+
+
+def _migration_data_version(cursor):
+    """Single-row counter bumped by every write, used for HTTP caching"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 1)')
+
+
+def _migration_change_log(cursor):
+    """What each data version changed, for delta sync (Database.get_changes).
+    
+    kind is 'recipe' (with entity_id), 'categories', 'units', 'settings',
+    or 'all' when the change has no known scope. A deleted recipe leaves a
+    row with deleted = 1: the tombstone clients remove it by.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            entity_id INTEGER,
+            deleted INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_version ON change_log (version)')
+
+
+def _migration_pending_writes(cursor):
+    """Quantity and portion saves waiting in the write buffer (see write_buffer.py).
+    
+    Kept in the database so every worker process flushes, and reads past,
+    what any of them received. Rows go away with their recipe or ingredient.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pending_quantities (
+            ingredient_id INTEGER PRIMARY KEY,
+            recipe_id INTEGER NOT NULL,
+            quantity REAL,
+            FOREIGN KEY (ingredient_id) REFERENCES ingredients(id) ON DELETE CASCADE,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_pending_quantities_recipe ON pending_quantities (recipe_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pending_portions (
+            recipe_id INTEGER PRIMARY KEY,
+            portions REAL,
+            FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
+        )
+    ''')
+
+
+MIGRATIONS = [
+    _migration_initial_schema,
+    _migration_secondary_indexes,
+    _migration_full_text_search,
+    _migration_category_index,
+    _migration_data_version,
+    _migration_change_log,
+    _migration_pending_writes,
+]
+
+
+# Statement kinds counted separately by the query metrics
+QUERY_KINDS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'PRAGMA')
+
+
+@functools.lru_cache(maxsize=1024)
+def _query_kind(sql):
+    words = sql.split(None, 1)
+    kind = words[0].upper() if words else ''
+    return kind if kind in QUERY_KINDS else 'other'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement, execute and fetches, to the connection's metrics.
+    
+    A statement is recorded once its rows are exhausted, or when the cursor
+    runs the next one, is closed or is garbage collected.
+    """
+    _sql = None
+    _params = ()
+    _seconds = 0.0
+    
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._seconds += time.perf_counter() - start
+    
+    def _start(self, sql, params):
+        self._finish()
+        self._sql, self._params, self._seconds = sql, params, 0.0
+    
+    def _finish(self):
+        sql, self._sql = self._sql, None
+        if sql is not None and self.connection.metrics.query(_query_kind(sql), self._seconds):
+            _log_slow_query(self.connection, sql, self._params, self._seconds)
+    
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        # The plan of a slow statement is explained with its first parameter set
+        if isinstance(seq_of_parameters, (list, tuple)):
+            self._start(sql, seq_of_parameters[0] if seq_of_parameters else ())
+        else:
+            self._start(sql, None)
+        result = self._timed(super().executemany, sql, seq_of_parameters)
+        self._finish()
+        return result
+    
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+    
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+    
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+    
+    def close(self):
+        self._finish()
+        super().close()
+    
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (and commits) are timed by a Metrics instance"""
+    metrics = None
+    
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+    
+    # The shortcuts would otherwise create a plain cursor internally
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.metrics.query('COMMIT', time.perf_counter() - start)
+
+
+def _log_slow_query(conn, sql, params, seconds):
+    """Print a slow statement with its query plan"""
+    print(f"Slow query ({seconds * 1000:.1f} ms): {' '.join(sql.split())}")
+    if params is None:
+        return
+    try:
+        # A plain cursor, so explaining is not measured itself
+        plan = sqlite3.Cursor(conn).execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except sqlite3.Error:
+        return
+    for row in plan:
+        print(f"    {row[3]}")
+
+
+class ConnectionPool:
+    """Pool of idle SQLite connections, reused across requests and threads.
+    
+    SQLite connections must not cross a fork: a child process (e.g. a
+    gunicorn worker forked from a preloaded app) starts with an empty pool
+    and opens its own connections.
+    """
+    
+    def __init__(self, db_path, size=POOL_SIZE, readonly=False, metrics=None):
+        self.db_path = db_path
+        self.metrics = metrics
+        self.readonly = readonly
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self._fork_lock = threading.Lock()
+        # Pools inherited from the parent, kept referenced so that their
+        # connections are never used, nor closed by garbage collection, here
+        self._inherited = []
+    
+    def _after_fork(self):
+        """Swap in an empty pool if this process is a fork of the one that filled it"""
+        if self._pid == os.getpid():
+            return
+        with self._fork_lock:
+            if self._pid != os.getpid():
+                self._inherited.append(self._idle)
+                self._idle = queue.LifoQueue(maxsize=self._idle.maxsize)
+                self._pid = os.getpid()
+    
+    def _connect(self):
+        """Open a new connection and apply the tuning pragmas"""
+        # isolation_level=None: transactions are opened explicitly by Database.get_connection
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               factory=InstrumentedConnection if self.metrics else sqlite3.Connection)
+        conn.row_factory = sqlite3.Row
+        if self.metrics:
+            conn.metrics = self.metrics
+        if self.readonly:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            conn.execute('PRAGMA journal_mode = WAL')
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+    
+    def acquire(self):
+        """Get an idle connection, opening a new one if the pool is empty"""
+        self._after_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def release(self, conn):
+        """Return a connection to the pool, closing it if the pool is full"""
+        self._after_fork()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    def close(self):
+        """Close all idle connections"""
+        self._after_fork()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
 
 class Database:
-    def __init__(self):
-        self.db_path = DATABASE_PATH
+    def __init__(self, db_path=None, metrics=None):
+        self.db_path = db_path or DATABASE_PATH
+        # Optional metrics.Metrics: every statement is then counted and timed
+        self._write_pool = ConnectionPool(self.db_path, metrics=metrics)
+        self._read_pool = ConnectionPool(self.db_path, readonly=True, metrics=metrics)
+        self.cache = VersionedCache()
+        # Called with the new data version after every committed write of this process
+        self.on_change = None
+        # Cache keys touched by the open write transaction of each connection
+        self._cache_pending = {}
         self.init_database()
     
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+    def get_connection(self, readonly=False):
+        """Context manager for pooled database connections.
+        
+        Each block runs in a single transaction. Read-only blocks get a
+        consistent snapshot and never wait for writers (WAL mode); write
+        blocks take the write lock up front to avoid lock-upgrade deadlocks.
+        """
+        pool = self._read_pool if readonly else self._write_pool
+        conn = pool.acquire()
         try:
+            conn.execute('BEGIN' if readonly else 'BEGIN IMMEDIATE')
             yield conn
             conn.commit()
-        except Exception as e:
+            # Taken before the release: once pooled, the connection may
+            # already be running another thread's write
+            pending = self._cache_pending.pop(conn, None)
+        except BaseException:
+            # BaseException too: a streaming generator abandoned by its client
+            # exits here with GeneratorExit and must not leave a transaction open
+            self._cache_pending.pop(conn, None)
             conn.rollback()
-            raise e
+            raise
         finally:
-            conn.close()
+            pool.release(conn)
+        if pending:
+            self.cache.advance(*pending)
+            if self.on_change:
+                self.on_change(pending[1])
+    
+    def close(self):
+        """Close all pooled connections"""
+        self._write_pool.close()
+        self._read_pool.close()
+    
+    def _bump_version(self, cursor, *keys, deleted=False):
+        """Record that the data changed; call inside the writing transaction.
+        
+        `keys` are the cache entries the change affects (see cache.py), evicted
+        once the transaction commits; without keys the whole cache is dropped.
+        They are also written to the change log, as tombstones if `deleted`.
+        """
+        version = cursor.execute('''
+            UPDATE data_version
+            SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1
+            RETURNING version
+        ''').fetchall()[0][0]
+        self._log_changes(cursor, version, keys, deleted)
+        pending = self._cache_pending.get(cursor.connection)
+        if pending is None:
+            self._cache_pending[cursor.connection] = (version - 1, version, set(keys) if keys else None)
+        else:
+            old_version, _, pending_keys = pending
+            if pending_keys is not None and keys:
+                pending_keys.update(keys)
+            else:
+                pending_keys = None
+            self._cache_pending[cursor.connection] = (old_version, version, pending_keys)
+    
+    def _log_changes(self, cursor, version, keys, deleted=False):
+        if keys:
+            rows = [(version, key[0], key[1] if len(key) > 1 else None, int(deleted)) for key in keys]
+        else:
+            rows = [(version, 'all', None, 0)]
+        cursor.executemany(
+            'INSERT INTO change_log (version, kind, entity_id, deleted) VALUES (?, ?, ?, ?)', rows)
+        if version % CHANGE_LOG_PRUNE_EVERY == 0:
+            cursor.execute('DELETE FROM change_log WHERE version <= ?', (version - CHANGE_LOG_VERSIONS,))
+    
+    def _cached(self, conn, key, build):
+        """Cached value for key, or build(cursor) from the connection's snapshot.
+        
+        The data version is read in the same snapshot, so a value is only
+        cached if it matches what the cache considers current.
+        """
+        version = conn.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+        if not self.cache.sync(version):
+            return build(conn.cursor())
+        value = self.cache.get(key)
+        if value is None:
+            value = build(conn.cursor())
+            if value is not None:
+                self.cache.put(key, value, version)
+        return value
+    
+    def get_data_version(self):
+        """Get (version, last modified UTC datetime) of the stored data"""
+        with self.get_connection(readonly=True) as conn:
+            row = conn.execute('SELECT version, updated_at FROM data_version WHERE id = 1').fetchone()
+            modified = datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S')
+            return row['version'], modified.replace(tzinfo=timezone.utc)
     
     def init_database(self):
-        """Initialize database tables and default data"""
+        """Bring the schema up to date by running any pending migrations.
+        
+        The schema version is stored in PRAGMA user_version, so once the
+        database is current startup costs a single read and no DDL.
+        """
+        with self.get_connection(readonly=True) as conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Settings table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
-            
-            # Categories table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS categories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE
-                )
-            ''')
-            
-            # Units table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS units (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    abbreviation TEXT NOT NULL UNIQUE
-                )
-            ''')
-            
-            # Recipes table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS recipes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    creation_date DATE,
-                    preparation_time INTEGER,
-                    photo_url TEXT,
-                    category_id INTEGER,
-                    original_portions REAL DEFAULT 1,
-                    current_portions REAL DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (category_id) REFERENCES categories(id) ON DELETE SET NULL
-                )
-            ''')
-            
-            # Migration: Add portions columns if they don't exist (for existing databases)
-            cursor.execute("PRAGMA table_info(recipes)")
-            columns = [col[1] for col in cursor.fetchall()]
-            if 'original_portions' not in columns:
-                cursor.execute('ALTER TABLE recipes ADD COLUMN original_portions REAL DEFAULT 1')
-            if 'current_portions' not in columns:
-                cursor.execute('ALTER TABLE recipes ADD COLUMN current_portions REAL DEFAULT 1')
-            
-            # Ingredient subsections table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ingredient_subsections (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    recipe_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    sort_order INTEGER DEFAULT 0,
-                    FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Ingredients table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ingredients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    subsection_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    original_quantity REAL,
-                    current_quantity REAL,
-                    unit TEXT,
-                    sort_order INTEGER DEFAULT 0,
-                    FOREIGN KEY (subsection_id) REFERENCES ingredient_subsections(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Preparation steps table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS preparation_steps (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    recipe_id INTEGER NOT NULL,
-                    step_number INTEGER NOT NULL,
-                    description TEXT NOT NULL,
-                    FOREIGN KEY (recipe_id) REFERENCES recipes(id) ON DELETE CASCADE
-                )
-            ''')
-            
-            # Insert default settings if not exist
-            default_settings = {
-                'theme': 'light',
-                'font': 'sans-serif',
-                'date_format': 'DD/MM/YYYY',
-                'spacing': 'comfortable',
-                'language': 'it'
-            }
-            for key, value in default_settings.items():
-                cursor.execute('''
-                    INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)
-                ''', (key, value))
-            
-            # Insert default categories
-            default_categories = [
-                'Antipasti', 'Primi Piatti', 'Secondi Piatti', 'Contorni',
-                'Dolci', 'Bevande', 'Colazione', 'Snack', 'Salse', 'Pane e Lievitati'
-            ]
-            for cat in default_categories:
-                cursor.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (cat,))
-            
-            # Insert default units
-            default_units = [
-                ('grammi', 'g'),
-                ('chilogrammi', 'kg'),
-                ('millilitri', 'ml'),
-                ('litri', 'L'),
-                ('cucchiaino', 'cucchiaino'),
-                ('cucchiaio', 'cucchiaio'),
-                ('tazza', 'tazza'),
-                ('pezzi', 'pz'),
-                ('fette', 'fette'),
-                ('spicchi', 'spicchi'),
-                ('pizzico', 'pizzico'),
-                ('q.b.', 'q.b.'),
-                ('unità', 'unità'),
-                ('mazzetto', 'mazzetto'),
-                ('foglie', 'foglie'),
-                ('rametti', 'rametti')
-            ]
-            for name, abbr in default_units:
-                cursor.execute('INSERT OR IGNORE INTO units (name, abbreviation) VALUES (?, ?)', (name, abbr))
+            # Re-read under the write lock: another process may have migrated meanwhile
+            version = cursor.execute('PRAGMA user_version').fetchone()[0]
+            for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
     
     # ============== RECIPES ==============
     
-    def get_all_recipes(self):
-        """Get all recipes summary for sidebar"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT r.id, r.name, r.description, r.creation_date, r.preparation_time,
-                       r.photo_url, r.category_id, c.name as category_name
-                FROM recipes r
-                LEFT JOIN categories c ON r.category_id = c.id
-                ORDER BY r.name
-            ''')
-            recipes = []
-            for row in cursor.fetchall():
-                recipes.append(dict(row))
-            return recipes
+    def get_all_recipes(self, category_id=None, fields=None, after=None, limit=None):
+        """Get recipe summaries for the sidebar, ordered by name.
+        
+        Pagination is keyset-based: `after` is the (name, id) of the last
+        recipe of the previous page, so every page costs the same however
+        deep it is. `fields` restricts the returned columns (id and name
+        are always included); unknown field names are ignored.
+        
+        Rows are built as dicts while fetching, like the category and unit
+        lists, and go to the JSON encoder without another copy.
+        """
+        with self.get_connection(readonly=True) as conn:
+            return self._query_recipes(conn.cursor(), category_id, fields, after, limit)
+    
+    def _query_recipes(self, cursor, category_id=None, fields=None, after=None, limit=None):
+        """Recipe list query shared by get_all_recipes and get_bootstrap"""
+        fields = [f for f in (fields or RECIPE_LIST_DEFAULT_FIELDS) if f in RECIPE_LIST_COLUMNS]
+        for required in ('name', 'id'):
+            if required not in fields:
+                fields.insert(0, required)
+        columns = ', '.join(f'{RECIPE_LIST_COLUMNS[f]} as {f}' for f in fields)
+        
+        sql = f'SELECT {columns} FROM recipes r'
+        if 'category_name' in fields:
+            sql += ' LEFT JOIN categories c ON r.category_id = c.id'
+        conditions, params = [], []
+        if category_id:
+            conditions.append('r.category_id = ?')
+            params.append(category_id)
+        if after:
+            conditions.append('(r.name, r.id) > (?, ?)')
+            params.extend(after)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY r.name, r.id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        return _fetch_dicts(cursor, sql, params)
     
     def get_recipe(self, recipe_id):
-        """Get full recipe details"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get recipe
-            cursor.execute('''
-                SELECT r.*, c.name as category_name
-                FROM recipes r
-                LEFT JOIN categories c ON r.category_id = c.id
-                WHERE r.id = ?
-            ''', (recipe_id,))
-            row = cursor.fetchone()
-            if not row:
-                return None
-            
-            recipe = dict(row)
-            
-            # Get ingredient subsections with ingredients
-            cursor.execute('''
-                SELECT * FROM ingredient_subsections
-                WHERE recipe_id = ?
-                ORDER BY sort_order
-            ''', (recipe_id,))
-            subsections = []
-            for sub_row in cursor.fetchall():
-                subsection = dict(sub_row)
-                cursor.execute('''
-                    SELECT * FROM ingredients
-                    WHERE subsection_id = ?
-                    ORDER BY sort_order
-                ''', (subsection['id'],))
-                subsection['ingredients'] = [dict(ing) for ing in cursor.fetchall()]
-                subsections.append(subsection)
-            recipe['subsections'] = subsections
-            
-            # Get preparation steps
-            cursor.execute('''
-                SELECT * FROM preparation_steps
-                WHERE recipe_id = ?
-                ORDER BY step_number
-            ''', (recipe_id,))
-            recipe['steps'] = [dict(step) for step in cursor.fetchall()]
-            
-            return recipe
+        """Get full recipe details (cached: do not modify the result)"""
+        with self.get_connection(readonly=True) as conn:
+            return self._cached(conn, ('recipe', recipe_id), lambda cursor: self._query_recipe(cursor, recipe_id))
+    
+    def _query_recipe(self, cursor, recipe_id):
+        # Get recipe
+        cursor.execute('''
+            SELECT r.*, c.name as category_name
+            FROM recipes r
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE r.id = ?
+        ''', (recipe_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        
+        recipe = dict(row)
+        self._attach_details(cursor, [recipe], recipe_id)
+        return recipe
+    
+    def _attach_details(self, cursor, recipes, recipe_id=None):
+        """Attach subsections (with ingredients) and steps to recipe dicts.
+        
+        Runs a fixed number of queries however many recipes and subsections
+        there are, and assembles the tree in Python. If recipe_id is given the
+        queries are restricted to that recipe, otherwise to the id range the
+        given recipes span.
+        """
+        if recipe_id is not None:
+            where, params = 'WHERE s.recipe_id = ?', (recipe_id,)
+        elif recipes:
+            ids = [recipe['id'] for recipe in recipes]
+            where, params = 'WHERE s.recipe_id BETWEEN ? AND ?', (min(ids), max(ids))
+        else:
+            return
+        
+        recipes_by_id = {}
+        for recipe in recipes:
+            recipe['subsections'] = []
+            recipe['steps'] = []
+            recipes_by_id[recipe['id']] = recipe
+        
+        # Subsections
+        subsections_by_id = {}
+        cursor.execute(f'''
+            SELECT s.* FROM ingredient_subsections s
+            {where}
+            ORDER BY s.recipe_id, s.sort_order, s.id
+        ''', params)
+        for row in cursor.fetchall():
+            recipe = recipes_by_id.get(row['recipe_id'])
+            if recipe is None:
+                continue
+            subsection = dict(row)
+            subsection['ingredients'] = []
+            recipe['subsections'].append(subsection)
+            subsections_by_id[subsection['id']] = subsection
+        
+        # Ingredients
+        cursor.execute(f'''
+            SELECT i.* FROM ingredients i
+            JOIN ingredient_subsections s ON s.id = i.subsection_id
+            {where}
+            ORDER BY i.subsection_id, i.sort_order, i.id
+        ''', params)
+        for row in cursor.fetchall():
+            subsection = subsections_by_id.get(row['subsection_id'])
+            if subsection is not None:
+                subsection['ingredients'].append(dict(row))
+        
+        # Preparation steps
+        cursor.execute(f'''
+            SELECT s.* FROM preparation_steps s
+            {where}
+            ORDER BY s.recipe_id, s.step_number, s.id
+        ''', params)
+        for row in cursor.fetchall():
+            recipe = recipes_by_id.get(row['recipe_id'])
+            if recipe is not None:
+                recipe['steps'].append(dict(row))
     
     def create_recipe(self, data):
         """Create a new recipe"""
@@ -286,114 +903,477 @@ class Database:
                     VALUES (?, ?, ?)
                 ''', (recipe_id, idx + 1, step.get('description', '')))
             
+            self._reindex_recipes(cursor, [recipe_id])
+            self._bump_version(cursor, ('recipe', recipe_id))
+            
             return recipe_id
     
     def update_recipe(self, recipe_id, data):
-        """Update an existing recipe"""
+        """Update an existing recipe, writing only the rows that changed.
+        
+        Incoming subsections, ingredients and steps are matched to the stored
+        rows by 'id' (when given and belonging to this recipe), otherwise by
+        position. Matched rows are updated only if a field differs, unmatched
+        stored rows are deleted and unmatched incoming items inserted. Row ids,
+        which the client uses for quantity saves, survive the edit.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
             # Check if recipe exists
-            cursor.execute('SELECT id FROM recipes WHERE id = ?', (recipe_id,))
-            if not cursor.fetchone():
+            cursor.execute('SELECT * FROM recipes WHERE id = ?', (recipe_id,))
+            stored_recipe = cursor.fetchone()
+            if not stored_recipe:
                 return False
             
-            # Update recipe
-            portions = data.get('portions', 1) or 1
-            cursor.execute('''
-                UPDATE recipes
-                SET name = ?, description = ?, creation_date = ?, preparation_time = ?,
-                    photo_url = ?, category_id = ?, original_portions = ?, current_portions = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (
-                data.get('name', ''),
-                data.get('description', ''),
-                data.get('creation_date'),
-                data.get('preparation_time'),
-                data.get('photo_url'),
-                data.get('category_id'),
-                portions,
-                portions,
-                recipe_id
-            ))
-            
-            # Delete existing subsections and ingredients (cascade)
-            cursor.execute('DELETE FROM ingredient_subsections WHERE recipe_id = ?', (recipe_id,))
+            changes_before = conn.total_changes
+            text_changed = self._update_subsections(cursor, recipe_id, data.get('subsections', []))
+            text_changed |= self._update_steps(cursor, recipe_id, data.get('steps', []))
             
-            # Insert new subsections and ingredients
-            for idx, subsection in enumerate(data.get('subsections', [])):
+            # Update recipe (touching updated_at only if something changed)
+            portions = data.get('portions', 1) or 1
+            values = {
+                'name': data.get('name', ''),
+                'description': data.get('description', ''),
+                'creation_date': data.get('creation_date'),
+                'preparation_time': data.get('preparation_time'),
+                'photo_url': data.get('photo_url'),
+                'category_id': data.get('category_id'),
+                'original_portions': portions,
+                'current_portions': portions
+            }
+            fields_changed = any(not _same_value(stored_recipe[k], v) for k, v in values.items())
+            if fields_changed or conn.total_changes != changes_before:
                 cursor.execute('''
-                    INSERT INTO ingredient_subsections (recipe_id, name, sort_order)
-                    VALUES (?, ?, ?)
-                ''', (recipe_id, subsection.get('name', ''), idx))
-                subsection_id = cursor.lastrowid
+                    UPDATE recipes
+                    SET name = ?, description = ?, creation_date = ?, preparation_time = ?,
+                        photo_url = ?, category_id = ?, original_portions = ?, current_portions = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (*values.values(), recipe_id))
+                text_changed |= not _same_value(stored_recipe['name'], values['name'])
+                text_changed |= not _same_value(stored_recipe['description'], values['description'])
                 
-                for ing_idx, ingredient in enumerate(subsection.get('ingredients', [])):
-                    original_qty = ingredient.get('original_quantity', ingredient.get('quantity'))
-                    current_qty = ingredient.get('current_quantity', ingredient.get('quantity'))
-                    cursor.execute('''
-                        INSERT INTO ingredients (subsection_id, name, original_quantity, current_quantity, unit, sort_order)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (
-                        subsection_id,
-                        ingredient.get('name', ''),
-                        original_qty,
-                        current_qty,
-                        ingredient.get('unit', ''),
-                        ing_idx
-                    ))
+                if text_changed:
+                    self._reindex_recipes(cursor, [recipe_id])
+                self._bump_version(cursor, ('recipe', recipe_id))
             
-            # Delete existing steps
-            cursor.execute('DELETE FROM preparation_steps WHERE recipe_id = ?', (recipe_id,))
-            
-            # Insert new steps
-            for idx, step in enumerate(data.get('steps', [])):
+            return True
+    
+    def _update_subsections(self, cursor, recipe_id, subsections):
+        """Diff subsections and their ingredients against the stored rows.
+        
+        Returns True if ingredient names changed (the search index needs a refresh).
+        """
+        cursor.execute('''
+            SELECT * FROM ingredient_subsections WHERE recipe_id = ? ORDER BY sort_order, id
+        ''', (recipe_id,))
+        stored_subsections = [dict(row) for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT i.* FROM ingredients i
+            JOIN ingredient_subsections s ON s.id = i.subsection_id
+            WHERE s.recipe_id = ?
+            ORDER BY i.subsection_id, i.sort_order, i.id
+        ''', (recipe_id,))
+        stored_ingredients = [dict(row) for row in cursor.fetchall()]
+        
+        # Subsections: rename/reorder matched ones, insert new ones
+        matched, removed_subsections = _match_rows(
+            subsections, stored_subsections,
+            lambda row: row['sort_order'], list(range(len(subsections))))
+        subsection_ids = []
+        subsection_updates = []
+        for idx, (subsection, row) in enumerate(zip(subsections, matched)):
+            name = subsection.get('name', '')
+            if row is None:
                 cursor.execute('''
-                    INSERT INTO preparation_steps (recipe_id, step_number, description)
+                    INSERT INTO ingredient_subsections (recipe_id, name, sort_order)
                     VALUES (?, ?, ?)
-                ''', (recipe_id, idx + 1, step.get('description', '')))
-            
-            return True
+                ''', (recipe_id, name, idx))
+                subsection_ids.append(cursor.lastrowid)
+            else:
+                if not (_same_value(row['name'], name) and row['sort_order'] == idx):
+                    subsection_updates.append((name, idx, row['id']))
+                subsection_ids.append(row['id'])
+        cursor.executemany('''
+            UPDATE ingredient_subsections SET name = ?, sort_order = ? WHERE id = ?
+        ''', subsection_updates)
+        
+        # Ingredients, matched across the whole recipe so they can move between subsections
+        incoming = []
+        positions = []
+        for subsection_id, subsection in zip(subsection_ids, subsections):
+            for ing_idx, ingredient in enumerate(subsection.get('ingredients', [])):
+                incoming.append((subsection_id, ing_idx, ingredient))
+                positions.append((subsection_id, ing_idx))
+        matched, removed_ingredients = _match_rows(
+            [ingredient for _, _, ingredient in incoming], stored_ingredients,
+            lambda row: (row['subsection_id'], row['sort_order']), positions)
+        
+        names_changed = bool(removed_ingredients)
+        inserts, updates = [], []
+        for (subsection_id, ing_idx, ingredient), row in zip(incoming, matched):
+            values = (
+                subsection_id,
+                ingredient.get('name', ''),
+                ingredient.get('original_quantity', ingredient.get('quantity')),
+                ingredient.get('current_quantity', ingredient.get('quantity')),
+                ingredient.get('unit', ''),
+                ing_idx
+            )
+            if row is None:
+                inserts.append(values)
+                names_changed = True
+                continue
+            stored = (row['subsection_id'], row['name'], row['original_quantity'],
+                      row['current_quantity'], row['unit'], row['sort_order'])
+            if not all(_same_value(a, b) for a, b in zip(stored, values)):
+                updates.append((*values, row['id']))
+                names_changed |= not _same_value(row['name'], values[1])
+        
+        cursor.executemany('''
+            UPDATE ingredients
+            SET subsection_id = ?, name = ?, original_quantity = ?, current_quantity = ?, unit = ?, sort_order = ?
+            WHERE id = ?
+        ''', updates)
+        cursor.executemany('''
+            INSERT INTO ingredients (subsection_id, name, original_quantity, current_quantity, unit, sort_order)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', inserts)
+        cursor.executemany('DELETE FROM ingredients WHERE id = ?',
+                           [(row['id'],) for row in removed_ingredients])
+        # Moved ingredients were re-parented above, so the cascade only hits leftovers
+        cursor.executemany('DELETE FROM ingredient_subsections WHERE id = ?',
+                           [(row['id'],) for row in removed_subsections])
+        return names_changed
+    
+    def _update_steps(self, cursor, recipe_id, steps):
+        """Diff preparation steps against the stored rows. Returns True if any changed."""
+        cursor.execute('''
+            SELECT * FROM preparation_steps WHERE recipe_id = ? ORDER BY step_number, id
+        ''', (recipe_id,))
+        stored_steps = [dict(row) for row in cursor.fetchall()]
+        matched, removed = _match_rows(
+            steps, stored_steps, lambda row: row['step_number'], list(range(1, len(steps) + 1)))
+        
+        inserts, updates = [], []
+        for idx, (step, row) in enumerate(zip(steps, matched)):
+            values = (idx + 1, step.get('description', ''))
+            if row is None:
+                inserts.append((recipe_id, *values))
+            elif not (row['step_number'] == values[0] and _same_value(row['description'], values[1])):
+                updates.append((*values, row['id']))
+        
+        cursor.executemany('''
+            UPDATE preparation_steps SET step_number = ?, description = ? WHERE id = ?
+        ''', updates)
+        cursor.executemany('''
+            INSERT INTO preparation_steps (recipe_id, step_number, description)
+            VALUES (?, ?, ?)
+        ''', inserts)
+        cursor.executemany('DELETE FROM preparation_steps WHERE id = ?', [(row['id'],) for row in removed])
+        return bool(inserts or updates or removed)
     
     def delete_recipe(self, recipe_id):
         """Delete a recipe"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM recipes WHERE id = ?', (recipe_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._reindex_recipes(cursor, [recipe_id])
+                self._bump_version(cursor, ('recipe', recipe_id), deleted=True)
+            return deleted
     
     def update_ingredient_quantities(self, recipe_id, ingredients_data):
-        """Update current quantities for ingredients"""
+        """Update current quantities for ingredients (only those of recipe_id)"""
+        quantities = {ing.get('id'): ing.get('current_quantity') for ing in ingredients_data}
+        self.apply_buffered_writes({recipe_id: {'quantities': quantities, 'portions': None}})
+        return True
+    
+    def update_portions(self, recipe_id, current_portions):
+        """Update current portions for a recipe"""
+        rows = self.apply_buffered_writes({recipe_id: {'quantities': {}, 'portions': current_portions}})
+        return rows > 0
+    
+    def apply_buffered_writes(self, batch):
+        """Write coalesced quantity/portion updates in a single transaction.
+        
+        batch maps recipe_id to {'quantities': {ingredient_id: quantity},
+        'portions': value or None}. Ingredients that do not belong to the
+        given recipe are ignored. Values still queued by the write buffer
+        for the same fields are dropped, so a later flush cannot revert
+        them. Returns the number of rows updated.
+        """
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            for ing in ingredients_data:
+            cursor.executemany('DELETE FROM pending_quantities WHERE ingredient_id = ?',
+                               [(ingredient_id,) for writes in batch.values()
+                                for ingredient_id in writes['quantities']])
+            cursor.executemany('DELETE FROM pending_portions WHERE recipe_id = ?',
+                               [(recipe_id,) for recipe_id, writes in batch.items()
+                                if writes['portions'] is not None])
+            return self._apply_writes(cursor, batch)
+    
+    def _apply_writes(self, cursor, batch):
+        quantity_rows = [
+            (quantity, ingredient_id, recipe_id)
+            for recipe_id, writes in batch.items()
+            for ingredient_id, quantity in writes['quantities'].items()
+        ]
+        portion_rows = [
+            (writes['portions'], recipe_id)
+            for recipe_id, writes in batch.items()
+            if writes['portions'] is not None
+        ]
+        
+        changes_before = cursor.connection.total_changes
+        cursor.executemany('''
+            UPDATE ingredients
+            SET current_quantity = ?
+            WHERE id = ?
+              AND subsection_id IN (SELECT id FROM ingredient_subsections WHERE recipe_id = ?)
+        ''', quantity_rows)
+        cursor.executemany('''
+            UPDATE recipes
+            SET current_portions = ?
+            WHERE id = ?
+        ''', portion_rows)
+        rows = cursor.connection.total_changes - changes_before
+        if rows:
+            self._bump_version(cursor, *[('recipe', recipe_id) for recipe_id in batch])
+        return rows
+    
+    # ============== WRITE BUFFER ==============
+    
+    def queue_writes(self, recipe_id, quantities=None, portions=None):
+        """Queue current quantities ({ingredient_id: quantity}) and portions of a recipe.
+        
+        They wait in the pending tables, shared by all processes, until
+        apply_pending_writes; a newer value replaces the queued one.
+        Ingredients of other recipes are ignored. Returns False if the
+        recipe does not exist.
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if cursor.execute('SELECT 1 FROM recipes WHERE id = ?', (recipe_id,)).fetchone() is None:
+                return False
+            if quantities:
+                cursor.executemany('''
+                    INSERT INTO pending_quantities (ingredient_id, recipe_id, quantity)
+                    SELECT i.id, s.recipe_id, ?
+                    FROM ingredients i
+                    JOIN ingredient_subsections s ON s.id = i.subsection_id
+                    WHERE i.id = ? AND s.recipe_id = ?
+                    ON CONFLICT (ingredient_id) DO UPDATE SET quantity = excluded.quantity
+                ''', [(quantity, ingredient_id, recipe_id) for ingredient_id, quantity in quantities.items()])
+            if portions is not None:
                 cursor.execute('''
-                    UPDATE ingredients
-                    SET current_quantity = ?
-                    WHERE id = ?
-                ''', (ing.get('current_quantity'), ing.get('id')))
+                    INSERT INTO pending_portions (recipe_id, portions) VALUES (?, ?)
+                    ON CONFLICT (recipe_id) DO UPDATE SET portions = excluded.portions
+                ''', (recipe_id, portions))
             return True
     
-    def update_portions(self, recipe_id, current_portions):
-        """Update current portions for a recipe"""
+    def apply_pending_writes(self, recipe_id=None):
+        """Write the queued values (all recipes, or just one) in a single transaction.
+        
+        Returns the number of rows updated. Checks for queued values in a
+        read transaction first, so that readers calling this before every
+        request only take the write lock when there is something to write.
+        """
+        where, params = ('WHERE recipe_id = ?', (recipe_id,)) if recipe_id is not None else ('', ())
+        exists_sql = f'''
+            SELECT EXISTS (SELECT 1 FROM pending_quantities {where})
+                OR EXISTS (SELECT 1 FROM pending_portions {where})
+        '''
+        with self.get_connection(readonly=True) as conn:
+            if not conn.execute(exists_sql, params * 2).fetchone()[0]:
+                return 0
+        
         with self.get_connection() as conn:
+            cursor = conn.cursor()
+            batch = {}
+            cursor.execute(f'SELECT recipe_id, ingredient_id, quantity FROM pending_quantities {where}', params)
+            for row_recipe_id, ingredient_id, quantity in cursor.fetchall():
+                entry = batch.setdefault(row_recipe_id, {'quantities': {}, 'portions': None})
+                entry['quantities'][ingredient_id] = quantity
+            cursor.execute(f'SELECT recipe_id, portions FROM pending_portions {where}', params)
+            for row_recipe_id, portions in cursor.fetchall():
+                batch.setdefault(row_recipe_id, {'quantities': {}, 'portions': None})['portions'] = portions
+            cursor.execute(f'DELETE FROM pending_quantities {where}', params)
+            cursor.execute(f'DELETE FROM pending_portions {where}', params)
+            return self._apply_writes(cursor, batch)
+    
+    def count_pending_recipes(self):
+        """Number of recipes with queued quantity or portion writes"""
+        with self.get_connection(readonly=True) as conn:
+            return conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT recipe_id FROM pending_quantities
+                    UNION SELECT recipe_id FROM pending_portions
+                )
+            ''').fetchone()[0]
+    
+    # ============== SCALING ==============
+    
+    def scale_recipe(self, recipe_id, mode, value, ingredient_id=None):
+        """Scale every current quantity and the portions of a recipe at once.
+        
+        Modes:
+        - 'factor': original quantities times value
+        - 'portions': scale to value portions
+        - 'total_weight': scale the current quantities so they add up to value
+        - 'anchor': scale so that ingredient_id gets quantity value
+        
+        Computed by plan_scale and written in one transaction. Returns the
+        new current_portions and ingredient quantities, or None if the
+        recipe (or the anchor ingredient) is not found. Raises ValueError
+        for an unknown mode or a non-positive value.
+        """
+        result = self.plan_scale(recipe_id, mode, value, ingredient_id=ingredient_id)
+        if result is not None:
+            quantities = {ing['id']: ing['current_quantity'] for ing in result['ingredients']}
+            self.apply_buffered_writes({recipe_id: {'quantities': quantities,
+                                                    'portions': result['current_portions']}})
+        return result
+    
+    def plan_scale(self, recipe_id, mode, value, ingredient_id=None):
+        """The result of scale_recipe, computed without writing it.
+        
+        Quantities queued by the write buffer count as the current ones
+        (total_weight scales them). Lets the caller queue the result as
+        ordinary quantity/portion writes.
+        """
+        if mode not in SCALE_MODES:
+            raise ValueError(f'unknown scale mode: {mode}')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError('scale value must be a number')
+        if value <= 0:
+            raise ValueError('scale value must be positive')
+        
+        with self.get_connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT original_portions FROM recipes WHERE id = ?', (recipe_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            original_portions = row['original_portions'] or 1
+            cursor.execute('''
+                SELECT i.id, i.original_quantity,
+                       CASE WHEN p.ingredient_id IS NULL THEN i.current_quantity
+                            ELSE p.quantity END AS current_quantity
+                FROM ingredients i
+                JOIN ingredient_subsections s ON s.id = i.subsection_id
+                LEFT JOIN pending_quantities p ON p.ingredient_id = i.id
+                WHERE s.recipe_id = ?
+                ORDER BY s.sort_order, i.sort_order
+            ''', (recipe_id,))
+            ingredients = [dict(ing) for ing in cursor.fetchall()]
+        
+        if mode == 'total_weight':
+            total = sum(ing['current_quantity'] or 0 for ing in ingredients)
+            if total <= 0:
+                raise ValueError('recipe has no quantities to scale')
+            for ing in ingredients:
+                if ing['current_quantity'] and ing['current_quantity'] > 0:
+                    ing['current_quantity'] = _round_quantity(ing['current_quantity'] * (value / total))
+            # Portions follow the ratio of the first scalable ingredient
+            factor = next((ing['current_quantity'] / ing['original_quantity'] for ing in ingredients
+                           if (ing['original_quantity'] or 0) > 0 and (ing['current_quantity'] or 0) > 0), 1)
+        else:
+            if mode == 'factor':
+                factor = value
+            elif mode == 'portions':
+                factor = value / original_portions
+            else:
+                anchor = next((ing for ing in ingredients if str(ing['id']) == str(ingredient_id)), None)
+                if not anchor:
+                    return None
+                if not anchor['original_quantity'] or anchor['original_quantity'] <= 0:
+                    raise ValueError('anchor ingredient has no original quantity')
+                factor = value / anchor['original_quantity']
+            for ing in ingredients:
+                if ing['original_quantity'] and ing['original_quantity'] > 0:
+                    ing['current_quantity'] = _round_quantity(ing['original_quantity'] * factor)
+        
+        current_portions = value if mode == 'portions' else round(original_portions * factor, 2)
+        return {
+            'current_portions': current_portions,
+            'ingredients': [{'id': ing['id'], 'current_quantity': ing['current_quantity']}
+                            for ing in ingredients]
+        }
+    
+    # ============== SEARCH ==============
+    
+    def _reindex_recipes(self, cursor, recipe_ids):
+        """Refresh the full-text index for the given recipes (deleted ones are dropped)"""
+        recipe_ids = list(recipe_ids)
+        for start in range(0, len(recipe_ids), MAX_SQL_PARAMS):
+            chunk = recipe_ids[start:start + MAX_SQL_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(f'DELETE FROM recipes_fts WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(FTS_REINDEX_SQL.format(where=f'WHERE r.id IN ({placeholders})'), chunk)
+    
+    def search_recipes(self, query, category_id=None, limit=50):
+        """Full-text search over names, descriptions, ingredients and steps.
+        
+        Every word is matched as a prefix, ignoring accents. Results are ranked
+        with BM25 (name matches weigh most) and carry an HTML-safe snippet with
+        the matched terms wrapped in <mark>.
+        """
+        match = _fts_query(query)
+        if not match:
+            return []
+        
+        sql = '''
+            SELECT r.id, r.name, r.photo_url, r.category_id, c.name as category_name,
+                   snippet(recipes_fts, -1, ?, ?, '…', 10) as snippet
+            FROM recipes_fts
+            JOIN recipes r ON r.id = recipes_fts.rowid
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE recipes_fts MATCH ?
+        '''
+        params = [SNIPPET_START, SNIPPET_END, match]
+        if category_id:
+            sql += ' AND r.category_id = ?'
+            params.append(category_id)
+        sql += ' ORDER BY bm25(recipes_fts, 10.0, 4.0, 2.0, 1.0) LIMIT ?'
+        params.append(limit)
+        
+        with self.get_connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            results = []
+            for row in cursor.fetchall():
+                result = dict(row)
+                result['snippet'] = _snippet_html(result['snippet'])
+                results.append(result)
+            return results
+    
+    # ============== PHOTOS ==============
+    
+    def get_photo_refcounts(self):
+        """Number of recipes using each photo URL"""
+        with self.get_connection(readonly=True) as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE recipes
-                SET current_portions = ?
-                WHERE id = ?
-            ''', (current_portions, recipe_id))
-            return cursor.rowcount > 0
+                SELECT photo_url, COUNT(*) FROM recipes
+                WHERE photo_url IS NOT NULL AND photo_url != ''
+                GROUP BY photo_url
+            ''')
+            return {row[0]: row[1] for row in cursor.fetchall()}
     
     # ============== CATEGORIES ==============
     
     def get_all_categories(self):
-        """Get all categories"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM categories ORDER BY name')
-            return [dict(row) for row in cursor.fetchall()]
+        """Get all categories (cached)"""
+        with self.get_connection(readonly=True) as conn:
+            return self._cached(conn, ('categories',), self._query_categories)
+    
+    def _query_categories(self, cursor):
+        return _fetch_dicts(cursor, 'SELECT * FROM categories ORDER BY name')
     
     def create_category(self, name):
         """Create a new category"""
@@ -403,6 +1383,7 @@ class Database:
             cursor = conn.cursor()
             try:
                 cursor.execute('INSERT INTO categories (name) VALUES (?)', (name,))
+                self._bump_version(cursor, ('categories',))
                 return cursor.lastrowid
             except sqlite3.IntegrityError:
                 return None
@@ -411,17 +1392,24 @@ class Database:
         """Delete a category"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Their cached trees carry the category name
+            cursor.execute('SELECT id FROM recipes WHERE category_id = ?', (category_id,))
+            recipe_keys = [('recipe', row[0]) for row in cursor.fetchall()]
             cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._bump_version(cursor, ('categories',), *recipe_keys)
+            return deleted
     
     # ============== UNITS ==============
     
     def get_all_units(self):
-        """Get all units"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM units ORDER BY name')
-            return [dict(row) for row in cursor.fetchall()]
+        """Get all units (cached)"""
+        with self.get_connection(readonly=True) as conn:
+            return self._cached(conn, ('units',), self._query_units)
+    
+    def _query_units(self, cursor):
+        return _fetch_dicts(cursor, 'SELECT * FROM units ORDER BY name')
     
     def create_unit(self, name, abbreviation):
         """Create a new unit"""
@@ -431,6 +1419,7 @@ class Database:
             cursor = conn.cursor()
             try:
                 cursor.execute('INSERT INTO units (name, abbreviation) VALUES (?, ?)', (name, abbreviation))
+                self._bump_version(cursor, ('units',))
                 return cursor.lastrowid
             except sqlite3.IntegrityError:
                 return None
@@ -440,19 +1429,38 @@ class Database:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM units WHERE id = ?', (unit_id,))
-            return cursor.rowcount > 0
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._bump_version(cursor, ('units',))
+            return deleted
     
     # ============== SETTINGS ==============
     
     def get_settings(self):
-        """Get all settings"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM settings')
-            settings = {}
-            for row in cursor.fetchall():
-                settings[row['key']] = row['value']
-            return settings
+        """Get all settings (cached: do not modify the result)"""
+        with self.get_connection(readonly=True) as conn:
+            return self._cached(conn, ('settings',), self._query_settings)
+    
+    def _query_settings(self, cursor):
+        cursor.execute('SELECT * FROM settings')
+        settings = {}
+        for row in cursor.fetchall():
+            settings[row['key']] = row['value']
+        return settings
+    
+    # ============== BOOTSTRAP ==============
+    
+    def get_bootstrap(self, fields=None, limit=None):
+        """Everything the main page needs at startup, read from one snapshot:
+        settings, categories, units and the first page of the recipe list.
+        """
+        with self.get_connection(readonly=True) as conn:
+            return {
+                'settings': self._cached(conn, ('settings',), self._query_settings),
+                'categories': self._cached(conn, ('categories',), self._query_categories),
+                'units': self._cached(conn, ('units',), self._query_units),
+                'recipes': self._query_recipes(conn.cursor(), fields=fields, limit=limit)
+            }
     
     def update_settings(self, settings_dict):
         """Update settings"""
@@ -462,144 +1470,507 @@ class Database:
                 cursor.execute('''
                     INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)
                 ''', (key, value))
+            self._bump_version(cursor, ('settings',))
             return True
     
+    # ============== DELTA SYNC ==============
+    
+    def get_changes(self, since):
+        """What changed after data version `since`, read from one snapshot.
+        
+        Returns {'version', 'reset', 'recipes', 'deleted'} plus 'categories',
+        'units' and 'settings' when those changed. 'recipes' are full trees
+        (as get_recipe) and 'deleted' the ids of removed recipes. When the
+        change log cannot tell what changed since then (a client that synced
+        before the oldest logged version, a restore, maintenance) 'reset' is
+        True and everything is returned: the client replaces its copy.
+        """
+        with self.get_connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            version = cursor.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+            changes = {'version': version, 'reset': False, 'recipes': [], 'deleted': []}
+            if since == version:
+                return changes
+            
+            rows = self._query_changed(cursor, since, version)
+            if rows is None:
+                changes['reset'] = True
+                changes['recipes'] = self._query_all_recipe_trees(cursor)
+                kinds = {'categories', 'units', 'settings'}
+            else:
+                kinds = {row['kind'] for row in rows}
+                for row in rows:
+                    if row['kind'] != 'recipe':
+                        continue
+                    recipe_id = row['entity_id']
+                    recipe = None
+                    if not row['deleted']:
+                        recipe = self._cached(conn, ('recipe', recipe_id),
+                                              lambda cursor: self._query_recipe(cursor, recipe_id))
+                    if recipe is None:
+                        changes['deleted'].append(recipe_id)
+                    else:
+                        changes['recipes'].append(recipe)
+            
+            if 'categories' in kinds:
+                changes['categories'] = self._cached(conn, ('categories',), self._query_categories)
+            if 'units' in kinds:
+                changes['units'] = self._cached(conn, ('units',), self._query_units)
+            if 'settings' in kinds:
+                changes['settings'] = self._cached(conn, ('settings',), self._query_settings)
+            return changes
+    
+    def _query_changed(self, cursor, since, version):
+        """Change log rows after `since`, one per changed entity (None if the log cannot tell)"""
+        if since <= 0 or since > version:
+            return None
+        oldest = cursor.execute('SELECT MIN(version) FROM change_log').fetchone()[0]
+        if oldest is None or since < oldest - 1:
+            return None
+        cursor.execute('''
+            SELECT kind, entity_id, MAX(deleted) AS deleted
+            FROM change_log WHERE version > ?
+            GROUP BY kind, entity_id
+        ''', (since,))
+        rows = cursor.fetchall()
+        if any(row['kind'] == 'all' for row in rows):
+            return None
+        return rows
+    
+    def get_change_summary(self, since):
+        """Compact form of get_changes for the live event stream.
+        
+        Instead of full trees, each changed recipe is reported with what a
+        device needs to follow scaling in place: {'id', 'updated_at',
+        'current_portions', 'quantities': {ingredient id: current quantity}}.
+        A changed updated_at means the recipe itself was edited. Changed
+        lookup tables are listed by name in 'lookups'.
+        """
+        with self.get_connection(readonly=True) as conn:
+            cursor = conn.cursor()
+            version = cursor.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]
+            summary = {'version': version, 'since': since, 'reset': False,
+                       'recipes': [], 'deleted': [], 'lookups': []}
+            if since == version:
+                return summary
+            rows = self._query_changed(cursor, since, version)
+            if rows is None:
+                summary['reset'] = True
+                return summary
+            
+            changed = []
+            for row in rows:
+                if row['kind'] != 'recipe':
+                    summary['lookups'].append(row['kind'])
+                elif row['deleted']:
+                    summary['deleted'].append(row['entity_id'])
+                else:
+                    changed.append(row['entity_id'])
+            
+            recipes = {}
+            for start in range(0, len(changed), MAX_SQL_PARAMS):
+                chunk = changed[start:start + MAX_SQL_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'''
+                    SELECT id, updated_at, current_portions FROM recipes WHERE id IN ({placeholders})
+                ''', chunk)
+                for row in cursor.fetchall():
+                    recipes[row['id']] = dict(row, quantities={})
+                cursor.execute(f'''
+                    SELECT s.recipe_id, i.id, i.current_quantity
+                    FROM ingredients i
+                    JOIN ingredient_subsections s ON s.id = i.subsection_id
+                    WHERE s.recipe_id IN ({placeholders})
+                ''', chunk)
+                for recipe_id, ingredient_id, quantity in cursor.fetchall():
+                    recipes[recipe_id]['quantities'][ingredient_id] = quantity
+            summary['recipes'] = list(recipes.values())
+            # Missing without a tombstone should not happen, but is a deletion all the same
+            summary['deleted'].extend(recipe_id for recipe_id in changed if recipe_id not in recipes)
+            return summary
+    
+    def _query_all_recipe_trees(self, cursor):
+        """Every recipe with its details, EXPORT_BATCH_SIZE recipes per query"""
+        recipes = []
+        last_id = 0
+        while True:
+            cursor.execute('''
+                SELECT r.*, c.name as category_name
+                FROM recipes r
+                LEFT JOIN categories c ON r.category_id = c.id
+                WHERE r.id > ?
+                ORDER BY r.id
+                LIMIT ?
+            ''', (last_id, EXPORT_BATCH_SIZE))
+            batch = [dict(row) for row in cursor.fetchall()]
+            if not batch:
+                return recipes
+            self._attach_details(cursor, batch)
+            recipes.extend(batch)
+            last_id = batch[-1]['id']
+    
     # ============== IMPORT/EXPORT ==============
     
     def export_all_data(self):
         """Export all data for backup"""
-        with self.get_connection() as conn:
+        data = {'recipes': []}
+        for kind, payload in self.iter_export():
+            if kind == 'recipe':
+                data['recipes'].append(payload)
+            elif kind == 'meta':
+                data.update(payload)
+            else:
+                data[kind] = payload
+        return data
+    
+    def iter_export(self):
+        """Yield the backup as (kind, payload) records, from a single snapshot.
+        
+        Yields 'meta', 'categories', 'units' and 'settings' first, then one
+        'recipe' record per recipe (with subsections, ingredients and steps)
+        in id order. Recipes are read EXPORT_BATCH_SIZE at a time, so memory
+        use does not grow with the collection.
+        """
+        with self.get_connection(readonly=True) as conn:
             cursor = conn.cursor()
             
-            # Export recipes with full details
-            recipes = []
-            cursor.execute('SELECT * FROM recipes')
-            for recipe_row in cursor.fetchall():
-                recipe = dict(recipe_row)
-                recipe_id = recipe['id']
-                
-                # Get subsections and ingredients
-                cursor.execute('SELECT * FROM ingredient_subsections WHERE recipe_id = ? ORDER BY sort_order', (recipe_id,))
-                subsections = []
-                for sub_row in cursor.fetchall():
-                    subsection = dict(sub_row)
-                    cursor.execute('SELECT * FROM ingredients WHERE subsection_id = ? ORDER BY sort_order', (subsection['id'],))
-                    subsection['ingredients'] = [dict(ing) for ing in cursor.fetchall()]
-                    subsections.append(subsection)
-                recipe['subsections'] = subsections
-                
-                # Get steps
-                cursor.execute('SELECT * FROM preparation_steps WHERE recipe_id = ? ORDER BY step_number', (recipe_id,))
-                recipe['steps'] = [dict(step) for step in cursor.fetchall()]
-                
-                recipes.append(recipe)
+            yield 'meta', {'version': '1.0', 'exported_at': datetime.now().isoformat()}
             
-            # Export categories
             cursor.execute('SELECT * FROM categories')
-            categories = [dict(row) for row in cursor.fetchall()]
+            yield 'categories', [dict(row) for row in cursor.fetchall()]
             
-            # Export units
             cursor.execute('SELECT * FROM units')
-            units = [dict(row) for row in cursor.fetchall()]
+            yield 'units', [dict(row) for row in cursor.fetchall()]
             
-            # Export settings
-            settings = self.get_settings()
+            yield 'settings', self._query_settings(cursor)
             
-            return {
-                'version': '1.0',
-                'exported_at': datetime.now().isoformat(),
-                'recipes': recipes,
-                'categories': categories,
-                'units': units,
-                'settings': settings
-            }
+            last_id = 0
+            while True:
+                cursor.execute('SELECT * FROM recipes WHERE id > ? ORDER BY id LIMIT ?',
+                               (last_id, EXPORT_BATCH_SIZE))
+                recipes = [dict(row) for row in cursor.fetchall()]
+                if not recipes:
+                    break
+                self._attach_details(cursor, recipes)
+                for recipe in recipes:
+                    yield 'recipe', recipe
+                last_id = recipes[-1]['id']
     
     def import_data(self, data):
-        """Import data from backup"""
+        """Import data from backup, all or nothing: a failure leaves the database as it was"""
+        records = [(kind, data.get(kind)) for kind in ('categories', 'units', 'settings') if data.get(kind)]
+        records += [('recipe', recipe) for recipe in data.get('recipes', [])]
         try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Import categories
-                for cat in data.get('categories', []):
-                    cursor.execute('INSERT OR IGNORE INTO categories (name) VALUES (?)', (cat.get('name'),))
-                
-                # Import units
-                for unit in data.get('units', []):
-                    cursor.execute('INSERT OR IGNORE INTO units (name, abbreviation) VALUES (?, ?)',
-                                   (unit.get('name'), unit.get('abbreviation')))
-                
-                # Import settings
-                for key, value in data.get('settings', {}).items():
-                    cursor.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
-                
-                # Import recipes
-                for recipe in data.get('recipes', []):
-                    # Check if recipe with same name exists
-                    cursor.execute('SELECT id FROM recipes WHERE name = ?', (recipe.get('name'),))
-                    existing = cursor.fetchone()
-                    
-                    if existing:
-                        # Update existing recipe
-                        recipe_id = existing['id']
-                        cursor.execute('''
-                            UPDATE recipes SET description = ?, creation_date = ?, preparation_time = ?,
-                            photo_url = ?, category_id = ?, updated_at = CURRENT_TIMESTAMP
-                            WHERE id = ?
-                        ''', (
-                            recipe.get('description'),
-                            recipe.get('creation_date'),
-                            recipe.get('preparation_time'),
-                            recipe.get('photo_url'),
-                            recipe.get('category_id'),
-                            recipe_id
-                        ))
-                        cursor.execute('DELETE FROM ingredient_subsections WHERE recipe_id = ?', (recipe_id,))
-                        cursor.execute('DELETE FROM preparation_steps WHERE recipe_id = ?', (recipe_id,))
-                    else:
-                        # Insert new recipe
-                        cursor.execute('''
-                            INSERT INTO recipes (name, description, creation_date, preparation_time, photo_url, category_id)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (
-                            recipe.get('name'),
-                            recipe.get('description'),
-                            recipe.get('creation_date'),
-                            recipe.get('preparation_time'),
-                            recipe.get('photo_url'),
-                            recipe.get('category_id')
-                        ))
-                        recipe_id = cursor.lastrowid
-                    
-                    # Insert subsections and ingredients
-                    for idx, subsection in enumerate(recipe.get('subsections', [])):
-                        cursor.execute('''
-                            INSERT INTO ingredient_subsections (recipe_id, name, sort_order)
-                            VALUES (?, ?, ?)
-                        ''', (recipe_id, subsection.get('name', ''), idx))
-                        subsection_id = cursor.lastrowid
-                        
-                        for ing_idx, ingredient in enumerate(subsection.get('ingredients', [])):
-                            cursor.execute('''
-                                INSERT INTO ingredients (subsection_id, name, original_quantity, current_quantity, unit, sort_order)
-                                VALUES (?, ?, ?, ?, ?, ?)
-                            ''', (
-                                subsection_id,
-                                ingredient.get('name', ''),
-                                ingredient.get('original_quantity'),
-                                ingredient.get('current_quantity', ingredient.get('original_quantity')),
-                                ingredient.get('unit', ''),
-                                ing_idx
-                            ))
-                    
-                    # Insert steps
-                    for idx, step in enumerate(recipe.get('steps', [])):
-                        cursor.execute('''
-                            INSERT INTO preparation_steps (recipe_id, step_number, description)
-                            VALUES (?, ?, ?)
-                        ''', (recipe_id, idx + 1, step.get('description', '')))
-            
+                self.import_records(records, conn=conn)
             return True
         except Exception as e:
             print(f"Import error: {e}")
             return False
+    
+    def import_records(self, records, progress=None, conn=None):
+        """Import a stream of backup records (as produced by iter_export).
+        
+        Categories, units and settings are applied as they arrive; recipes
+        are collected into batches of IMPORT_BATCH_SIZE, each written with
+        executemany in its own transaction, so other writers get the lock
+        between batches and memory stays flat. A failure keeps the batches
+        already written. Given a write connection `conn`, everything is
+        written in its transaction instead. Recipes are matched to
+        existing ones by name (updated in place) through a name -> id map
+        loaded once. progress(recipes_done) is called after every batch.
+        Returns the number of recipes imported.
+        """
+        with self._import_transaction(conn, readonly=True) as read_conn:
+            cursor = read_conn.cursor()
+            cursor.execute('SELECT id, name FROM recipes')
+            recipe_ids = {row['name']: row['id'] for row in cursor.fetchall()}
+            cursor.execute('SELECT id FROM categories')
+            # Without categories in the backup, its category ids are taken as local ids
+            category_ids = {row['id']: row['id'] for row in cursor.fetchall()}
+        
+        done = 0
+        batch = []
+        for kind, payload in records:
+            if kind == 'recipe':
+                batch.append(payload)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    done += self._import_recipe_batch(batch, recipe_ids, category_ids, conn)
+                    batch = []
+                    if progress:
+                        progress(done)
+            elif kind in ('categories', 'units', 'settings'):
+                with self._import_transaction(conn) as write_conn:
+                    cursor = write_conn.cursor()
+                    if kind == 'categories':
+                        category_ids = self._import_categories(cursor, payload)
+                    elif kind == 'units':
+                        cursor.executemany(
+                            'INSERT OR IGNORE INTO units (name, abbreviation) VALUES (?, ?)',
+                            [(unit.get('name'), unit.get('abbreviation')) for unit in payload])
+                    else:
+                        cursor.executemany(
+                            'INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)',
+                            list(payload.items()))
+                    self._bump_version(cursor, (kind,))
+        if batch:
+            done += self._import_recipe_batch(batch, recipe_ids, category_ids, conn)
+        if progress:
+            progress(done)
+        return done
+    
+    def _import_categories(self, cursor, categories):
+        """Insert missing categories, returns backup id -> local id"""
+        cursor.executemany('INSERT OR IGNORE INTO categories (name) VALUES (?)',
+                           [(cat.get('name'),) for cat in categories])
+        # Category ids in the backup refer to the exporting database:
+        # map them to local ids by name so foreign keys stay valid
+        cursor.execute('SELECT id, name FROM categories')
+        local_ids = {row['name']: row['id'] for row in cursor.fetchall()}
+        category_ids = {}
+        for cat in categories:
+            if cat.get('id') is not None:
+                category_ids[cat['id']] = local_ids.get(cat.get('name'))
+        if not category_ids:
+            category_ids = {cid: cid for cid in local_ids.values()}
+        return category_ids
+    
+    def _next_id(self, cursor, table):
+        """Id AUTOINCREMENT would assign next, so rows can be inserted with executemany"""
+        cursor.execute(f'''
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                       COALESCE((SELECT MAX(id) FROM {table}), 0)) + 1
+        ''', (table,))
+        return cursor.fetchone()[0]
+    
+    def _import_transaction(self, conn, readonly=False):
+        """The import's own connection if it has one, else a new transaction"""
+        if conn is not None:
+            return nullcontext(conn)
+        return self.get_connection(readonly=readonly)
+    
+    def _import_recipe_batch(self, recipes, recipe_ids, category_ids, conn=None):
+        """Write one batch of imported recipes in a single transaction (or in conn's)"""
+        with self._import_transaction(conn) as write_conn:
+            cursor = write_conn.cursor()
+            next_recipe_id = self._next_id(cursor, 'recipes')
+            
+            # Resolve ids first: a name seen twice keeps its last version
+            pending = {}
+            existing = set(recipe_ids.values())
+            for recipe in recipes:
+                name = recipe.get('name')
+                recipe_id = recipe_ids.get(name)
+                if recipe_id is None:
+                    recipe_id = recipe_ids[name] = next_recipe_id
+                    next_recipe_id += 1
+                pending[recipe_id] = recipe
+            
+            updated = [rid for rid in pending if rid in existing]
+            new = [rid for rid in pending if rid not in existing]
+            
+            cursor.executemany('''
+                UPDATE recipes SET description = ?, creation_date = ?, preparation_time = ?,
+                photo_url = ?, category_id = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(
+                pending[rid].get('description'),
+                pending[rid].get('creation_date'),
+                pending[rid].get('preparation_time'),
+                pending[rid].get('photo_url'),
+                category_ids.get(pending[rid].get('category_id')),
+                rid
+            ) for rid in updated])
+            cursor.executemany('DELETE FROM ingredient_subsections WHERE recipe_id = ?', [(rid,) for rid in updated])
+            cursor.executemany('DELETE FROM preparation_steps WHERE recipe_id = ?', [(rid,) for rid in updated])
+            
+            cursor.executemany('''
+                INSERT INTO recipes (id, name, description, creation_date, preparation_time, photo_url, category_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                rid,
+                pending[rid].get('name'),
+                pending[rid].get('description'),
+                pending[rid].get('creation_date'),
+                pending[rid].get('preparation_time'),
+                pending[rid].get('photo_url'),
+                category_ids.get(pending[rid].get('category_id'))
+            ) for rid in new])
+            
+            # Subsections get explicit ids so their ingredients can be batched too
+            subsection_id = self._next_id(cursor, 'ingredient_subsections')
+            subsections, ingredients, steps = [], [], []
+            for rid, recipe in pending.items():
+                for idx, subsection in enumerate(recipe.get('subsections', [])):
+                    subsections.append((subsection_id, rid, subsection.get('name', ''), idx))
+                    for ing_idx, ingredient in enumerate(subsection.get('ingredients', [])):
+                        ingredients.append((
+                            subsection_id,
+                            ingredient.get('name', ''),
+                            ingredient.get('original_quantity'),
+                            ingredient.get('current_quantity', ingredient.get('original_quantity')),
+                            ingredient.get('unit', ''),
+                            ing_idx
+                        ))
+                    subsection_id += 1
+                for idx, step in enumerate(recipe.get('steps', [])):
+                    steps.append((rid, idx + 1, step.get('description', '')))
+            
+            cursor.executemany('''
+                INSERT INTO ingredient_subsections (id, recipe_id, name, sort_order)
+                VALUES (?, ?, ?, ?)
+            ''', subsections)
+            cursor.executemany('''
+                INSERT INTO ingredients (subsection_id, name, original_quantity, current_quantity, unit, sort_order)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ingredients)
+            cursor.executemany('''
+                INSERT INTO preparation_steps (recipe_id, step_number, description)
+                VALUES (?, ?, ?)
+            ''', steps)
+            
+            self._reindex_recipes(cursor, pending.keys())
+            self._bump_version(cursor, *[('recipe', recipe_id) for recipe_id in pending])
+        return len(recipes)
+    
+    # ============== MAINTENANCE ==============
+    
+    def file_size(self):
+        """Size in bytes of the database file plus its write-ahead log"""
+        return sum(self._file_sizes())
+    
+    def _file_sizes(self):
+        """Sizes in bytes of the database file and of its write-ahead log"""
+        sizes = []
+        for suffix in ('', '-wal'):
+            try:
+                sizes.append(os.path.getsize(self.db_path + suffix))
+            except OSError:
+                sizes.append(0)
+        return tuple(sizes)
+    
+    def compact(self):
+        """Delete orphaned rows, then VACUUM and ANALYZE the database.
+        
+        Orphans are left behind by databases written before foreign keys
+        were enforced. Returns a report with the rows removed per table, the
+        database file size before and after (measured with the write-ahead
+        log checkpointed, so bytes_reclaimed is what VACUUM freed) and the
+        size of the write-ahead log that was truncated.
+        """
+        wal_before = self._file_sizes()[1]
+        conn = self._write_pool.acquire()
+        try:
+            # Fold the log into the file first, so that its size is not counted as reclaimed
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            self._write_pool.release(conn)
+        bytes_before = self._file_sizes()[0]
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            deleted = {}
+            # Ingredients first, so rows removed by the subsection cascade are counted too
+            cursor.execute('''
+                DELETE FROM ingredients
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM ingredient_subsections s
+                    JOIN recipes r ON r.id = s.recipe_id
+                    WHERE s.id = ingredients.subsection_id
+                )
+            ''')
+            deleted['ingredients'] = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM ingredient_subsections
+                WHERE NOT EXISTS (SELECT 1 FROM recipes r WHERE r.id = ingredient_subsections.recipe_id)
+            ''')
+            deleted['ingredient_subsections'] = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM preparation_steps
+                WHERE NOT EXISTS (SELECT 1 FROM recipes r WHERE r.id = preparation_steps.recipe_id)
+            ''')
+            deleted['preparation_steps'] = cursor.rowcount
+            cursor.execute('''
+                UPDATE recipes SET category_id = NULL
+                WHERE category_id IS NOT NULL
+                  AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.id = recipes.category_id)
+            ''')
+            deleted['recipe_categories'] = cursor.rowcount
+            if any(deleted.values()):
+                self._bump_version(cursor)
+        
+        # VACUUM cannot run inside a transaction, so use a bare pooled connection
+        conn = self._write_pool.acquire()
+        try:
+            conn.execute('VACUUM')
+            conn.execute('ANALYZE')
+            conn.execute('PRAGMA optimize')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            self._write_pool.release(conn)
+        
+        bytes_after, wal_after = self._file_sizes()
+        return {
+            'orphans_deleted': deleted,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'bytes_reclaimed': bytes_before - bytes_after,
+            'wal_bytes_truncated': wal_before - wal_after
+        }
+    
+    # ============== BACKUP ==============
+    
+    def backup_to(self, dest_path, pages=256, pause=0.0):
+        """Copy the live database to dest_path with the SQLite backup API.
+        
+        The copy is taken from a single read snapshot, `pages` pages at a
+        time with a `pause` (seconds) between steps, so requests keep being
+        served while it runs.
+        """
+        src = sqlite3.connect(self.db_path, isolation_level=None)
+        dest = sqlite3.connect(dest_path)
+        try:
+            # An open read transaction pins the snapshot: writes committed
+            # meanwhile would otherwise restart the copy from scratch
+            src.execute('BEGIN')
+            src.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()
+            
+            def throttle(status, remaining, total):
+                time.sleep(pause)
+            
+            src.backup(dest, pages=pages, progress=throttle if pause else None)
+            src.execute('COMMIT')
+        finally:
+            dest.close()
+            src.close()
+    
+    def restore_from(self, snapshot_path):
+        """Replace the whole database with a snapshot file, in place.
+        
+        The snapshot is copied over the live file with the backup API, so
+        pooled connections stay valid and see the restored data. Older
+        snapshots are migrated, and the data version moves forward so
+        clients drop what they cached.
+        """
+        version, _ = self.get_data_version()
+        src = sqlite3.connect(snapshot_path)
+        try:
+            conn = self._write_pool.acquire()
+            try:
+                src.backup(conn)
+            finally:
+                self._write_pool.release(conn)
+        finally:
+            src.close()
+        
+        self.init_database()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE data_version SET version = MAX(version, ?) + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+                RETURNING version
+            ''', (version,))
+            # The snapshot's change log describes another history: clients resync
+            self._log_changes(cursor, cursor.fetchall()[0][0], None)
+        self.cache.clear()
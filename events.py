@@ -0,0 +1,289 @@
+"""
+Live change events for Recipe Book
+Server-Sent Events fan-out: a single thread per process writes every
+change to all devices listening on /api/events
+"""
+
+import os
+import time
+import queue
+import socket
+import selectors
+import threading
+from json_provider import dumps
+from background import PerProcess, start_thread
+
+# Seconds between data version checks, which pick up writes made by
+# other worker processes (writes of this process are sent at once)
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+
+# Seconds of silence after which a comment line is sent, so proxies and
+# phones do not consider the stream dead
+EVENTS_KEEPALIVE = 20
+
+# Milliseconds browsers wait before reconnecting a dropped stream
+EVENTS_RETRY_MS = 2000
+
+# Bytes a subscriber may fall behind by before it is disconnected
+EVENTS_MAX_BACKLOG = 256 * 1024
+
+EVENTS_PATH = '/api/events'
+
+# Response head written by the hub on connections handed over by the
+# gunicorn worker (the body is open-ended: the stream ends when either side closes)
+STREAM_HEAD = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/event-stream; charset=utf-8\r\n'
+    b'Cache-Control: no-cache\r\n'
+    b'X-Accel-Buffering: no\r\n'
+    b'Connection: close\r\n'
+    b'\r\n'
+)
+
+KEEPALIVE_MESSAGE = b': keepalive\n\n'
+
+
+def parse_since(last_event_id, since):
+    """Data version a client has seen: the Last-Event-ID of a reconnecting
+    EventSource, else ?since=, else None (send only future changes)"""
+    for value in (last_event_id, since):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def format_event(summary):
+    """A change summary (see Database.get_change_summary) as an SSE message"""
+    return f"id: {summary['version']}\nevent: change\ndata: {dumps(summary)}\n\n".encode('utf-8')
+
+
+class _SocketSubscriber:
+    """A connection taken over from the server: written without blocking"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.backlog = bytearray()
+
+    def send(self, data):
+        """Queue and write what the socket accepts; False once the subscriber is gone"""
+        self.backlog += data
+        if len(self.backlog) > EVENTS_MAX_BACKLOG:
+            return False
+        try:
+            sent = self.sock.send(self.backlog)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        del self.backlog[:sent]
+        return True
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class _QueueSubscriber:
+    """A streaming WSGI response (development server): the request thread reads the queue"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.closed = False
+
+    def send(self, data):
+        if self.closed:
+            return False
+        self.queue.put(data)
+        return True
+
+    def close(self):
+        self.closed = True
+        self.queue.put(None)
+
+
+class EventHub:
+    """Sends change summaries to every subscriber of this process.
+
+    One thread owns all subscriber connections: it waits on them with a
+    selector, so an idle device costs a socket, not a worker thread. It
+    wakes up when this process commits a write (notify) and every
+    `poll_interval` seconds to check the data version for writes of
+    other processes; each change is summarized once and written to all.
+    Subscribers are added on the hub thread too, after it caught up, so
+    a device that reconnects with the last version it saw misses nothing.
+    """
+
+    def __init__(self, db, poll_interval=EVENTS_POLL_INTERVAL):
+        self.db = db
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._thread = PerProcess(self._start)
+        self._joining = []
+        self._subscribers = set()
+        self._version = None
+        self._last_sent = 0.0
+        self._selector = None
+        self._wake_r = self._wake_w = None
+        self._stats = {'events_sent': 0, 'subscribers_dropped': 0}
+
+    # ============== SUBSCRIBING ==============
+
+    def attach(self, sock, since=None):
+        """Take over a client connection (from the gunicorn worker) and stream to it"""
+        sock.setblocking(False)
+        self._join(_SocketSubscriber(sock), since)
+
+    def stream(self, since=None):
+        """Streaming response body for servers that cannot hand over the connection"""
+        subscriber = _QueueSubscriber()
+        self._join(subscriber, since)
+        try:
+            while True:
+                try:
+                    data = subscriber.queue.get(timeout=EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    data = KEEPALIVE_MESSAGE
+                if data is None:
+                    return
+                yield data
+        finally:
+            subscriber.closed = True
+            self._wake()
+
+    def _join(self, subscriber, since):
+        self._thread.get()
+        with self._lock:
+            self._joining.append((subscriber, since))
+        self._wake()
+
+    def notify(self, version=None):
+        """A write was committed in this process (Database.on_change)"""
+        if self._thread.started:
+            self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (AttributeError, OSError):
+            # Not started, or the wake-up pipe is full: it is awake anyway
+            pass
+
+    # ============== HUB THREAD ==============
+
+    def _start(self):
+        """Start the hub thread of this process"""
+        with self._lock:
+            # Subscribers inherited from the parent belong to its thread
+            self._subscribers = set()
+            self._joining = []
+        self._version = None
+        self._last_sent = time.monotonic()
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        return start_thread(self._run, 'event-hub')
+
+    def _run(self):
+        while True:
+            try:
+                self._step()
+            except Exception as e:
+                print(f"Event hub error: {e}")
+                time.sleep(self.poll_interval)
+
+    def _step(self):
+        for key, mask in self._selector.select(timeout=min(self.poll_interval, EVENTS_KEEPALIVE)):
+            if key.fileobj is self._wake_r:
+                try:
+                    while self._wake_r.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            subscriber = key.data
+            if mask & selectors.EVENT_READ:
+                # Clients send nothing after the request: data or EOF means it is gone
+                try:
+                    subscriber.sock.recv(4096)
+                    gone = True
+                except BlockingIOError:
+                    gone = False
+                except OSError:
+                    gone = True
+                if gone:
+                    self._drop(subscriber)
+                    continue
+            if mask & selectors.EVENT_WRITE:
+                self._deliver(subscriber, b'')
+
+        for subscriber in [s for s in self._subscribers if getattr(s, 'closed', False)]:
+            self._drop(subscriber)
+        self._broadcast_changes()
+        with self._lock:
+            joining, self._joining = self._joining, []
+        for subscriber, since in joining:
+            self._add(subscriber, since)
+        if self._subscribers and time.monotonic() - self._last_sent >= EVENTS_KEEPALIVE:
+            self._send_all(KEEPALIVE_MESSAGE)
+
+    def _broadcast_changes(self):
+        version, _ = self.db.get_data_version()
+        if self._version is None or not self._subscribers:
+            self._version = version
+            return
+        if version == self._version:
+            return
+        summary = self.db.get_change_summary(self._version)
+        self._version = summary['version']
+        self._send_all(format_event(summary))
+        self._stats['events_sent'] += 1
+
+    def _add(self, subscriber, since):
+        head = STREAM_HEAD if isinstance(subscriber, _SocketSubscriber) else b''
+        data = head + f'retry: {EVENTS_RETRY_MS}\n\n'.encode('ascii')
+        if since is not None and since != self._version:
+            # Catch up from the version the device saw. A write landing
+            # meanwhile is sent again by the next broadcast: events are idempotent
+            data += format_event(self.db.get_change_summary(since))
+        if isinstance(subscriber, _SocketSubscriber):
+            self._selector.register(subscriber.sock, selectors.EVENT_READ, subscriber)
+        self._subscribers.add(subscriber)
+        self._deliver(subscriber, data)
+
+    def _send_all(self, data):
+        self._last_sent = time.monotonic()
+        for subscriber in list(self._subscribers):
+            self._deliver(subscriber, data)
+
+    def _deliver(self, subscriber, data):
+        if not subscriber.send(data):
+            self._drop(subscriber)
+            return
+        if isinstance(subscriber, _SocketSubscriber):
+            # Watch for writability only while something is left to write
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.backlog else 0)
+            self._selector.modify(subscriber.sock, events, subscriber)
+
+    def _drop(self, subscriber):
+        if subscriber not in self._subscribers:
+            return
+        self._subscribers.discard(subscriber)
+        if isinstance(subscriber, _SocketSubscriber):
+            self._selector.unregister(subscriber.sock)
+            self._stats['subscribers_dropped'] += 1
+        subscriber.close()
+
+    # ============== STATS ==============
+
+    def stats(self):
+        """Subscribers of this process and events sent"""
+        stats = dict(self._stats)
+        stats['subscribers'] = len(self._subscribers)
+        stats['version'] = self._version
+        return stats
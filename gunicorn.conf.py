@@ -0,0 +1,47 @@
+"""
+Gunicorn configuration for Recipe Book (production)
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden with the environment variables below.
+`kill -HUP <master pid>` (systemctl reload) starts workers with the new
+code and lets the old ones finish their requests: restarts without downtime.
+"""
+
+import os
+import multiprocessing
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Worker processes, each serving WEB_THREADS requests at a time.
+# SQLite allows one writer at a time, so a few processes with threads
+# beat many single-threaded ones.
+workers = int(os.environ.get('WEB_WORKERS', min(multiprocessing.cpu_count(), 2)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Threaded workers that stop accepting at once on shutdown (see gunicorn_worker.py)
+worker_class = 'gunicorn_worker.GracefulThreadWorker'
+
+# Each worker imports the app after the fork (own Database pools and
+# background threads); this is also what lets a HUP load new code
+preload_app = False
+
+# Keep connections open between the many small API calls of a page
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+timeout = 60
+graceful_timeout = 30
+
+# Worker heartbeat files on tmpfs instead of the SD card
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('ACCESS_LOG')
+errorlog = '-'
+
+
+def worker_exit(server, worker):
+    """Write quantity/portion saves still buffered by the exiting worker"""
+    try:
+        from app import write_buffer
+    except Exception:
+        return
+    write_buffer.flush()
@@ -0,0 +1,42 @@
+"""
+Gunicorn worker for Recipe Book
+The stock gthread worker, fixed to drop no requests on reload and
+handing live event streams over to the event hub
+"""
+
+from urllib.parse import parse_qs
+from gunicorn.workers.gthread import ThreadWorker
+from events import EVENTS_PATH, parse_since
+
+
+class GracefulThreadWorker(ThreadWorker):
+    """gthread worker that stops accepting as soon as it is told to exit.
+
+    The stock worker keeps its listeners in the poller until select()
+    returns (up to a second), accepts connections meanwhile and then closes
+    them unanswered: on every reload each old worker dropped a request.
+
+    GET /api/events never reaches the app: the connection is passed to
+    the event hub (events.py), which streams to all subscribers from one
+    thread. Streamed through the app, each idle device would hold one of
+    the WEB_THREADS request threads for as long as it stays open.
+    """
+
+    def handle_request(self, req, conn):
+        hub = getattr(self.wsgi, 'extensions', {}).get('event_hub')
+        if hub is None or self.cfg.is_ssl or req.method != 'GET' or req.path != EVENTS_PATH:
+            return super().handle_request(req, conn)
+        headers = dict(req.headers)
+        since = parse_qs(req.query).get('since', [None])[0]
+        self.nr += 1
+        # The hub keeps a copy of the socket; returning False closes ours
+        hub.attach(conn.sock.dup(), parse_since(headers.get('LAST-EVENT-ID'), since))
+        return False
+
+    def handle_exit(self, sig, frame):
+        super().handle_exit(sig, frame)
+        for sock in self.sockets:
+            try:
+                self.poller.unregister(sock)
+            except (KeyError, ValueError):
+                pass
@@ -0,0 +1,141 @@
+"""
+Background jobs for Recipe Book
+Runs backup imports off the request thread and keeps track of their progress
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import threading
+from archive import iter_import_records
+from background import pid_alive
+
+# Finished jobs kept around for the progress endpoint
+MAX_FINISHED_JOBS = 10
+
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ImportJobs:
+    """Imports uploaded backup files in a background thread, one at a time.
+
+    The upload is saved to a temporary file by the request; the job reads
+    it incrementally and feeds Database.import_records, which commits in
+    batches. Progress (bytes read, recipes imported) is kept in a small
+    JSON file per job, so any worker process can report it.
+    """
+
+    def __init__(self, db, photos, state_dir=None):
+        self.db = db
+        self.photos = photos
+        self.state_dir = state_dir or os.path.join(photos.upload_folder, '.jobs')
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    # ============== STATE ==============
+
+    def _path(self, job_id):
+        return os.path.join(self.state_dir, f'{job_id}.json')
+
+    def _save(self, job):
+        tmp_path = self._path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job['id']))
+
+    def _load_all(self):
+        jobs = []
+        for name in os.listdir(self.state_dir):
+            if name.endswith('.json'):
+                job = self.get(name[:-len('.json')])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _is_running(self, job):
+        # A job whose process died (e.g. a restart mid-import) is not running
+        return job['status'] == 'running' and pid_alive(job['pid'])
+
+    def running(self):
+        return any(self._is_running(job) for job in self._load_all())
+
+    def get(self, job_id):
+        if not JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job['status'] == 'running' and not self._is_running(job):
+            job['status'] = 'error'
+            job['error'] = 'Importazione interrotta'
+        total = job['bytes_total']
+        job['progress'] = 1.0 if job['status'] == 'done' else (
+            min(job['bytes_read'] / total, 1.0) if total else 0.0)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self._load_all() if job['status'] != 'running']
+        finished.sort(key=lambda job: job['started_at'])
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            os.remove(self._path(job['id']))
+
+    # ============== RUNNING ==============
+
+    def start(self, path, fmt):
+        """Import the file at `path` (deleted afterwards), returns the job status.
+
+        Returns None if another import is still running.
+        """
+        job = {
+            'id': uuid.uuid4().hex,
+            'pid': os.getpid(),
+            'status': 'running',
+            'format': fmt,
+            'bytes_total': os.path.getsize(path),
+            'bytes_read': 0,
+            'recipes_imported': 0,
+            'photos_restored': 0,
+            'error': None,
+            'started_at': time.time(),
+            'finished_at': None
+        }
+        # The lock makes check-and-start atomic across worker processes
+        with open(os.path.join(self.state_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.running():
+                return None
+            self._prune()
+            self._save(job)
+        # Not a daemon thread: on shutdown the import finishes its batches
+        threading.Thread(target=self._run, args=(job, path), name='import').start()
+        return self.get(job['id'])
+
+    def _run(self, job, path):
+        restored = []
+        try:
+            with open(path, 'rb') as raw:
+                records = iter_import_records(raw, job['format'], self.photos.upload_folder, restored)
+
+                def progress(done):
+                    job.update(recipes_imported=done, bytes_read=raw.tell(),
+                               photos_restored=len(restored))
+                    self._save(job)
+
+                self.db.import_records(records, progress=progress)
+            for filename in restored:
+                self.photos.submit(filename)
+            job.update(status='done', bytes_read=job['bytes_total'])
+        except Exception as e:
+            print(f"Import error: {e}")
+            job.update(status='error', error=str(e))
+        finally:
+            job.update(finished_at=time.time(), photos_restored=len(restored))
+            self._save(job)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
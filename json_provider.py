@@ -0,0 +1,86 @@
+"""
+JSON encoding for Recipe Book
+Flask JSON provider backed by orjson when it is installed, plus the
+dumps/loads used by the export stream; both serialize sqlite3.Row as is
+"""
+
+import json
+import time
+import sqlite3
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    # Optional: without it the standard library json module is used
+    orjson = None
+
+
+def _default(value):
+    """Encode what JSON has no type for: rows as objects, the rest like Flask does"""
+    if isinstance(value, sqlite3.Row):
+        return dict(value)
+    return DefaultJSONProvider.default(value)
+
+
+def _orjson_options(sort_keys=False, indent=False):
+    # Non-string keys and datetimes behave as with the standard library provider
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return option
+
+
+def dumps(value):
+    """Compact JSON text with non-ASCII characters kept as they are"""
+    if orjson:
+        return orjson.dumps(value, default=_default, option=_orjson_options()).decode('utf-8')
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(text):
+    return orjson.loads(text) if orjson else json.loads(text)
+
+
+class RecipeJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (jsonify, request.json, |tojson) using orjson if available.
+
+    Keeps the default provider's settings (sort_keys, compact), so the
+    output only differs in insignificant whitespace and in non-ASCII
+    characters being sent as UTF-8 instead of \\u escapes. Query results
+    can be returned as sqlite3.Row lists without a dict copy; the large
+    lists (recipes, categories, units) go one step further and are built
+    as dicts straight from the tuples at fetch time (database._fetch_dicts).
+
+    on_encode, if set, is called with the seconds spent encoding each
+    JSON response (used by the request timing metrics).
+    """
+
+    default = staticmethod(_default)
+    on_encode = None
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = _orjson_options(kwargs.get('sort_keys', self.sort_keys), kwargs.get('indent'))
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            if orjson is None:
+                return super().response(*args, **kwargs)
+            obj = self._prepare_response_obj(args, kwargs)
+            indent = (self.compact is None and self._app.debug) or self.compact is False
+            body = orjson.dumps(obj, default=self.default, option=_orjson_options(self.sort_keys, indent))
+            return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+        finally:
+            if self.on_encode:
+                self.on_encode(time.perf_counter() - start)
@@ -0,0 +1,244 @@
+"""
+Metrics for Recipe Book
+Per-request timing (Server-Timing header), SQL query counters with a
+slow-query log, and route latency histograms in Prometheus text format
+"""
+
+import os
+import json
+import time
+import bisect
+import hashlib
+import tempfile
+import threading
+from background import pid_alive
+
+# Queries slower than this (milliseconds) are logged with their query plan; 0 disables the log
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+
+# Folder where every worker process publishes its counters, merged by /metrics
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+# Histogram buckets (seconds)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Seconds between two publications of a worker's counters
+PUBLISH_INTERVAL = 1.0
+
+PREFIX = 'recipe_book'
+
+DESCRIPTIONS = {
+    'requests_total': ('counter', 'HTTP requests by route, method and status'),
+    'request_duration_seconds': ('histogram', 'Time to build the response, by route'),
+    'request_db_seconds_total': ('counter', 'Time spent in SQLite while serving requests, by route'),
+    'db_queries_total': ('counter', 'SQL statements executed, by kind'),
+    'db_query_duration_seconds': ('histogram', 'SQL statement time (execute and fetch), by kind'),
+    'db_slow_queries_total': ('counter', 'SQL statements slower than SLOW_QUERY_MS'),
+}
+
+
+def default_metrics_dir(db_path):
+    """A tmpfs folder per database, so two instances on one machine do not mix"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    digest = hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(base, f'recipe-book-metrics-{digest}')
+
+
+def _labels(labels):
+    return ','.join(f'{key}="{value}"' for key, value in labels)
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters and histograms of one process, plus the timing of the current request.
+
+    Each worker process keeps its own values and publishes them as JSON
+    in `state_dir` at most once per PUBLISH_INTERVAL; render() merges
+    the files of all live workers, so a scrape sees the whole server
+    whichever worker answers it.
+    """
+
+    def __init__(self, state_dir, slow_query_ms=SLOW_QUERY_MS):
+        self.state_dir = state_dir
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._local = threading.local()
+        self._published_at = 0.0
+        os.makedirs(self.state_dir, exist_ok=True)
+
+    # ============== RECORDING ==============
+
+    def _inc(self, name, labels, value=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, labels, buckets, seconds):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                 'sum': 0.0, 'count': 0}
+        i = bisect.bisect_left(buckets, seconds)
+        if i < len(buckets):
+            histogram['counts'][i] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+    def query(self, kind, seconds):
+        """Record a finished SQL statement; True if it was slow enough to log"""
+        with self._lock:
+            labels = (('kind', kind),)
+            self._inc('db_queries_total', labels)
+            self._observe('db_query_duration_seconds', labels, QUERY_BUCKETS, seconds)
+            slow = self.slow_query_ms > 0 and seconds * 1000 >= self.slow_query_ms
+            if slow:
+                self._inc('db_slow_queries_total', ())
+        timing = getattr(self._local, 'timing', None)
+        if timing is not None:
+            timing['db'] = timing.get('db', 0.0) + seconds
+            timing['queries'] += 1
+        return slow
+
+    # ============== REQUESTS ==============
+
+    def start_request(self):
+        self._local.timing = {'start': time.perf_counter(), 'queries': 0}
+
+    def add_time(self, name, seconds):
+        """Add to a named part (e.g. 'json') of the current request's Server-Timing"""
+        timing = getattr(self._local, 'timing', None)
+        if timing is not None:
+            timing[name] = timing.get(name, 0.0) + seconds
+
+    def finish_request(self, method, route, status):
+        """Record the current request, returns its Server-Timing header value (or None)"""
+        timing = getattr(self._local, 'timing', None)
+        if timing is None:
+            return None
+        self._local.timing = None
+        total = time.perf_counter() - timing.pop('start')
+        queries = timing.pop('queries')
+        with self._lock:
+            self._inc('requests_total', (('method', method), ('route', route), ('status', str(status))))
+            self._observe('request_duration_seconds', (('method', method), ('route', route)),
+                          REQUEST_BUCKETS, total)
+            if 'db' in timing:
+                self._inc('request_db_seconds_total', (('method', method), ('route', route)), timing['db'])
+        self._maybe_publish()
+
+        parts = []
+        for name, seconds in timing.items():
+            part = f'{name};dur={seconds * 1000:.2f}'
+            if name == 'db':
+                part += f';desc="{queries} queries"'
+            parts.append(part)
+        parts.append(f'total;dur={total * 1000:.2f}')
+        return ', '.join(parts)
+
+    # ============== EXPORT ==============
+
+    def _snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self._histograms.items()]
+            }
+
+    def _maybe_publish(self):
+        now = time.monotonic()
+        if now - self._published_at >= PUBLISH_INTERVAL:
+            self._published_at = now
+            self.publish()
+
+    def publish(self):
+        """Write this process's values for the other workers' /metrics"""
+        path = os.path.join(self.state_dir, f'{os.getpid()}.json')
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Metrics publish error: {e}")
+
+    def _collect(self):
+        """Snapshots of every live worker (this one current, the others as last published)"""
+        snapshots = [self._snapshot()]
+        for name in os.listdir(self.state_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                pid = int(name[:-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            path = os.path.join(self.state_dir, name)
+            if not pid_alive(pid):
+                # Its counters go with it (Prometheus sees a counter reset)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self, extra=()):
+        """All workers' metrics in Prometheus text format.
+
+        `extra` adds (name, type, help, value) samples computed on the spot.
+        """
+        counters, histograms = {}, {}
+        for snapshot in self._collect():
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, h in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged = histograms.setdefault(key, {'buckets': h['buckets'], 'counts': [0] * len(h['counts']),
+                                                     'sum': 0.0, 'count': 0})
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+                merged['sum'] += h['sum']
+                merged['count'] += h['count']
+
+        lines = []
+        for metric, (kind, description) in DESCRIPTIONS.items():
+            full_name = f'{PREFIX}_{metric}'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            if kind == 'counter':
+                for (name, labels), value in sorted(counters.items()):
+                    if name == metric:
+                        lines.append(f'{full_name}{{{_labels(labels)}}} {_format(value)}' if labels
+                                     else f'{full_name} {_format(value)}')
+                continue
+            for (name, labels), h in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(h['buckets'], h['counts']):
+                    cumulative += count
+                    bucket_labels = _labels(labels + (('le', repr(float(bound))),))
+                    lines.append(f'{full_name}_bucket{{{bucket_labels}}} {cumulative}')
+                lines.append(f'{full_name}_bucket{{{_labels(labels + (("le", "+Inf"),))}}} {h["count"]}')
+                lines.append(f'{full_name}_sum{{{_labels(labels)}}} {_format(h["sum"])}')
+                lines.append(f'{full_name}_count{{{_labels(labels)}}} {h["count"]}')
+
+        for name, kind, description, value in extra:
+            full_name = f'{PREFIX}_{name}'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} {kind}')
+            lines.append(f'{full_name} {_format(value)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,230 @@
+"""
+Photo storage and processing for Recipe Book
+Stores uploads under their content hash, resizes them into thumbnails and
+WebP variants in the background and removes photos no recipe uses
+"""
+
+import os
+import re
+import time
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from background import PerProcess
+
+# Nominal widths of the generated variants; 96 covers the 48px sidebar thumbnail at 2x
+PHOTO_WIDTHS = (96, 320, 800, 1600)
+
+# Background threads resizing new uploads (Pillow releases the GIL while resizing)
+PHOTO_WORKERS = int(os.environ.get('PHOTO_WORKERS', 2))
+
+# Subfolder of the upload folder holding the variants
+VARIANTS_DIR = 'sizes'
+
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+# Uploads are named after the first HASH_LENGTH hex digits of their SHA-256
+HASH_LENGTH = 32
+CONTENT_NAME = re.compile(rf'^[0-9a-f]{{{HASH_LENGTH}}}\.[a-z0-9]+$')
+
+# Unreferenced photos younger than this (seconds) survive garbage collection:
+# an upload is only referenced once the recipe form is saved
+PHOTO_GC_GRACE = int(os.environ.get('PHOTO_GC_GRACE', 24 * 3600))
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def is_content_addressed(filename):
+    """True for upload names derived from the file content (safe to cache forever)"""
+    return bool(CONTENT_NAME.match(filename))
+
+
+def photo_filename(url):
+    """Upload filename referenced by a recipe photo_url, or None for other URLs"""
+    if not url or not url.startswith('/uploads/'):
+        return None
+    filename = url[len('/uploads/'):].split('?', 1)[0]
+    if not filename or '/' in filename or '\\' in filename or filename.startswith('.'):
+        return None
+    return filename
+
+
+def variant_name(filename, width, fmt):
+    """Name of a variant file, e.g. 'photo.jpg' -> 'photo-320.webp'"""
+    stem = os.path.splitext(filename)[0]
+    return f'{stem}-{width}.{fmt}'
+
+
+class PhotoProcessor:
+    """Stores uploaded photos and generates and looks up their resized variants.
+
+    Uploads are stored once per content: the same image uploaded twice
+    gets the same name, so recipes share the file. Each photo gets one
+    JPEG and one WebP file per width in PHOTO_WIDTHS, auto-rotated
+    according to its EXIF orientation and saved without metadata.
+    Widths above the original size are not upscaled: the first one at
+    or above the original width holds the photo at its own size, larger
+    ones are skipped. Until the variants exist the original is served.
+    """
+
+    def __init__(self, upload_folder, workers=PHOTO_WORKERS):
+        self.upload_folder = upload_folder
+        self.variants_folder = os.path.join(upload_folder, VARIANTS_DIR)
+        self.workers = workers
+        self._executor = PerProcess(lambda: ThreadPoolExecutor(max_workers=self.workers,
+                                                               thread_name_prefix='photos'))
+        os.makedirs(self.variants_folder, exist_ok=True)
+
+    # ============== STORAGE ==============
+
+    def store(self, stream, ext):
+        """Save an uploaded stream under its content hash.
+
+        Returns (filename, created); created is False if the same content
+        was already stored, in which case nothing new is written.
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.upload_folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+            filename = f'{digest.hexdigest()[:HASH_LENGTH]}.{ext}'
+            path = os.path.join(self.upload_folder, filename)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                # Restart the garbage collection grace period of the re-upload
+                os.utime(path)
+                return filename, False
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+            return filename, True
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # ============== PROCESSING ==============
+
+    def submit(self, filename):
+        """Queue a photo for processing and return immediately"""
+        return self._executor.get().submit(self._process_logged, filename)
+
+    def _process_logged(self, filename):
+        try:
+            return self.process(filename)
+        except Exception as e:
+            print(f"Photo processing error ({filename}): {e}")
+            return 0
+
+    def process(self, filename):
+        """Write all variants of an uploaded photo, returns the number of files written"""
+        path = os.path.join(self.upload_folder, filename)
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+            written = 0
+            for width in PHOTO_WIDTHS:
+                variant = img
+                if img.width > width:
+                    height = max(1, round(img.height * width / img.width))
+                    variant = img.resize((width, height), Image.LANCZOS)
+
+                variant.save(self._variant_path(filename, width, 'webp'), 'WEBP',
+                             quality=WEBP_QUALITY, method=4)
+                # JPEG fallback for browsers without WebP: flatten transparency on white
+                if variant.mode == 'RGBA':
+                    flat = Image.new('RGB', variant.size, (255, 255, 255))
+                    flat.paste(variant, mask=variant.getchannel('A'))
+                    variant = flat
+                variant.save(self._variant_path(filename, width, 'jpg'), 'JPEG',
+                             quality=JPEG_QUALITY, optimize=True, progressive=True)
+                written += 2
+
+                if img.width <= width:
+                    break
+        return written
+
+    def _variant_path(self, filename, width, fmt):
+        return os.path.join(self.variants_folder, variant_name(filename, width, fmt))
+
+    def has_variants(self, filename):
+        return os.path.exists(self._variant_path(filename, PHOTO_WIDTHS[0], 'jpg'))
+
+    def backfill(self, force=False):
+        """Process uploads that have no variants yet, returns (photos, files written)"""
+        photos = files = 0
+        for entry in sorted(os.scandir(self.upload_folder), key=lambda e: e.name):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            if not force and self.has_variants(entry.name):
+                continue
+            files += self._process_logged(entry.name)
+            photos += 1
+        return photos, files
+
+    # ============== GARBAGE COLLECTION ==============
+
+    def collect_garbage(self, refcounts, grace=PHOTO_GC_GRACE, dry_run=False):
+        """Delete uploads that no recipe references, with their variants.
+
+        refcounts maps photo URLs to the number of recipes using them (see
+        Database.get_photo_refcounts). Files modified less than `grace`
+        seconds ago are kept; older interrupted uploads are removed too.
+        Returns a report of what was (or, with dry_run, would be) removed.
+        """
+        referenced = {photo_filename(url) for url, count in refcounts.items() if count > 0}
+        cutoff = time.time() - grace
+        report = {'referenced': 0, 'kept_recent': 0, 'files_deleted': 0, 'bytes_freed': 0}
+
+        def remove(entry):
+            report['files_deleted'] += 1
+            report['bytes_freed'] += entry.stat().st_size
+            if not dry_run:
+                os.remove(entry.path)
+
+        kept = set()
+        for entry in os.scandir(self.upload_folder):
+            if not entry.is_file():
+                continue
+            if entry.name.startswith('.') and not entry.name.startswith('.upload-'):
+                continue
+            if entry.name in referenced:
+                report['referenced'] += 1
+            elif entry.stat().st_mtime > cutoff:
+                report['kept_recent'] += 1
+            else:
+                remove(entry)
+                continue
+            kept.add(os.path.splitext(entry.name)[0])
+
+        # Variants are named '<stem>-<width>.<fmt>' after their original
+        for entry in os.scandir(self.variants_folder):
+            if entry.is_file() and entry.name.rsplit('-', 1)[0] not in kept:
+                remove(entry)
+        return report
+
+    # ============== LOOKUP ==============
+
+    def find_variant(self, filename, width, webp=False):
+        """Name (relative to the upload folder) of the best variant for a display width.
+
+        Picks the smallest existing variant at least `width` pixels wide, or
+        the largest one if none is. Returns None if the photo has no
+        variants yet.
+        """
+        fmt = 'webp' if webp else 'jpg'
+        best = None
+        for nominal in PHOTO_WIDTHS:
+            name = variant_name(filename, nominal, fmt)
+            if not os.path.exists(os.path.join(self.variants_folder, name)):
+                break
+            best = name
+            if nominal >= width:
+                break
+        return f'{VARIANTS_DIR}/{best}' if best else None
@@ -7,12 +7,25 @@
 // State Management
 // ============================================
 
+// Sidebar pagination: only the fields the list renders, one page at a time
+const RECIPE_PAGE_SIZE = 50;
+const RECIPE_LIST_FIELDS = 'id,name,category_id,category_name,photo_url';
+// Widths of the resized photo variants (keep in sync with PHOTO_WIDTHS in photos.py)
+const PHOTO_WIDTHS = [96, 320, 800, 1600];
+
 const state = {
     recipes: [],
+    recipesCursor: null,
+    recipesHasMore: true,
+    recipesLoading: false,
+    recipesGeneration: 0,
+    searchResults: null,
     categories: [],
     units: [],
     settings: {},
     currentRecipeId: null,
+    // The recipe shown, as loaded (live updates compare against it)
+    currentRecipe: null,
     isEditing: false,
     editingRecipeId: null
 };
@@ -88,28 +101,65 @@ const elements = {
 // ============================================
 
 document.addEventListener('DOMContentLoaded', async () => {
-    await loadSettings();
+    registerServiceWorker();
+    // Start from the offline copy when there is one (see offline.js)
+    const local = await offlineStore.open() ? await offlineStore.load() : null;
+    applyBootstrap(local || await loadBootstrap());
     applySettings();
-    await loadCategories();
-    await loadUnits();
-    await loadRecipes();
     setupEventListeners();
+    // Load more recipes if the first page does not fill the sidebar
+    handleRecipeListScroll();
+    
+    // Then bring it up to date (the first time: download everything),
+    // and again whenever the app comes back to the foreground or online
+    syncOfflineCopy();
+    document.addEventListener('visibilitychange', () => {
+        if (!document.hidden) syncOfflineCopy();
+    });
+    window.addEventListener('online', syncOfflineCopy);
+    
+    // Changes made on other devices arrive as they happen
+    connectEvents();
 });
 
 // ============================================
 // API Functions
 // ============================================
 
+// Last GET response per URL with its ETag: the server answers 304 when
+// nothing changed, so repeated loads cost a header round-trip only
+const responseCache = new Map();
+const RESPONSE_CACHE_SIZE = 100;
+
 async function apiCall(url, options = {}) {
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const cached = isGet ? responseCache.get(url) : null;
+    
     try {
         const response = await fetch(url, {
+            cache: 'no-store',
+            ...options,
             headers: {
                 'Content-Type': 'application/json',
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
                 ...options.headers
-            },
-            ...options
+            }
         });
-        return await response.json();
+        
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (isGet && response.ok && etag) {
+            responseCache.delete(url);
+            responseCache.set(url, { etag, data });
+            if (responseCache.size > RESPONSE_CACHE_SIZE) {
+                responseCache.delete(responseCache.keys().next().value);
+            }
+        }
+        return data;
     } catch (error) {
         console.error('API Error:', error);
         showToast('Errore di connessione', 'error');
@@ -117,26 +167,276 @@ async function apiCall(url, options = {}) {
     }
 }
 
-async function loadSettings() {
-    state.settings = await apiCall('/api/settings');
+// Settings, categories, units and the first recipe page in one payload:
+// inlined in the page by the server, or fetched if missing
+async function loadBootstrap() {
+    const inline = document.getElementById('bootstrapData');
+    if (inline) {
+        try {
+            return JSON.parse(inline.textContent);
+        } catch (error) {
+            console.error('Invalid bootstrap data:', error);
+        }
+    }
+    return await apiCall('/api/bootstrap');
 }
 
-async function loadCategories() {
-    state.categories = await apiCall('/api/categories');
+function applyBootstrap(data) {
+    state.settings = data.settings;
+    
+    state.categories = data.categories;
     renderCategoryFilter();
     renderCategorySelect();
+    
+    state.units = data.units;
+    
+    state.recipes = data.recipes.recipes;
+    state.recipesCursor = data.recipes.next_cursor;
+    state.recipesHasMore = data.recipes.next_cursor !== null;
+    renderRecipeList();
+}
+
+// Pull the server's changes into the offline copy and patch the page with them
+async function syncOfflineCopy() {
+    const changes = await offlineStore.sync();
+    if (changes) {
+        applyOfflineChanges(changes);
+    }
 }
 
-async function loadUnits() {
-    state.units = await apiCall('/api/units');
+function applyOfflineChanges(changes) {
+    if (changes.settings) {
+        state.settings = changes.settings;
+        applySettings();
+    }
+    if (changes.categories) {
+        state.categories = changes.categories;
+        const selected = elements.categoryFilter.value;
+        renderCategoryFilter();
+        renderCategorySelect();
+        elements.categoryFilter.value = selected;
+    }
+    if (changes.units) {
+        state.units = changes.units;
+    }
+    
+    // The local list is complete: drop any server page still loading
+    state.recipesGeneration++;
+    state.recipes = offlineStore.listRecipes(elements.categoryFilter.value);
+    state.recipesHasMore = false;
+    state.recipesLoading = false;
+    if (state.searchResults === null) {
+        renderRecipeList();
+    }
+    
+    // The open recipe changed on another device (or on the server after our own save)
+    const id = state.currentRecipeId;
+    if (!id || state.isEditing) return;
+    if (changes.deleted.includes(id)) {
+        state.currentRecipeId = null;
+        elements.recipeView.classList.add('hidden');
+        elements.welcomeScreen.classList.remove('hidden');
+        elements.mobileTitle.textContent = 'Ricettario';
+    } else if (changes.reset || changes.recipes.some(recipe => recipe.id === id)) {
+        const recipe = changes.recipes.find(recipe => recipe.id === id);
+        if (recipe && patchOpenRecipe(recipe.updated_at, recipeQuantities(recipe))) return;
+        // Not while the user is typing a quantity: the next sync catches up
+        if (!elements.recipeView.contains(document.activeElement)) {
+            showRecipe(id);
+        }
+    }
 }
 
+// ============================================
+// Live Updates
+// ============================================
+
+// Server-Sent Events from /api/events: one "change" event per write, with
+// the new data version as its id and the scaled quantities of the recipes
+// it touched. EventSource reconnects by itself, sending the last id seen.
+function connectEvents() {
+    if (!('EventSource' in window)) return;
+    const source = new EventSource(`/api/events?since=${offlineStore.version || ''}`);
+    source.addEventListener('change', event => {
+        handleChangeEvent(JSON.parse(event.data));
+    });
+}
+
+async function handleChangeEvent(change) {
+    // Scaling of the open recipe is patched into the page as it is
+    const open = change.recipes.find(recipe => recipe.id === state.currentRecipeId);
+    const patched = open ? patchOpenRecipe(open.updated_at, open.quantities) : false;
+    
+    if (offlineStore.ready) {
+        // The delta is small: the offline copy fetches and applies it
+        syncOfflineCopy();
+        return;
+    }
+    
+    if (change.reset || change.lookups.length) {
+        const selected = elements.categoryFilter.value;
+        applyBootstrap(await apiCall('/api/bootstrap'));
+        applySettings();
+        elements.categoryFilter.value = selected;
+    }
+    if (change.reset || change.deleted.length || change.recipes.some(recipe => recipe !== open || !patched)) {
+        loadRecipes();
+    }
+    
+    const id = state.currentRecipeId;
+    if (!id || state.isEditing || (open && patched)) return;
+    if (change.deleted.includes(id)) {
+        state.currentRecipeId = null;
+        elements.recipeView.classList.add('hidden');
+        elements.welcomeScreen.classList.remove('hidden');
+        elements.mobileTitle.textContent = 'Ricettario';
+    } else if ((change.reset || open) && !elements.recipeView.contains(document.activeElement)) {
+        showRecipe(id);
+    }
+}
+
+function recipeQuantities(recipe) {
+    const quantities = {};
+    recipe.subsections.forEach(sub => {
+        sub.ingredients.forEach(ing => {
+            quantities[ing.id] = ing.current_quantity;
+        });
+    });
+    return quantities;
+}
+
+// Show new quantities of the open recipe without rendering it again, so
+// the page keeps its scroll position and focus. Only if the recipe itself
+// was not edited (same updated_at and ingredients): returns false then.
+function patchOpenRecipe(updatedAt, quantities) {
+    const recipe = state.currentRecipe;
+    if (!recipe || state.isEditing || recipe.updated_at !== updatedAt) return false;
+    const inputs = Array.from(elements.ingredientsList.querySelectorAll('.ingredient-qty-input'));
+    if (inputs.length !== Object.keys(quantities).length ||
+            !inputs.every(input => input.dataset.ingredientId in quantities)) {
+        return false;
+    }
+    
+    inputs.forEach(input => {
+        const quantity = quantities[input.dataset.ingredientId];
+        // The field being typed in wins: its own save follows
+        if (input === document.activeElement) return;
+        input.value = quantity !== null ? quantity : '';
+        const original = parseFloat(input.dataset.originalQty) || 0;
+        const originalLabel = input.closest('.ingredient-item').querySelector('.ingredient-original');
+        originalLabel.style.display = original && quantity != original ? '' : 'none';
+    });
+    recipe.subsections.forEach(sub => {
+        sub.ingredients.forEach(ing => {
+            ing.current_quantity = quantities[ing.id];
+        });
+    });
+    if (document.activeElement?.id !== 'portionsInput') {
+        updatePortionsDisplay();
+    }
+    if (document.activeElement?.id !== 'totalWeightInput') {
+        updateTotalWeightDisplay();
+    }
+    return true;
+}
+
+// Reset the sidebar to the first page (for the selected category)
 async function loadRecipes() {
-    state.recipes = await apiCall('/api/recipes');
-    renderRecipeList();
+    if (offlineStore.ready) {
+        // The whole list is local: just make sure it includes our latest save
+        await syncOfflineCopy();
+        state.recipesGeneration++;
+        state.recipes = offlineStore.listRecipes(elements.categoryFilter.value);
+        state.recipesHasMore = false;
+        state.recipesLoading = false;
+        if (elements.searchInput.value.trim()) {
+            await handleSearchInput();
+        } else {
+            renderRecipeList();
+        }
+        return;
+    }
+    
+    state.recipes = [];
+    state.recipesCursor = null;
+    state.recipesHasMore = true;
+    state.recipesLoading = false;
+    state.recipesGeneration++;
+    
+    await loadMoreRecipes();
+    if (elements.searchInput.value.trim()) {
+        await handleSearchInput();
+    }
 }
 
+async function loadMoreRecipes() {
+    if (state.recipesLoading || !state.recipesHasMore) return;
+    
+    const generation = state.recipesGeneration;
+    const params = new URLSearchParams({ limit: RECIPE_PAGE_SIZE, fields: RECIPE_LIST_FIELDS });
+    const categoryId = elements.categoryFilter.value;
+    if (categoryId) {
+        params.set('category_id', categoryId);
+    }
+    if (state.recipesCursor) {
+        params.set('cursor', state.recipesCursor);
+    }
+    
+    state.recipesLoading = true;
+    let page;
+    try {
+        page = await apiCall(`/api/recipes?${params}`);
+    } finally {
+        if (generation === state.recipesGeneration) {
+            state.recipesLoading = false;
+        }
+    }
+    
+    // The list was reset (e.g. category changed) while this page was loading
+    if (generation !== state.recipesGeneration) return;
+    
+    state.recipes = state.recipes.concat(page.recipes);
+    state.recipesCursor = page.next_cursor;
+    state.recipesHasMore = page.next_cursor !== null;
+    
+    if (state.searchResults === null) {
+        renderRecipeList();
+        // Keep loading while the list does not fill the sidebar yet
+        if (elements.recipeList.scrollHeight <= elements.recipeList.clientHeight) {
+            await loadMoreRecipes();
+        }
+    }
+}
+
+function handleRecipeListScroll() {
+    if (state.searchResults !== null) return;
+    const list = elements.recipeList;
+    if (list.scrollTop + list.clientHeight >= list.scrollHeight - 200) {
+        loadMoreRecipes();
+    }
+}
+
+async function searchRecipes(query, categoryId) {
+    const params = new URLSearchParams({ q: query });
+    if (categoryId) {
+        params.set('category_id', categoryId);
+    }
+    try {
+        return await apiCall(`/api/recipes/search?${params}`);
+    } catch (error) {
+        if (!offlineStore.ready) throw error;
+        return await offlineStore.searchRecipes(query, categoryId);
+    }
+}
+
+// From the offline copy when it has the recipe (a background sync then
+// re-renders it if it changed), otherwise from the server
 async function loadRecipe(id) {
+    const local = offlineStore.ready ? await offlineStore.getRecipe(id) : undefined;
+    if (local) {
+        syncOfflineCopy();
+        return local;
+    }
     return await apiCall(`/api/recipes/${id}`);
 }
 
@@ -167,10 +467,12 @@ async function updateQuantities(recipeId, ingredients) {
     });
 }
 
-async function updatePortions(recipeId, currentPortions) {
-    return await apiCall(`/api/recipes/${recipeId}/portions`, {
-        method: 'PUT',
-        body: JSON.stringify({ current_portions: currentPortions })
+// Scale all quantities and the portions server-side in one request
+// mode: 'factor' | 'portions' | 'total_weight' | 'anchor' (with ingredientId)
+async function scaleRecipe(recipeId, mode, value, ingredientId = null) {
+    return await apiCall(`/api/recipes/${recipeId}/scale`, {
+        method: 'POST',
+        body: JSON.stringify({ mode, value, ingredient_id: ingredientId })
     });
 }
 
@@ -210,8 +512,9 @@ function setupEventListeners() {
     });
     
     // Search and filter
-    elements.searchInput.addEventListener('input', renderRecipeList);
-    elements.categoryFilter.addEventListener('change', renderRecipeList);
+    elements.searchInput.addEventListener('input', debounce(handleSearchInput, 200));
+    elements.categoryFilter.addEventListener('change', loadRecipes);
+    elements.recipeList.addEventListener('scroll', handleRecipeListScroll);
     
     // Add recipe buttons
     elements.addRecipeBtn.addEventListener('click', showNewRecipeForm);
@@ -279,16 +582,30 @@ function renderCategorySelect() {
     });
 }
 
-function renderRecipeList() {
-    const searchTerm = elements.searchInput.value.toLowerCase();
+// Run the full-text search on the server; an empty query shows the whole list
+async function handleSearchInput() {
+    const query = elements.searchInput.value.trim();
     const categoryId = elements.categoryFilter.value;
     
-    const filtered = state.recipes.filter(recipe => {
-        const matchesSearch = recipe.name.toLowerCase().includes(searchTerm) ||
-                            (recipe.description && recipe.description.toLowerCase().includes(searchTerm));
-        const matchesCategory = !categoryId || recipe.category_id == categoryId;
-        return matchesSearch && matchesCategory;
-    });
+    if (!query) {
+        state.searchResults = null;
+        renderRecipeList();
+        return;
+    }
+    
+    const results = await searchRecipes(query, categoryId);
+    
+    // Drop responses for a query the user has already changed
+    if (elements.searchInput.value.trim() !== query || elements.categoryFilter.value !== categoryId) {
+        return;
+    }
+    state.searchResults = results;
+    renderRecipeList();
+}
+
+function renderRecipeList() {
+    // The server already filtered both lists by the selected category
+    const filtered = state.searchResults !== null ? state.searchResults : state.recipes;
     
     if (filtered.length === 0) {
         elements.recipeList.innerHTML = `
@@ -303,7 +620,7 @@ function renderRecipeList() {
         <div class="recipe-list-item ${recipe.id === state.currentRecipeId ? 'active' : ''}" 
              data-id="${recipe.id}">
             ${recipe.photo_url 
-                ? `<img src="${recipe.photo_url}" alt="" class="recipe-list-thumb">`
+                ? `<img src="${photoSize(recipe.photo_url, 96)}" alt="" class="recipe-list-thumb" loading="lazy">`
                 : `<div class="recipe-list-thumb-placeholder">
                     <svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="1.5">
                         <rect x="3" y="3" width="18" height="18" rx="2" ry="2"></rect>
@@ -315,6 +632,7 @@ function renderRecipeList() {
             <div class="recipe-list-info">
                 <div class="recipe-list-name">${escapeHtml(recipe.name)}</div>
                 <div class="recipe-list-category">${recipe.category_name || 'Senza categoria'}</div>
+                ${recipe.snippet ? `<div class="recipe-list-snippet">${recipe.snippet}</div>` : ''}
             </div>
         </div>
     `).join('');
@@ -335,6 +653,7 @@ async function showRecipe(id) {
     
     const recipe = await loadRecipe(id);
     if (!recipe) return;
+    state.currentRecipe = recipe;
     
     // Update mobile title
     elements.mobileTitle.textContent = recipe.name;
@@ -346,7 +665,8 @@ async function showRecipe(id) {
     
     // Photo
     if (recipe.photo_url) {
-        elements.recipePhoto.src = recipe.photo_url;
+        elements.recipePhoto.srcset = photoSrcset(recipe.photo_url);
+        elements.recipePhoto.src = photoSize(recipe.photo_url, 800);
         elements.recipePhoto.classList.remove('hidden');
         elements.recipePhotoPlaceholder.classList.add('hidden');
     } else {
@@ -566,7 +886,6 @@ async function handlePortionsChange(e) {
     
     // Update all ingredients proportionally based on original quantities
     const allInputs = elements.ingredientsList.querySelectorAll('.ingredient-qty-input');
-    const updates = [];
     
     allInputs.forEach(inp => {
         const origQty = parseFloat(inp.dataset.originalQty);
@@ -575,11 +894,6 @@ async function handlePortionsChange(e) {
             const newQty = Math.round(origQty * scaleFactor * 100) / 100;
             inp.value = newQty;
             
-            updates.push({
-                id: parseInt(inp.dataset.ingredientId),
-                current_quantity: newQty
-            });
-            
             // Update "original" display
             const ingItem = inp.closest('.ingredient-item');
             const originalSpan = ingItem.querySelector('.ingredient-original');
@@ -596,10 +910,7 @@ async function handlePortionsChange(e) {
     updateTotalWeightDisplay();
     
     // Save to database
-    if (updates.length > 0) {
-        await updateQuantities(state.currentRecipeId, updates);
-    }
-    await updatePortions(state.currentRecipeId, newPortions);
+    await scaleRecipe(state.currentRecipeId, 'portions', newPortions);
 }
 
 // Handle total weight change - scale all ingredients proportionally
@@ -630,8 +941,6 @@ async function handleTotalWeightChange(e) {
     console.log(`Total weight scaling: ${currentTotalWeight} -> ${newTotalWeight}, factor: ${scaleFactor}`);
     
     // Update all ingredients proportionally
-    const updates = [];
-    
     allInputs.forEach(inp => {
         const currentQty = parseFloat(inp.value) || 0;
         const origQty = parseFloat(inp.dataset.originalQty) || 0;
@@ -640,11 +949,6 @@ async function handleTotalWeightChange(e) {
             const newQty = Math.round(currentQty * scaleFactor * 100) / 100;
             inp.value = newQty;
             
-            updates.push({
-                id: parseInt(inp.dataset.ingredientId),
-                current_quantity: newQty
-            });
-            
             // Update "original" display
             const ingItem = inp.closest('.ingredient-item');
             const originalSpan = ingItem.querySelector('.ingredient-original');
@@ -667,19 +971,11 @@ async function handleTotalWeightChange(e) {
         }
     }
     
-    // Save to database
-    if (updates.length > 0) {
-        await updateQuantities(state.currentRecipeId, updates);
-    }
-    
     // Update portions display
     updatePortionsDisplay();
     
-    // Save updated portions
-    const portionsInput = document.getElementById('portionsInput');
-    if (portionsInput) {
-        await updatePortions(state.currentRecipeId, parseFloat(portionsInput.value));
-    }
+    // Save to database
+    await scaleRecipe(state.currentRecipeId, 'total_weight', newTotalWeight);
 }
 
 // Debounce helper to prevent too many API calls
@@ -729,7 +1025,6 @@ async function handleQuantityChange(e) {
     
     // Update all ingredients proportionally
     const allInputs = elements.ingredientsList.querySelectorAll('.ingredient-qty-input');
-    const updates = [];
     
     allInputs.forEach(inp => {
         const origQty = parseFloat(inp.dataset.originalQty);
@@ -738,11 +1033,6 @@ async function handleQuantityChange(e) {
             const newQty = Math.round(origQty * scaleFactor * 100) / 100;
             inp.value = newQty;
             
-            updates.push({
-                id: parseInt(inp.dataset.ingredientId),
-                current_quantity: newQty
-            });
-            
             // Update "original" display
             const ingItem = inp.closest('.ingredient-item');
             const originalSpan = ingItem.querySelector('.ingredient-original');
@@ -764,15 +1054,7 @@ async function handleQuantityChange(e) {
     updatePortionsDisplay();
     
     // Save to database
-    if (updates.length > 0) {
-        await updateQuantities(state.currentRecipeId, updates);
-    }
-    
-    // Save updated portions
-    const portionsInput = document.getElementById('portionsInput');
-    if (portionsInput) {
-        await updatePortions(state.currentRecipeId, parseFloat(portionsInput.value));
-    }
+    await scaleRecipe(state.currentRecipeId, 'anchor', newQuantity, ingredientId);
 }
 
 // Update portions display after ingredient changes
@@ -899,16 +1181,17 @@ async function showEditRecipeForm(id) {
     elements.subsectionsContainer.innerHTML = '';
     recipe.subsections.forEach(sub => {
         addSubsection(sub.name, sub.ingredients.map(ing => ({
+            id: ing.id,
             name: ing.name,
             quantity: ing.original_quantity,
             unit: ing.unit
-        })));
+        })), sub.id);
     });
     
     // Steps
     elements.stepsContainer.innerHTML = '';
     recipe.steps.forEach(step => {
-        addStep(step.description);
+        addStep(step.description, step.id);
     });
     
     // Show form
@@ -935,9 +1218,11 @@ async function handleFormSubmit(e) {
         steps: []
     };
     
-    // Gather subsections
+    // Gather subsections (existing rows keep their id so the server can
+    // update them in place instead of rewriting the whole recipe)
     elements.subsectionsContainer.querySelectorAll('.subsection-card').forEach(card => {
         const subsection = {
+            id: rowId(card),
             name: card.querySelector('.subsection-name-input').value.trim(),
             ingredients: []
         };
@@ -946,6 +1231,7 @@ async function handleFormSubmit(e) {
             const name = row.querySelector('.ingredient-name-input').value.trim();
             if (name) {
                 subsection.ingredients.push({
+                    id: rowId(row),
                     name: name,
                     quantity: parseFloat(row.querySelector('.ingredient-qty-edit').value) || null,
                     unit: row.querySelector('.ingredient-unit-select').value
@@ -959,10 +1245,10 @@ async function handleFormSubmit(e) {
     });
     
     // Gather steps
-    elements.stepsContainer.querySelectorAll('.step-edit-row textarea').forEach(textarea => {
-        const description = textarea.value.trim();
+    elements.stepsContainer.querySelectorAll('.step-edit-row').forEach(row => {
+        const description = row.querySelector('textarea').value.trim();
         if (description) {
-            data.steps.push({ description });
+            data.steps.push({ id: rowId(row), description });
         }
     });
     
@@ -1047,14 +1333,22 @@ function removePhoto() {
 // Dynamic Form Elements
 // ============================================
 
-function addSubsection(nameOrEvent = '', ingredients = []) {
+function rowId(el) {
+    return el.dataset.id ? parseInt(el.dataset.id) : null;
+}
+
+function dataIdAttr(id) {
+    return id ? `data-id="${parseInt(id)}"` : '';
+}
+
+function addSubsection(nameOrEvent = '', ingredients = [], id = null) {
     // Handle case when called from button click (event passed as first arg)
     const name = (typeof nameOrEvent === 'string') ? nameOrEvent : '';
     const ings = (typeof nameOrEvent === 'string') ? ingredients : [];
     
     const index = elements.subsectionsContainer.children.length;
     const subsectionHtml = `
-        <div class="subsection-card">
+        <div class="subsection-card" ${dataIdAttr(id)}>
             <div class="subsection-header">
                 <input type="text" 
                        class="subsection-name-input" 
@@ -1098,7 +1392,7 @@ function createIngredientRow(ingredient = {}) {
     ).join('');
     
     return `
-        <div class="ingredient-edit-row">
+        <div class="ingredient-edit-row" ${dataIdAttr(ingredient.id)}>
             <input type="text" 
                    class="ingredient-name-input" 
                    placeholder="Nome ingrediente"
@@ -1136,13 +1430,13 @@ function removeIngredient(btn) {
     }
 }
 
-function addStep(descriptionOrEvent = '') {
+function addStep(descriptionOrEvent = '', id = null) {
     // Handle case when called from button click (event passed as first arg)
     const description = (typeof descriptionOrEvent === 'string') ? descriptionOrEvent : '';
     
     const index = elements.stepsContainer.children.length + 1;
     const stepHtml = `
-        <div class="step-edit-row">
+        <div class="step-edit-row" ${dataIdAttr(id)}>
             <span class="step-edit-number">${index}</span>
             <textarea placeholder="Descrivi questo passaggio..." rows="3">${escapeHtml(description)}</textarea>
             <button type="button" class="btn-remove" onclick="removeStep(this)">
@@ -1194,6 +1488,18 @@ function formatDate(dateStr) {
     }
 }
 
+// Resized variant of an uploaded photo (the server picks the closest size
+// and serves WebP when the browser supports it)
+function photoSize(url, width) {
+    if (!url || !url.startsWith('/uploads/')) return url;
+    return `${url}?w=${width}`;
+}
+
+function photoSrcset(url) {
+    if (!url || !url.startsWith('/uploads/')) return '';
+    return PHOTO_WIDTHS.map(w => `${photoSize(url, w)} ${w}w`).join(', ');
+}
+
 function escapeHtml(text) {
     if (!text) return '';
     const div = document.createElement('div');
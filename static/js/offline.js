@@ -0,0 +1,181 @@
+/**
+ * Recipe Book - Offline copy
+ * Keeps every recipe, the categories, units and settings in IndexedDB,
+ * brought up to date with deltas from /api/changes, so the app starts
+ * from local data and keeps working when the server is out of reach.
+ * Loaded before app.js; the page itself is cached by the service worker (sw.js).
+ */
+
+const OFFLINE_DB_NAME = 'ricettario';
+const OFFLINE_DB_VERSION = 1;
+// Fields of the sidebar list, taken from the stored recipes (same as RECIPE_LIST_FIELDS)
+const OFFLINE_LIST_FIELDS = ['id', 'name', 'category_id', 'category_name', 'photo_url'];
+
+function registerServiceWorker() {
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    }
+}
+
+// Promise wrapper for an IndexedDB request or transaction
+function idbDone(target) {
+    return new Promise((resolve, reject) => {
+        if (target instanceof IDBTransaction) {
+            target.oncomplete = () => resolve();
+            target.onabort = target.onerror = () => reject(target.error);
+        } else {
+            target.onsuccess = () => resolve(target.result);
+            target.onerror = () => reject(target.error);
+        }
+    });
+}
+
+// Same order as the server's list (ORDER BY name, id: plain code point comparison)
+function compareRecipes(a, b) {
+    if (a.name !== b.name) return a.name < b.name ? -1 : 1;
+    return a.id - b.id;
+}
+
+function recipeSummary(recipe) {
+    const summary = {};
+    OFFLINE_LIST_FIELDS.forEach(field => {
+        summary[field] = recipe[field] ?? null;
+    });
+    return summary;
+}
+
+const offlineStore = {
+    db: null,
+    // Data version of the local copy (0 = never synced)
+    version: 0,
+    // Sidebar summaries of every stored recipe, kept in memory and sorted
+    summaries: [],
+    // True once the local copy holds a complete sync
+    ready: false,
+    syncing: null,
+
+    async open() {
+        if (!('indexedDB' in window)) return false;
+        try {
+            const request = indexedDB.open(OFFLINE_DB_NAME, OFFLINE_DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('recipes', { keyPath: 'id' });
+                db.createObjectStore('meta');
+            };
+            this.db = await idbDone(request);
+        } catch (error) {
+            // Private browsing modes may refuse storage: run online only
+            console.error('IndexedDB unavailable:', error);
+            return false;
+        }
+        return true;
+    },
+
+    // Settings, categories, units and the whole recipe list in the shape of
+    // /api/bootstrap, or null if nothing was synced yet
+    async load() {
+        if (!this.db) return null;
+        const tx = this.db.transaction('meta');
+        const meta = tx.objectStore('meta');
+        const [version, settings, categories, units, summaries] = await Promise.all(
+            ['version', 'settings', 'categories', 'units', 'summaries'].map(key => idbDone(meta.get(key))));
+        if (!version) return null;
+
+        this.version = version;
+        this.summaries = summaries || [];
+        this.ready = true;
+        return {
+            settings,
+            categories,
+            units,
+            recipes: { recipes: this.listRecipes(), next_cursor: null }
+        };
+    },
+
+    listRecipes(categoryId = '') {
+        if (!categoryId) return this.summaries.slice();
+        return this.summaries.filter(recipe => String(recipe.category_id) === String(categoryId));
+    },
+
+    // Offline fallback of the server search: name and ingredient substrings
+    async searchRecipes(query, categoryId = '') {
+        const needle = query.toLowerCase();
+        const tx = this.db.transaction('recipes');
+        const recipes = await idbDone(tx.objectStore('recipes').getAll());
+        return recipes
+            .filter(recipe => !categoryId || String(recipe.category_id) === String(categoryId))
+            .filter(recipe => recipe.name.toLowerCase().includes(needle) || recipe.subsections.some(
+                sub => sub.ingredients.some(ing => ing.name.toLowerCase().includes(needle))))
+            .sort(compareRecipes)
+            .map(recipeSummary);
+    },
+
+    async getRecipe(id) {
+        if (!this.db) return undefined;
+        const tx = this.db.transaction('recipes');
+        return await idbDone(tx.objectStore('recipes').get(id));
+    },
+
+    // Fetch and store what changed since the last sync. Resolves to the
+    // delta (null if nothing changed or the server is unreachable); calls
+    // made while a sync is running share it.
+    sync() {
+        if (!this.db) return Promise.resolve(null);
+        if (!this.syncing) {
+            this.syncing = this.fetchChanges().finally(() => {
+                this.syncing = null;
+            });
+        }
+        return this.syncing;
+    },
+
+    async fetchChanges() {
+        let changes;
+        try {
+            const response = await fetch(`/api/changes?since=${this.version}`, { cache: 'no-store' });
+            if (!response.ok) return null;
+            changes = await response.json();
+        } catch (error) {
+            // Offline: keep using the local copy
+            return null;
+        }
+        if (changes.version === this.version && !changes.reset) return null;
+        await this.apply(changes);
+        return changes;
+    },
+
+    async apply(changes) {
+        const tx = this.db.transaction(['recipes', 'meta'], 'readwrite');
+        const recipes = tx.objectStore('recipes');
+        const meta = tx.objectStore('meta');
+
+        const byId = new Map(changes.reset ? [] : this.summaries.map(recipe => [recipe.id, recipe]));
+        if (changes.reset) {
+            recipes.clear();
+        }
+        changes.recipes.forEach(recipe => {
+            recipes.put(recipe);
+            byId.set(recipe.id, recipeSummary(recipe));
+        });
+        changes.deleted.forEach(id => {
+            recipes.delete(id);
+            byId.delete(id);
+        });
+        const summaries = Array.from(byId.values()).sort(compareRecipes);
+
+        ['settings', 'categories', 'units'].forEach(key => {
+            if (key in changes) meta.put(changes[key], key);
+        });
+        meta.put(summaries, 'summaries');
+        meta.put(changes.version, 'version');
+        await idbDone(tx);
+
+        // Only once the transaction committed, so memory never runs ahead of disk
+        this.summaries = summaries;
+        this.version = changes.version;
+        this.ready = true;
+    }
+};
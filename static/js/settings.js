@@ -28,6 +28,7 @@ const elements = {
     newCategoryName: document.getElementById('newCategoryName'),
     addCategoryBtn: document.getElementById('addCategoryBtn'),
     exportBtn: document.getElementById('exportBtn'),
+    exportFormat: document.getElementById('exportFormat'),
     importBtn: document.getElementById('importBtn'),
     importInput: document.getElementById('importInput'),
     toastContainer: document.getElementById('toastContainer')
@@ -50,16 +51,43 @@ document.addEventListener('DOMContentLoaded', async () => {
 // API Functions
 // ============================================
 
+// Last GET response per URL with its ETag: the server answers 304 when
+// nothing changed, so repeated loads cost a header round-trip only
+const responseCache = new Map();
+const RESPONSE_CACHE_SIZE = 100;
+
+// Milliseconds between progress checks of a background import
+const IMPORT_POLL_INTERVAL = 500;
+
 async function apiCall(url, options = {}) {
+    const isGet = !options.method || options.method.toUpperCase() === 'GET';
+    const cached = isGet ? responseCache.get(url) : null;
+    
     try {
         const response = await fetch(url, {
+            cache: 'no-store',
+            ...options,
             headers: {
                 'Content-Type': 'application/json',
+                ...(cached ? { 'If-None-Match': cached.etag } : {}),
                 ...options.headers
-            },
-            ...options
+            }
         });
-        return await response.json();
+        
+        if (response.status === 304 && cached) {
+            return cached.data;
+        }
+        
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (isGet && response.ok && etag) {
+            responseCache.delete(url);
+            responseCache.set(url, { etag, data });
+            if (responseCache.size > RESPONSE_CACHE_SIZE) {
+                responseCache.delete(responseCache.keys().next().value);
+            }
+        }
+        return data;
     } catch (error) {
         console.error('API Error:', error);
         showToast('Errore di connessione', 'error');
@@ -297,52 +325,56 @@ async function deleteCategory(id) {
 // Import/Export
 // ============================================
 
-async function exportData() {
-    try {
-        const data = await apiCall('/api/export');
-        const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
-        const url = URL.createObjectURL(blob);
-        
-        const a = document.createElement('a');
-        a.href = url;
-        a.download = `ricettario_backup_${new Date().toISOString().split('T')[0]}.json`;
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
-        URL.revokeObjectURL(url);
-        
-        showToast('Esportazione completata', 'success');
-    } catch (error) {
-        showToast('Errore durante l\'esportazione', 'error');
-    }
+function exportData() {
+    // Let the browser download the streamed response straight to disk
+    const format = elements.exportFormat.value;
+    const a = document.createElement('a');
+    a.href = `/api/export?format=${encodeURIComponent(format)}`;
+    a.download = `ricettario_backup_${new Date().toISOString().split('T')[0]}.${format}`;
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+    
+    showToast('Esportazione avviata', 'success');
 }
 
 async function importData(e) {
     const file = e.target.files[0];
     if (!file) return;
     
+    // The file is uploaded as is and imported by a background job on the server
+    const formData = new FormData();
+    formData.append('file', file);
+    
     try {
-        const text = await file.text();
-        const data = JSON.parse(text);
+        const response = await fetch('/api/import', { method: 'POST', body: formData });
+        let job = await response.json();
         
-        const result = await apiCall('/api/import', {
-            method: 'POST',
-            body: JSON.stringify(data)
-        });
+        if (response.ok) {
+            elements.importBtn.disabled = true;
+            while (job.status === 'running') {
+                elements.importBtn.lastChild.textContent = ` ${Math.round(job.progress * 100)}%`;
+                await new Promise(resolve => setTimeout(resolve, IMPORT_POLL_INTERVAL));
+                job = await apiCall(`/api/import/${job.id}`);
+            }
+        }
         
-        if (result.message) {
+        if (job.status === 'done') {
             // Reload data
             await loadSettings();
             await loadUnits();
             await loadCategories();
             applySettings();
             renderUI();
-            showToast('Importazione completata', 'success');
+            showToast(`Importazione completata (${job.recipes_imported} ricette)`, 'success');
         } else {
-            showToast(result.error || 'Errore durante l\'importazione', 'error');
+            showToast(job.error || 'Errore durante l\'importazione', 'error');
         }
     } catch (error) {
         showToast('File non valido', 'error');
+    } finally {
+        elements.importBtn.disabled = false;
+        elements.importBtn.lastChild.textContent = ' Importa';
     }
     
     // Reset input
@@ -0,0 +1,120 @@
+/**
+ * Recipe Book - Service Worker
+ * Caches the page shell, CSS/JS and photos so the app opens without the
+ * server; recipe data comes from the offline copy in IndexedDB (offline.js).
+ * Served as /sw.js by app.py so that it controls the whole site.
+ */
+
+// Bump when this file changes the cached layout: older caches are deleted
+const SHELL_CACHE = 'ricettario-shell-v1';
+const PHOTO_CACHE = 'ricettario-photos-v2';
+const CACHES = [SHELL_CACHE, PHOTO_CACHE];
+
+// Pages cached at install time, with the CSS/JS they reference
+const SHELL_PAGES = ['/', '/settings'];
+// Photos kept for offline use, oldest dropped first
+const PHOTO_CACHE_LIMIT = 300;
+
+self.addEventListener('install', event => {
+    event.waitUntil(precacheShell().then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names.filter(name => !CACHES.includes(name)).map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    // API calls go to the network untouched: offline.js handles data
+    if (url.origin !== self.location.origin || url.pathname.startsWith('/api/') || url.pathname === '/metrics') {
+        return;
+    }
+
+    if (request.mode === 'navigate') {
+        event.respondWith(networkFirst(request));
+    } else if (url.pathname.startsWith('/assets/')) {
+        // Content-hashed names never change content
+        event.respondWith(cacheFirst(request, SHELL_CACHE));
+    } else if (url.pathname.startsWith('/uploads/')) {
+        // Only photos the server marks immutable: a resize request answered
+        // with the original must be asked again once the variants exist
+        event.respondWith(cacheFirst(request, PHOTO_CACHE, PHOTO_CACHE_LIMIT, isImmutable));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(staleWhileRevalidate(request));
+    }
+});
+
+async function precacheShell() {
+    const cache = await caches.open(SHELL_CACHE);
+    for (const page of SHELL_PAGES) {
+        try {
+            const response = await fetch(page, { cache: 'no-store' });
+            if (!response.ok) continue;
+            const html = await response.clone().text();
+            await cache.put(page, response);
+            // The hashed CSS/JS of this release
+            const urls = Array.from(html.matchAll(/(?:href|src)="(\/(?:assets|static)\/[^"]+)"/g), match => match[1]);
+            await cache.addAll(Array.from(new Set(urls)));
+        } catch (error) {
+            // Installed anyway: pages are cached as they are visited
+            console.error('Precache failed:', page, error);
+        }
+    }
+}
+
+// Pages: fresh from the server when reachable, the last copy otherwise
+async function networkFirst(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request, { ignoreSearch: true }) || await cache.match('/');
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+function isImmutable(response) {
+    return /\bimmutable\b/.test(response.headers.get('Cache-Control') || '');
+}
+
+async function cacheFirst(request, cacheName, limit = 0, cacheable = () => true) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok && cacheable(response)) {
+        await cache.put(request, response.clone());
+        if (limit) {
+            const keys = await cache.keys();
+            await Promise.all(keys.slice(0, Math.max(0, keys.length - limit)).map(key => cache.delete(key)));
+        }
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    const cached = await cache.match(request);
+    const update = fetch(request).then(response => {
+        if (response.ok) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    });
+    if (cached) {
+        update.catch(() => {});
+        return cached;
+    }
+    return update;
+}
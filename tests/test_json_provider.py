@@ -0,0 +1,40 @@
+"""
+sqlite3.Row values encode as JSON objects, with orjson and without it
+"""
+
+import sqlite3
+
+import pytest
+from flask import Flask
+
+import json_provider
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def encoder(request, monkeypatch):
+    if request.param == 'orjson' and json_provider.orjson is None:
+        pytest.skip('orjson is not installed')
+    if request.param == 'json':
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    return request.param
+
+
+@pytest.fixture
+def rows():
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    yield conn.execute("SELECT 1 AS id, 'Crostata' AS name, NULL AS photo_url").fetchall()
+    conn.close()
+
+
+def test_dumps_encodes_rows(encoder, rows):
+    assert json_provider.loads(json_provider.dumps(rows)) == [
+        {'id': 1, 'name': 'Crostata', 'photo_url': None}]
+
+
+def test_jsonify_encodes_rows(encoder, rows):
+    app = Flask(__name__)
+    app.json = json_provider.RecipeJSONProvider(app)
+    with app.app_context():
+        response = app.json.response({'recipes': rows})
+    assert response.get_json() == {'recipes': [{'id': 1, 'name': 'Crostata', 'photo_url': None}]}
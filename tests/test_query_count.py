@@ -0,0 +1,83 @@
+"""
+Loading recipe trees runs a fixed number of queries, however many recipes,
+subsections, ingredients and steps there are (see Database._attach_details);
+an export adds the same few queries per batch of EXPORT_BATCH_SIZE recipes
+"""
+
+import math
+
+import pytest
+
+import database
+from benchmarks.corpus import fill
+from cache import VersionedCache
+
+# The largest spans several export batches
+CORPUS_SIZES = (2, 20, 2 * database.EXPORT_BATCH_SIZE + 50)
+
+# Export queries outside the recipe batches: BEGIN, categories, units,
+# settings, the empty batch that ends the loop and COMMIT
+EXPORT_FIXED_QUERIES = 6
+# Recipes of the batch, then subsections, ingredients and steps
+EXPORT_BATCH_QUERIES = 4
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    """Statements run by every Database connection (connection PRAGMAs left out)"""
+    statements = []
+    connect = database.ConnectionPool._connect
+
+    def traced_connect(pool):
+        conn = connect(pool)
+        conn.set_trace_callback(lambda sql: sql.lstrip().startswith('PRAGMA') or statements.append(sql))
+        return conn
+
+    monkeypatch.setattr(database.ConnectionPool, '_connect', traced_connect)
+    return statements
+
+
+@pytest.fixture(scope='module')
+def corpus_dbs(tmp_path_factory):
+    """A database per corpus size, filled once for the module"""
+    paths = {}
+    for size in CORPUS_SIZES:
+        paths[size] = str(tmp_path_factory.mktemp('corpus') / f'{size}.db')
+        db = database.Database(paths[size])
+        fill(db, size)
+        db.close()
+    return paths
+
+
+def count_queries(path, traced, call):
+    db = database.Database(path)
+    # Every call must reach the database
+    db.cache = VersionedCache(maxsize=0)
+    traced.clear()
+    result = call(db)
+    count = len(traced)
+    db.close()
+    return result, count
+
+
+@pytest.mark.parametrize('call', [
+    lambda db: db.get_recipe(1),
+    lambda db: db.get_all_recipes(),
+], ids=['get_recipe', 'get_all_recipes'])
+def test_query_count_does_not_grow_with_recipes(corpus_dbs, traced, call):
+    counts = {}
+    for size in CORPUS_SIZES:
+        result, counts[size] = count_queries(corpus_dbs[size], traced, call)
+        assert result and counts[size] > 0
+    assert len(set(counts.values())) == 1, counts
+
+
+@pytest.mark.parametrize('size', CORPUS_SIZES)
+def test_export_queries_grow_per_batch(corpus_dbs, traced, size):
+    data, count = count_queries(corpus_dbs[size], traced, lambda db: db.export_all_data())
+    batches = math.ceil(size / database.EXPORT_BATCH_SIZE)
+    assert count == EXPORT_FIXED_QUERIES + EXPORT_BATCH_QUERIES * batches
+
+    assert len(data['recipes']) == size
+    assert all(recipe['subsections'] and recipe['steps'] for recipe in data['recipes'])
+    assert all(sub['ingredients'] for recipe in data['recipes'] for sub in recipe['subsections'])
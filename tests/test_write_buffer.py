@@ -0,0 +1,101 @@
+"""
+Values queued by the write buffer of one worker process are seen, flushed
+and dropped by the others (gunicorn runs several, see gunicorn.conf.py)
+"""
+
+import atexit
+import multiprocessing
+
+import pytest
+
+from benchmarks.corpus import fill
+from database import Database
+from write_buffer import WriteBuffer
+
+# Longer than any test: only explicit flushes write
+NO_AUTO_FLUSH = 3600
+
+
+def in_worker(db_path, action, *args):
+    """Run action(write_buffer, *args) in another process with its own Database and buffer"""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=_worker_main, args=(db_path, action, args, results))
+    process.start()
+    result = results.get(timeout=30)
+    process.join(timeout=30)
+    assert process.exitcode == 0
+    return result
+
+
+def _worker_main(db_path, action, args, results):
+    db = Database(db_path)
+    buffer = WriteBuffer(db, interval=NO_AUTO_FLUSH)
+    # Like a worker that keeps running: nothing is flushed on the way out
+    atexit.unregister(buffer._flush_logged)
+    results.put(getattr(buffer, action)(*args))
+
+
+@pytest.fixture
+def worker(tmp_path):
+    """Database and write buffer of this process (the other worker is in_worker)"""
+    db_path = str(tmp_path / 'recipes.db')
+    db = Database(db_path)
+    fill(db, 3)
+    yield db_path, db, WriteBuffer(db, interval=NO_AUTO_FLUSH)
+    db.close()
+
+
+def first_ingredient(recipe):
+    return recipe['subsections'][0]['ingredients'][0]
+
+
+def test_reader_flushes_values_queued_by_another_worker(worker):
+    db_path, db, buffer = worker
+    ingredient = first_ingredient(db.get_recipe(1))
+    version = db.get_data_version()[0]
+
+    assert in_worker(db_path, 'add_quantities', 1, [{'id': ingredient['id'], 'current_quantity': 1234}])
+    assert in_worker(db_path, 'set_portions', 1, 7)
+    assert buffer.stats()['pending_recipes'] == 1
+
+    assert buffer.flush(1) == 2
+    recipe = db.get_recipe(1)
+    assert first_ingredient(recipe)['current_quantity'] == 1234
+    assert recipe['current_portions'] == 7
+    # A single new version, so the ETag changes with the data
+    assert db.get_data_version()[0] == version + 1
+
+
+def test_edit_is_not_reverted_by_another_worker(worker):
+    db_path, db, buffer = worker
+    recipe = db.get_recipe(2)
+    ingredient = first_ingredient(recipe)
+    assert in_worker(db_path, 'add_quantities', 2, [{'id': ingredient['id'], 'current_quantity': 999}])
+
+    # PUT /api/recipes/2 on this worker
+    buffer.flush(2)
+    ingredient['current_quantity'] = ingredient['original_quantity']
+    assert db.update_recipe(2, recipe)
+
+    assert in_worker(db_path, 'flush') == 0
+    assert first_ingredient(db.get_recipe(2))['current_quantity'] == ingredient['original_quantity']
+
+
+def test_delete_drops_values_queued_by_another_worker(worker):
+    db_path, db, buffer = worker
+    ingredient = first_ingredient(db.get_recipe(3))
+    assert in_worker(db_path, 'add_quantities', 3, [{'id': ingredient['id'], 'current_quantity': 5}])
+    assert in_worker(db_path, 'set_portions', 3, 2)
+
+    assert db.delete_recipe(3)
+    assert buffer.stats()['pending_recipes'] == 0
+    assert in_worker(db_path, 'flush') == 0
+
+
+def test_unknown_recipe_is_not_queued(worker):
+    db_path, db, buffer = worker
+    assert not buffer.set_portions(999, 4)
+    assert not in_worker(db_path, 'add_quantities', 999, [{'id': 1, 'current_quantity': 5}])
+    assert buffer.scale(999, 'factor', 2) is None
+    assert buffer.stats()['pending_recipes'] == 0
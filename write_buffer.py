@@ -0,0 +1,145 @@
+"""
+Write-behind buffer for Recipe Book
+Coalesces frequent quantity/portion saves and scaling, and flushes them in batches
+"""
+
+import os
+import time
+import atexit
+import threading
+from background import PerProcess, start_thread
+
+# Seconds between background flushes; 0 disables buffering (write-through)
+WRITE_BUFFER_INTERVAL = float(os.environ.get('WRITE_BUFFER_INTERVAL', 0.5))
+
+
+class WriteBuffer:
+    """Buffer for current quantities and portions, last write wins.
+
+    While someone types into a quantity field every pause sends a save, and
+    several devices may be doing so at once. Instead of a recipe update per
+    request (a new data version, a change event to every device and cache
+    evictions in every worker), values are queued per ingredient and recipe
+    (a newer value replaces the older one) and written in a single
+    transaction every `interval` seconds, when a reader needs them, or at
+    shutdown. Scaling a whole recipe is computed at once and queued the
+    same way.
+
+    The queue lives in the database (Database.queue_writes), not in this
+    object: with several worker processes, a flush in any of them writes
+    what all of them received, and deleting a recipe drops its queued rows.
+    """
+
+    def __init__(self, db, interval=WRITE_BUFFER_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._worker = PerProcess(lambda: start_thread(self._run, 'write-buffer'))
+        self._closed = False
+        self._stats = {
+            'writes_received': 0,
+            'scales_received': 0,
+            'rows_written': 0,
+            'flushes': 0,
+            'flush_ms_total': 0.0,
+            'flush_ms_max': 0.0,
+            'last_flush_ms': 0.0
+        }
+        atexit.register(self._flush_logged)
+
+    # ============== BUFFERING ==============
+
+    def add_quantities(self, recipe_id, ingredients):
+        """Queue current quantities ([{'id', 'current_quantity'}]) for a recipe.
+
+        Returns False if the recipe does not exist.
+        """
+        quantities = {ing.get('id'): ing.get('current_quantity') for ing in ingredients}
+        if not self.db.queue_writes(recipe_id, quantities=quantities):
+            return False
+        self._queued(len(ingredients))
+        return True
+
+    def set_portions(self, recipe_id, current_portions):
+        """Queue the current portions of a recipe; False if it does not exist"""
+        if not self.db.queue_writes(recipe_id, portions=current_portions):
+            return False
+        self._queued(1)
+        return True
+
+    def scale(self, recipe_id, mode, value, ingredient_id=None):
+        """Scale a recipe (see Database.scale_recipe) and queue the result.
+
+        The new quantities are computed now, from the stored ones with the
+        queued values on top, and replace whatever is queued for the
+        recipe. Returns them like scale_recipe, or None if not found.
+        """
+        result = self.db.plan_scale(recipe_id, mode, value, ingredient_id=ingredient_id)
+        if result is None:
+            return None
+        quantities = {ing['id']: ing['current_quantity'] for ing in result['ingredients']}
+        if not self.db.queue_writes(recipe_id, quantities=quantities, portions=result['current_portions']):
+            # Deleted meanwhile
+            return None
+        self._queued(len(result['ingredients']) + 1, scales=1)
+        return result
+
+    def _queued(self, writes, scales=0):
+        with self._lock:
+            self._stats['writes_received'] += writes
+            self._stats['scales_received'] += scales
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._worker.get()
+
+    # ============== FLUSHING ==============
+
+    def flush(self, recipe_id=None):
+        """Write queued values to the database (all recipes, or just one)"""
+        start = time.perf_counter()
+        rows = self.db.apply_pending_writes(recipe_id)
+        if not rows:
+            return 0
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._stats['rows_written'] += rows
+            self._stats['flushes'] += 1
+            self._stats['flush_ms_total'] += elapsed_ms
+            self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed_ms)
+            self._stats['last_flush_ms'] = elapsed_ms
+        return rows
+
+    def close(self):
+        """Flush, then stop flushing in the background and at exit
+        (e.g. before the database file is removed)"""
+        self._closed = True
+        atexit.unregister(self._flush_logged)
+        self.flush()
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Write buffer flush error: {e}")
+
+    def _run(self):
+        while not self._closed:
+            time.sleep(self.interval)
+            if not self._closed:
+                self._flush_logged()
+
+    # ============== STATS ==============
+
+    def stats(self):
+        """Flush latency and coalescing ratio (values received per row written)
+        of this process, and the recipes queued by all processes"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending_recipes'] = self.db.count_pending_recipes()
+        flushes = stats['flushes']
+        stats['flush_ms_avg'] = stats['flush_ms_total'] / flushes if flushes else 0.0
+        rows = stats['rows_written']
+        stats['coalescing_ratio'] = stats['writes_received'] / rows if rows else None
+        return stats